@@ -0,0 +1,114 @@
+"""
+Per operator timings of the python and numpy backends of engine.ops.functions.
+
+Every operator runs on both backends over the bundled data; results are
+checked to be identical (and, for compressed columns, identical to the same
+operator on the plain column) before the timings are reported.
+
+    python bench/bench_backends.py [--repeat 1]
+"""
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from engine.backend import available
+from engine.dataframe import dataframe
+from engine.encoding import compress_frame
+from engine.ops import functions
+
+DATA = os.path.join(BASE_DIR, 'data')
+
+
+def cases(m, r, t):
+    # empty frames: what a filter matching nothing hands to the next step
+    empty = functions('python').take(r, [])
+    # userId run length encoded, as the app keeps it; these cases are also
+    # checked against the same operator on the plain column
+    rc = compress_frame(r, ['userId'])
+    return [
+        ('filter rating >= 4.5', lambda ops: ops.filter(r, ['rating'], ['>='], [4.5])),
+        ('filter user = 414 and movie > 1000', lambda ops: ops.filter(
+            r, ['userId', 'movieId'], ['=', '>'], [414, 1000])),
+        ('order_rows timestamp dsc', lambda ops: ops.order_rows(r, ['timestamp'], type='dsc')),
+        ('order_rows rating dsc limit 100', lambda ops: ops.order_rows(r, ['rating'], type='dsc', limit=100)),
+        ('groupby movieId avg', lambda ops: ops.groupby(r, ['movieId'], ['rating'], 'avg')),
+        ('groupby userId count', lambda ops: ops.groupby(r, ['userId'], ['rating'], 'count')),
+        ('groupby userId, movieId max', lambda ops: ops.groupby(r, ['userId', 'movieId'], ['rating'], 'max')),
+        ('groupby movieId sum timestamp', lambda ops: ops.groupby(r, ['movieId'], ['timestamp'], 'sum')),
+        ('join movies, ratings inner', lambda ops: ops.join(m, r, ['movieId'], how='inner')),
+        ('join tags, movies left', lambda ops: ops.join(t, m, ['movieId'], how='left')),
+        ('join movies, tags full', lambda ops: ops.join(m, t, ['movieId'], how='full')),
+        # what the app runs: each operator reads the previous one's output
+        ('pipeline filter > join > groupby', lambda ops: ops.groupby(
+            ops.join(m, ops.filter(r, ['rating'], ['>='], [4.0]), ['movieId'], how='inner'),
+            ['year'], ['rating'], 'avg')),
+        ('pipeline join > filter > groupby', lambda ops: ops.groupby(
+            ops.filter(ops.join(m, r, ['movieId'], how='inner'), ['year'], ['>='], [2000]),
+            ['userId'], ['rating'], 'count')),
+        ('groupby empty frame avg', lambda ops: ops.groupby(empty, ['movieId'], ['rating'], 'avg')),
+        ('groupby no rows, no columns', lambda ops: ops.groupby({'_all': []}, ['_all'], [None], 'count')),
+        ('filter empty frame', lambda ops: ops.filter(empty, ['rating'], ['>='], [4.5])),
+        ('order_rows empty frame', lambda ops: ops.order_rows(empty, ['rating'], type='dsc')),
+        ('join empty frame, movies', lambda ops: ops.join(empty, m, ['movieId'], how='left')),
+        ('encoded filter userId = 414', lambda ops: ops.filter(rc, ['userId'], ['='], [414]),
+            lambda ops: ops.filter(r, ['userId'], ['='], [414])),
+        ('encoded filter userId in 1, 2', lambda ops: ops.filter(rc, ['userId'], ['in'], [[1, 2]]),
+            lambda ops: ops.filter(r, ['userId'], ['in'], [[1, 2]])),
+        ('encoded filter userId between 10, 12', lambda ops: ops.filter(rc, ['userId'], ['between'], [(10, 12)]),
+            lambda ops: ops.filter(r, ['userId'], ['between'], [(10, 12)])),
+        ('encoded groupby userId count', lambda ops: ops.groupby(rc, ['userId'], ['rating'], 'count'),
+            lambda ops: ops.groupby(r, ['userId'], ['rating'], 'count')),
+    ]
+
+
+def plain(res):
+    if isinstance(res, dict):
+        return {c: list(col) for c, col in res.items()}
+    return res
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = fn()
+        times.append(time.perf_counter() - t)
+    return min(times), res
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    p.add_argument('--repeat', type=int, default=1)
+    args = p.parse_args()
+
+    if 'numpy' not in available():
+        print('numpy is not installed, only the python backend is available')
+        return
+
+    dfc = dataframe()
+    m = dfc.read_frame(os.path.join(DATA, 'movies.csv'), ',')
+    r = dfc.read_frame(os.path.join(DATA, 'ratings.csv'), ',')
+    t = dfc.read_frame(os.path.join(DATA, 'tags.csv'), ',')
+
+    py = functions('python')
+    vec = functions('numpy')
+    failed = False
+    print(f'{"operator":40} {"python":>10} {"numpy":>10} {"speedup":>8}')
+    for name, fn, *ref in cases(m, r, t):
+        tp, rp = best(lambda: fn(py), args.repeat)
+        tn, rn = best(lambda: fn(vec), args.repeat)
+        same = plain(rp) == plain(rn) and all(plain(rp) == plain(f(vec)) for f in ref)
+        failed = failed or not same
+        print(f'{name:40} {tp * 1000:9.1f}ms {tn * 1000:9.1f}ms {tp / tn:7.1f}x'
+              + ('' if same else '  RESULTS DIFFER'))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
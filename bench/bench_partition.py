@@ -0,0 +1,116 @@
+"""
+Partitioned dataset timings against the in-memory operators.
+
+ratings and tags are written as datasets partitioned by movieId hash (and
+ratings by userId range), then filters, groupbys and joins run over the
+partitions, serially and with worker processes. Every result is checked to
+hold the same rows as the in-memory operator before the timings are reported.
+
+    python bench/bench_partition.py [--parts 8] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from engine.dataframe import dataframe
+from engine.ops import functions
+from engine.partition import write_dataset
+
+DATA = os.path.join(BASE_DIR, 'data')
+
+
+def rows(df, cols=None):
+    # result rows as a sorted list, partitioned results come in partition order
+    if not df:
+        return []
+    cols = cols or list(df.keys())
+    return sorted(zip(*[list(df[c]) for c in cols]), key=repr)
+
+
+def groups(df, key, col):
+    return {k: round(v, 9) for k, v in zip(df[key], df[col])}
+
+
+def cases(by_movie, by_user, tags):
+    return [
+        ('filter movieId = 318', ['movieId'], ['='], [318]),
+        ('filter userId between 100, 120', ['userId'], ['between'], [(100, 120)]),
+        ('filter userId < 50 and rating >= 4.5', ['userId', 'rating'], ['<', '>='], [50, 4.5]),
+    ], [
+        ('groupby movieId avg', ['movieId'], 'avg'),
+        ('groupby userId count', ['userId'], 'count'),
+    ], [
+        ('join ratings, tags co-partitioned', by_movie, tags),
+        ('join ratings, tags shuffled', by_user, tags),
+    ]
+
+
+def timed(fn):
+    t = time.perf_counter()
+    res = fn()
+    return time.perf_counter() - t, res
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    p.add_argument('--parts', type=int, default=8)
+    p.add_argument('--workers', type=int, default=4)
+    args = p.parse_args()
+
+    dfc = dataframe()
+    r = dfc.read_frame(os.path.join(DATA, 'ratings.csv'), ',')
+    t = dfc.read_frame(os.path.join(DATA, 'tags.csv'), ',')
+    ops = functions()
+
+    with tempfile.TemporaryDirectory(prefix='cinedash-bench-') as tmp:
+        w, by_movie = timed(lambda: write_dataset(r, os.path.join(tmp, 'r_movie'), 'movieId', 'hash', args.parts))
+        by_user = write_dataset(r, os.path.join(tmp, 'r_user'), 'userId', 'range',
+                                bounds=[610 * k // args.parts for k in range(1, args.parts)])
+        tags = write_dataset(t, os.path.join(tmp, 't_movie'), 'movieId', 'hash', args.parts)
+        print(f'wrote {len(by_movie):,} ratings into {args.parts} partitions in {w:.2f}s')
+
+        filters, groupbys, joins = cases(by_movie, by_user, tags)
+        failed = False
+        print(f'{"operation":42} {"in memory":>10} {"serial":>10} {"workers":>10}  partitions')
+        for name, cols, conds, vals in filters:
+            ds = by_user if cols[0] == 'userId' else by_movie
+            tm, ref = timed(lambda: ops.filter(r, cols, conds, vals))
+            ts, res = timed(lambda: ds.filter(cols, conds, vals, workers=1))
+            tw, resw = timed(lambda: ds.filter(cols, conds, vals, workers=args.workers))
+            same = rows(res) == rows(ref) == rows(resw)
+            failed = failed or not same
+            print(f'{name:42} {tm * 1000:8.1f}ms {ts * 1000:8.1f}ms {tw * 1000:8.1f}ms  '
+                  f'{len(ds.prune(cols, conds, vals))} of {ds.n}' + ('' if same else '  RESULTS DIFFER'))
+
+        for name, gb, agg in groupbys:
+            col = 'rating_' + agg
+            tm, ref = timed(lambda: ops.groupby(r, gb, ['rating'], agg))
+            ts, res = timed(lambda: by_movie.groupby(gb, ['rating'], agg, workers=1))
+            tw, resw = timed(lambda: by_movie.groupby(gb, ['rating'], agg, workers=args.workers))
+            same = groups(res, gb[0], col) == groups(ref, gb[0], col) == groups(resw, gb[0], col)
+            failed = failed or not same
+            print(f'{name:42} {tm * 1000:8.1f}ms {ts * 1000:8.1f}ms {tw * 1000:8.1f}ms  '
+                  f'{args.parts} of {args.parts}' + ('' if same else '  RESULTS DIFFER'))
+
+        for name, left, right in joins:
+            tm, ref = timed(lambda: ops.join(r, t, ['movieId'], how='inner', right_suffix='_tag'))
+            ts, res = timed(lambda: left.join(right, ['movieId'], right_suffix='_tag', workers=1))
+            tw, resw = timed(lambda: left.join(right, ['movieId'], right_suffix='_tag', workers=args.workers))
+            cols = list(ref.keys())
+            same = rows(res, cols) == rows(ref) == rows(resw, cols)
+            failed = failed or not same
+            print(f'{name:42} {tm * 1000:8.1f}ms {ts * 1000:8.1f}ms {tw * 1000:8.1f}ms  '
+                  f'{"no shuffle" if left.co_partitioned(right, "movieId") else "shuffle"}'
+                  + ('' if same else '  RESULTS DIFFER'))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
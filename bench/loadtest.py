@@ -0,0 +1,233 @@
+"""
+Headless load test for the dashboard.
+
+Drives webapp/streamlit_app.py through Streamlit's AppTest from N simulated
+sessions at once, each one a thread with its own AppTest. Every session waits
+for the first render, then keeps changing a random widget (tab controls,
+sliders, Query Builder checkboxes / selectboxes / values, ...) to a random
+valid value and reruns the script. All sessions share the process wide
+st.cache_resource store, like sessions of one server.
+
+Reports first render time, p50/p95/p99 rerun latency, throughput, exceptions
+and peak RSS (this process and the loader worker processes).
+
+    python bench/loadtest.py --sessions 4 --steps 20
+    python bench/loadtest.py --synthetic --movies 2000 --ratings 50000
+
+Runs offline, against the bundled data folder or generated data.
+"""
+import argparse
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(BASE_DIR, 'webapp', 'streamlit_app.py')
+sys.path.insert(0, BASE_DIR)
+
+from engine.multivalue import MOVIELENS_GENRES
+
+# the reload button swaps the shared store for everyone, leave it out
+SKIP_LABELS = ['Reload data']
+TAGS = ['funny', 'classic', 'atmospheric', 'twist ending', 'dark comedy',
+        'sci-fi', 'visually appealing', 'thought-provoking', 'quirky', 'romance']
+
+
+def synthetic_data(path, movies, ratings, users, tags, seed=0):
+    # MovieLens shaped csv files with the same columns and value ranges
+    rnd = random.Random(seed)
+    genres = MOVIELENS_GENRES[:-1]
+
+    with open(os.path.join(path, 'movies.csv'), 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['movieId', 'title', 'genres'])
+        for m in range(1, movies + 1):
+            g = '|'.join(sorted(rnd.sample(genres, rnd.randint(1, 3)), key=genres.index))
+            w.writerow([m, f'Movie {m} ({rnd.randint(1930, 2018)})', g])
+
+    start, end = 828000000, 1537000000
+    with open(os.path.join(path, 'ratings.csv'), 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['userId', 'movieId', 'rating', 'timestamp'])
+        for _ in range(ratings):
+            # a few popular movies get most of the ratings, like the real data
+            m = min(movies, int(rnd.paretovariate(1.2)))
+            w.writerow([rnd.randint(1, users), m, rnd.randint(1, 10) / 2, rnd.randint(start, end)])
+
+    with open(os.path.join(path, 'tags.csv'), 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['userId', 'movieId', 'tag', 'timestamp'])
+        for _ in range(tags):
+            w.writerow([rnd.randint(1, users), rnd.randint(1, movies), rnd.choice(TAGS), rnd.randint(start, end)])
+
+    with open(os.path.join(path, 'links.csv'), 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['movieId', 'imdbId', 'tmdbId'])
+        for m in range(1, movies + 1):
+            w.writerow([m, f'{m:07d}', m + 1000])
+
+
+def widgets(at):
+    out = []
+    for kind in ['slider', 'selectbox', 'multiselect', 'checkbox', 'radio', 'number_input', 'text_input']:
+        for w in getattr(at, kind):
+            if any(s in w.label for s in SKIP_LABELS):
+                continue
+            # e.g. a column picker after a filter that left no columns
+            if kind in ['selectbox', 'multiselect', 'radio'] and not w.options:
+                continue
+            out.append((kind, w))
+    return out
+
+
+def from_app(e):
+    # exceptions raised by the app or the engine, not by AppTest replaying a
+    # widget value the last rerun removed (KeyError on a '$$ID-...' key)
+    if '$$ID-' in e.message:
+        return False
+    return any(BASE_DIR in line for line in e.stack_trace)
+
+
+def random_value(rnd, kind, w):
+    if kind == 'slider':
+        if isinstance(w.value, (tuple, list)):
+            lo, hi = sorted(rnd.uniform(w.min, w.max) for _ in range(2))
+            if isinstance(w.min, int):
+                lo, hi = int(lo), int(hi)
+            return (lo, hi)
+        steps = int((w.max - w.min) / w.step)
+        v = w.min + rnd.randint(0, steps) * w.step
+        return int(v) if isinstance(w.min, int) else round(v, 6)
+    if kind in ['selectbox', 'radio']:
+        return rnd.choice(w.options)
+    if kind == 'multiselect':
+        return rnd.sample(w.options, rnd.randint(0, min(3, len(w.options))))
+    if kind == 'checkbox':
+        return not w.value
+    if kind == 'number_input':
+        return max(1, int(w.value) + rnd.randint(-50, 50))
+    if kind == 'text_input':
+        # Query Builder filter values: numbers for most columns, some text
+        return rnd.choice(['1', '3', '4.5', '100', '1995', '2010', 'Comedy', 'Toy Story', ''])
+
+
+def session(k, steps, seed, stats, lock, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    rnd = random.Random(seed * 1000 + k)
+    first = None
+    lat = []
+    errors = []
+    harness = []
+    try:
+        at = AppTest.from_file(APP, default_timeout=timeout)
+        t = time.perf_counter()
+        at.run()
+        first = time.perf_counter() - t
+        errors.extend(('first run', e.message) for e in at.exception if from_app(e))
+
+        for _ in range(steps):
+            ws = widgets(at)
+            if not ws:
+                break
+            kind, w = rnd.choice(ws)
+            where = f'{kind} {w.label!r}'
+            try:
+                value = random_value(rnd, kind, w)
+                where = f'{where} = {value!r}'
+                t = time.perf_counter()
+                w.set_value(value).run()
+            except Exception as e:  # the harness itself, not the app
+                harness.append((where, repr(e)))
+                continue
+            lat.append(time.perf_counter() - t)
+            for e in at.exception:
+                if from_app(e):
+                    errors.append((where, e.message))
+                else:
+                    harness.append((where, e.message))
+    except Exception as e:
+        harness.append((f'session {k}', repr(e)))
+    finally:
+        with lock:
+            if first is not None:
+                stats['first'].append(first)
+            stats['latency'].extend(lat)
+            stats['errors'].extend(errors)
+            stats['harness'].extend(harness)
+
+
+def percentile(vals, p):
+    if not vals:
+        return 0.0
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(len(vals) * p))]
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    p.add_argument('--sessions', type=int, default=4, help='concurrent sessions')
+    p.add_argument('--steps', type=int, default=20, help='interactions per session')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--timeout', type=float, default=600, help='seconds one rerun may take')
+    p.add_argument('--data', default=None, help='folder with movies/ratings/tags/links csv files')
+    p.add_argument('--synthetic', action='store_true', help='generate the data instead')
+    p.add_argument('--movies', type=int, default=2000)
+    p.add_argument('--ratings', type=int, default=50000)
+    p.add_argument('--users', type=int, default=500)
+    p.add_argument('--tags', type=int, default=3000)
+    args = p.parse_args()
+
+    tmp = None
+    if args.synthetic:
+        tmp = tempfile.TemporaryDirectory(prefix='cinedash-load-')
+        synthetic_data(tmp.name, args.movies, args.ratings, args.users, args.tags, args.seed)
+        args.data = tmp.name
+    if args.data:
+        # read by the app when it is imported, so set before the first session
+        os.environ['CINEDASH_DATA_DIR'] = os.path.abspath(args.data)
+    print(f'data: {os.environ.get("CINEDASH_DATA_DIR", os.path.join(BASE_DIR, "data"))}')
+
+    stats = {'first': [], 'latency': [], 'errors': [], 'harness': []}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=session, args=(k, args.steps, args.seed, stats, lock, args.timeout))
+        for k in range(args.sessions)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    lat = stats['latency']
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f'sessions {args.sessions}, reruns {len(lat)}, wall {elapsed:.1f}s')
+    print(f'first render  max {max(stats["first"], default=0.0):.2f}s  p50 {percentile(stats["first"], 0.5):.2f}s')
+    print(f'rerun latency p50 {percentile(lat, 0.5) * 1000:.0f}ms  '
+          f'p95 {percentile(lat, 0.95) * 1000:.0f}ms  p99 {percentile(lat, 0.99) * 1000:.0f}ms')
+    print(f'throughput    {len(lat) / elapsed:.2f} reruns/s')
+    print(f'peak RSS      {own:.0f} MB (app), {workers:.0f} MB (largest loader worker)')
+    print(f'exceptions    {len(stats["errors"])}')
+    for where, msg in stats['errors'][:20]:
+        print(f'  {where}: {msg}')
+    # stale widget replays and the like: reported, but not app failures
+    print(f'harness       {len(stats["harness"])}')
+    for where, msg in stats['harness'][:5]:
+        print(f'  {where}: {msg}')
+
+    if tmp is not None:
+        tmp.cleanup()
+    if stats['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Concurrency stress run for the engine.
+
+Many threads run query pipelines (joins, filters, groupbys, sorts, windows,
+top_n, genre filters, csvscan reads) against the same shared frames of a
+framestore while another thread keeps reloading the store. Every result is
+compared with the result of the same pipeline run alone, and the shared
+columns are checked to be unchanged at the end. A second phase repeats the
+run with a tiny memory budget so the spilling operators run concurrently too.
+
+    python bench/stress_concurrency.py [--threads 8] [--iterations 3] [--rows 5000]
+
+Exits with status 1 on the first mismatch.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from engine.cancel import querycontext
+from engine.dataframe import dataframe
+from engine.index import sortedindex
+from engine.memory import budget
+from engine.ops import functions
+from engine.parser import csvscan
+from engine.store import framestore
+
+DATA = os.path.join(BASE_DIR, 'data')
+
+
+def load_steps(rows):
+    dfc = dataframe()
+
+    def read(name):
+        return dfc.read_frame(os.path.join(DATA, name), ',')
+
+    return [
+        ('movies', 'movies', lambda ld: read('movies.csv')),
+        ('ratings', 'ratings', lambda ld: csvscan(os.path.join(DATA, 'ratings.csv')).take(range(rows))),
+        ('tags', 'tags', lambda ld: read('tags.csv')),
+        ('ratings_time_index', 'index', lambda ld: sortedindex(ld.get('ratings'), 'timestamp')),
+    ]
+
+
+def pipelines(scan):
+    ops = functions()
+
+    def movies_ratings(f):
+        return ops.join(f['movies'], f['ratings'], ['movieId'], how='inner')
+
+    def limited(f):
+        # a generous per thread query context must not change the result
+        with querycontext(timeout=600, max_rows=10 ** 9):
+            return ops.groupby(movies_ratings(f), ['year'], ['rating'], 'avg')
+
+    return {
+        'join': movies_ratings,
+        'left_join': lambda f: ops.join(f['tags'], f['movies'], ['movieId'], how='left'),
+        'filter_or': lambda f: ops.filter(
+            f['ratings'], ['rating', 'userId'], ['>=', '<'], [4.5, 100], ['or']),
+        'groupby_avg': lambda f: ops.groupby(f['ratings'], ['movieId'], ['rating'], 'avg'),
+        'groupby_year': lambda f: ops.groupby(movies_ratings(f), ['year'], ['rating'], 'count'),
+        'query_context': limited,
+        'order_rows': lambda f: ops.order_rows(f['ratings'], ['timestamp'], type='dsc', limit=500),
+        'window_rank': lambda f: ops.window(
+            f['ratings'], ['userId'], ['rating'], 'rank', type='dsc'),
+        'top_n': lambda f: ops.top_n(f['ratings'], ['userId'], 'rating', 3),
+        'genres': lambda f: ops.has_all(f['movies'], 'genres', ['Comedy', 'Romance']),
+        'genre_groupby': lambda f: ops.groupby_exploded(
+            movies_ratings(f), 'genres', ['rating'], 'avg'),
+        'time_bucket': lambda f: ops.groupby(
+            ops.time_bucket(f['ratings'], 'timestamp', 'year'), ['timestamp_year'], ['rating'], 'avg'),
+        'time_window': lambda f: ops.time_window(
+            f['ratings'], f['ratings_time_index'], 946684800, 1262304000),
+        'scan_take': lambda f: scan.take(range(1000, 1100), ['movieId', 'rating']),
+        'scan_tail': lambda f: scan.tail(20),
+    }
+
+
+def plain(res):
+    # results as plain lists, so array / tuple / multivalue columns compare equal
+    if isinstance(res, dict):
+        return {c: list(col) for c, col in res.items()}
+    return res
+
+
+def snapshot_frames(loader):
+    return {n: loader.get(n) for n in ['movies', 'ratings', 'tags', 'ratings_time_index']}
+
+
+def run_phase(name, store, scan, threads, iterations):
+    work = pipelines(scan)
+    frames = snapshot_frames(store.snapshot())
+    expected = {k: plain(fn(frames)) for k, fn in work.items()}
+    shared = {n: plain(frames[n]) for n in ['movies', 'ratings', 'tags']}
+
+    failures = []
+    done = threading.Event()
+    lat = []
+    lat_lock = threading.Lock()
+
+    def session(seed):
+        rnd = random.Random(seed)
+        names = list(work)
+        for _ in range(iterations):
+            rnd.shuffle(names)
+            for k in names:
+                # a fresh snapshot per query, like a Streamlit rerun
+                f = snapshot_frames(store.snapshot())
+                t = time.perf_counter()
+                got = plain(work[k](f))
+                with lat_lock:
+                    lat.append(time.perf_counter() - t)
+                if got != expected[k]:
+                    failures.append(f'{name}: {k} differs in session {seed}')
+                    return
+
+    def reloader():
+        reloads = 0
+        while not done.is_set():
+            if store.reload():
+                reloads += 1
+            time.sleep(0.5)
+        results['reloads'] = reloads
+
+    results = {}
+    ts = [threading.Thread(target=session, args=(i,)) for i in range(threads)]
+    rt = threading.Thread(target=reloader)
+    t0 = time.perf_counter()
+    rt.start()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    done.set()
+    rt.join()
+    elapsed = time.perf_counter() - t0
+
+    for n, cols in shared.items():
+        if plain(frames[n]) != cols:
+            failures.append(f'{name}: shared frame {n} was modified')
+
+    lat.sort()
+    print(f'{name}: {len(lat)} queries on {threads} threads in {elapsed:.1f}s, '
+          f'{results.get("reloads", 0)} reloads, '
+          f'p50 {lat[len(lat) // 2] * 1000:.1f}ms p95 {lat[int(len(lat) * 0.95)] * 1000:.1f}ms')
+    return failures
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    p.add_argument('--threads', type=int, default=8)
+    p.add_argument('--iterations', type=int, default=3)
+    p.add_argument('--rows', type=int, default=5000, help='ratings rows to use')
+    args = p.parse_args()
+
+    # switch threads often, so more interleavings get tried
+    sys.setswitchinterval(1e-4)
+
+    store = framestore(lambda: load_steps(args.rows))
+    store.snapshot().wait('ratings_time_index')
+    while not store.snapshot().finished():
+        time.sleep(0.05)
+    scan = csvscan(os.path.join(DATA, 'ratings.csv'))
+
+    failures = run_phase('in memory', store, scan, args.threads, args.iterations)
+
+    limit = budget.limit
+    budget.set_limit(64 * 1024)
+    try:
+        failures += run_phase('spilling', store, scan, args.threads, max(1, args.iterations // 2))
+    finally:
+        budget.set_limit(limit)
+
+    for f in failures:
+        print('FAIL', f)
+    if failures:
+        sys.exit(1)
+    print('ok: every result matched the single threaded run')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+import os
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the python backend needs nothing
+    np = None
+
+
+# ints below this convert to float64 exactly, so sums / averages of int
+# columns stay identical to the python results
+EXACT_INT = 2 ** 53
+DTYPES = {'q': 'int64', 'd': 'float64'}
+
+
+def typed_column(v):
+    # an int64 / float64 vector as an array column, so the next operator in a
+    # chain gets a typed column it can vectorize again
+    code = 'q' if v.dtype.kind == 'i' else 'd'
+    out = array(code)
+    out.frombytes(v.astype(DTYPES[code], copy=False).tobytes())
+    return out
+
+
+class numpybackend:
+
+    # vectorized versions of the hot loops in functions. Each method either
+    # returns exactly what the python (reference) code would, or None when
+    # the input is outside what it handles (untyped columns, NaN keys, ints
+    # that could lose precision, ...) so the caller falls back to python.
+    # Only int64 / float64 array columns are vectorized; ties and group order
+    # follow the python code (stable sorts, first occurrence order). Columns
+    # built from typed columns come back typed, so chained operators (filter,
+    # join, groupby) stay on this path.
+    name = 'numpy'
+
+    def vector(self, col):
+        # compressed columns (engine.encoding) are decoded for the vector ops
+        if hasattr(col, 'to_array'):
+            col = col.to_array()
+        if isinstance(col, array) and col.typecode in DTYPES:
+            return np.frombuffer(col, dtype=DTYPES[col.typecode]) if len(col) else np.empty(0, DTYPES[col.typecode])
+        return None
+
+    def take_column(self, col, idx):
+        v = self.vector(col)
+        if v is None:
+            return None
+        return typed_column(v[np.asarray(idx, dtype=np.int64)])
+
+    def comparable(self, v, val):
+        # numpy compares int64 with a float through float64; only safe while
+        # every int is exact in float64
+        if isinstance(val, bool) or not isinstance(val, (int, float)):
+            return False
+        if v.dtype.kind == 'f':
+            return not np.isnan(v).any()
+        if isinstance(val, float) and len(v) and max(abs(int(v.min())), abs(int(v.max()))) >= EXACT_INT:
+            return False
+        return isinstance(val, float) or -2 ** 63 <= val < 2 ** 63
+
+    def filter_positions(self, df, columns, conditions, values, seperators):
+        ops = {
+            '=': np.equal, '>': np.greater, '<': np.less,
+            '>=': np.greater_equal, '<=': np.less_equal, '!=': np.not_equal,
+        }
+        cols = []
+        for col, cond, val in zip(columns, conditions, values):
+            v = self.vector(df[col])
+            if v is None or cond not in ops or not self.comparable(v, val):
+                return None
+            cols.append((v, ops[cond], val))
+        if not cols:
+            return None
+
+        mask = np.ones(len(cols[0][0]), dtype=bool)
+        for (v, op, val), sep in zip(cols, seperators):
+            if sep.lower() == 'and':
+                mask &= op(v, val)
+            elif sep.lower() == 'or':
+                mask |= op(v, val)
+        return np.flatnonzero(mask).tolist()
+
+    def compare_positions(self, col, cond, val, rows):
+        # the positions in rows (ascending) where col <cond> val holds
+        ops = {
+            '=': np.equal, '>': np.greater, '<': np.less,
+            '>=': np.greater_equal, '<=': np.less_equal, '!=': np.not_equal,
+        }
+        v = self.vector(col)
+        if v is None:
+            return None
+        # 'in' takes a list of values, 'between' a (low, high) pair
+        if cond == 'in':
+            vals = list(val)
+            if not all(self.comparable(v, x) for x in vals):
+                return None
+            exact = v.dtype.kind == 'i' and all(isinstance(x, int) for x in vals)
+            wanted = np.asarray(vals, dtype=np.int64 if exact else np.float64)
+            test = lambda w: np.isin(w, wanted)
+        elif cond == 'between':
+            low, high = val
+            if not (self.comparable(v, low) and self.comparable(v, high)):
+                return None
+            test = lambda w: (w >= low) & (w <= high)
+        elif cond in ops and self.comparable(v, val):
+            test = lambda w: ops[cond](w, val)
+        else:
+            return None
+        if isinstance(rows, range) and rows.step == 1 and rows.start == 0 and rows.stop == len(v):
+            return np.flatnonzero(test(v)).tolist()
+        idx = np.asarray(rows, dtype=np.int64)
+        return idx[test(v[idx])].tolist()
+
+    def sorted_positions(self, vals, reverse=False, limit=None):
+        v = self.vector(vals)
+        if v is None or (v.dtype.kind == 'f' and np.isnan(v).any()):
+            return None
+
+        cand = None
+        if limit is not None and limit < len(v):
+            # top k: everything at or beyond the k-th value, then sort only those
+            if reverse:
+                kth = np.partition(v, len(v) - limit)[len(v) - limit]
+                cand = np.flatnonzero(v >= kth)
+            else:
+                kth = np.partition(v, limit - 1)[limit - 1]
+                cand = np.flatnonzero(v <= kth)
+            v = v[cand]
+
+        if reverse:
+            # stable descending: sort the reversed column ascending, reverse
+            # back, so equal values keep their row order like sorted()
+            order = len(v) - 1 - np.argsort(v[::-1], kind='stable')[::-1]
+        else:
+            order = np.argsort(v, kind='stable')
+
+        if cand is not None:
+            order = cand[order][:limit]
+        return order.tolist()
+
+    def groupby(self, df, groupby_columns, agg_column, agg_type, edges=None):
+        if agg_type not in ['count', 'sum', 'avg', 'min', 'max', 'hist'] or not groupby_columns:
+            return None
+        if agg_type == 'hist' and edges is None:
+            return None
+        # empty frames and missing columns are the python code's to report
+        if any(c not in df for c in list(groupby_columns) + list(agg_column)):
+            return None
+        if not len(df[groupby_columns[0]]):
+            return None
+        keys = [self.vector(df[c]) for c in groupby_columns]
+        vals = [self.vector(df[c]) for c in agg_column]
+        if any(k is None for k in keys) or any(v is None for v in vals):
+            return None
+        if len(set(k.dtype for k in keys)) > 1 or not len(keys[0]):
+            return None
+        if any(k.dtype.kind == 'f' and np.isnan(k).any() for k in keys):
+            return None
+
+        n = len(keys[0])
+        if len(keys) == 1:
+            _, first, inv = np.unique(keys[0], return_index=True, return_inverse=True)
+        else:
+            _, first, inv = np.unique(np.stack(keys, axis=1), axis=0, return_index=True, return_inverse=True)
+        inv = inv.reshape(-1)
+
+        # groups are numbered by sorted key; renumber by first occurrence
+        order = np.argsort(first, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        inv = rank[inv]
+        first = first[order]
+        g = len(first)
+
+        d = {}
+        for c, k in zip(groupby_columns, keys):
+            d[c] = typed_column(k[first])
+
+        counts = np.bincount(inv, minlength=g)
+        for c, v in zip(agg_column, vals):
+            if agg_type == 'count':
+                d[c + '_count'] = typed_column(counts)
+                continue
+
+            if agg_type == 'hist':
+                if v.dtype.kind == 'f' and np.isnan(v).any():
+                    return None
+                if v.dtype.kind == 'i' and n and max(abs(int(v.min())), abs(int(v.max()))) >= EXACT_INT:
+                    return None
+                e = np.asarray(edges[c], dtype=np.float64)
+                n_bins = len(e) - 1
+                k = np.searchsorted(e, v, side='right') - 1
+                k[v == e[-1]] = n_bins - 1
+                keep = (v >= e[0]) & (v <= e[-1])
+                # one count per (group, bin) cell
+                cells = np.bincount(inv[keep] * n_bins + k[keep], minlength=g * n_bins)
+                d[c + '_hist'] = cells.reshape(g, n_bins).tolist()
+                continue
+
+            if v.dtype.kind == 'i' and agg_type in ['sum', 'avg']:
+                if n and max(abs(int(v.min())), abs(int(v.max()))) * n >= EXACT_INT:
+                    return None
+                s = np.zeros(g, dtype=np.int64)
+                np.add.at(s, inv, v)
+            elif agg_type in ['sum', 'avg']:
+                # bincount adds the rows in order, like the python loop
+                s = np.bincount(inv, weights=v, minlength=g)
+
+            if agg_type == 'sum':
+                d[c + '_sum'] = typed_column(s)
+            elif agg_type == 'avg':
+                d[c + '_avg'] = typed_column(s.astype(np.float64) / counts)
+            else:
+                if v.dtype.kind == 'f' and np.isnan(v).any():
+                    return None
+                # first row of each group, then fold in the rest
+                out = v[first].copy()
+                if agg_type == 'min':
+                    np.minimum.at(out, inv, v)
+                else:
+                    np.maximum.at(out, inv, v)
+                d[c + '_' + agg_type] = typed_column(out)
+
+        return d
+
+    def histogram(self, col, edges, agg_cols, agg_type):
+        # (counts, [per bin aggregate of each agg column]) like
+        # functions.histogram; edges are compared in float64
+        v = self.vector(col)
+        vals = [self.vector(c) for c in agg_cols]
+        if v is None or any(x is None for x in vals):
+            return None
+        for x in [v] + vals:
+            if x.dtype.kind == 'f' and np.isnan(x).any():
+                return None
+            # ints exact in float64 for the edges, and sums of them too
+            limit = len(x) if x is not v and agg_type in ['sum', 'avg'] else 1
+            if x.dtype.kind == 'i' and len(x) and max(abs(int(x.min())), abs(int(x.max()))) * limit >= EXACT_INT:
+                return None
+        if any(isinstance(e, int) and abs(e) >= EXACT_INT for e in edges):
+            return None
+
+        e = np.asarray(edges, dtype=np.float64)
+        n_bins = len(e) - 1
+        k = np.searchsorted(e, v, side='right') - 1
+        k[v == e[-1]] = n_bins - 1  # the last bin holds its upper edge
+        keep = (v >= e[0]) & (v <= e[-1])
+        k = k[keep]
+        counts = np.bincount(k, minlength=n_bins)
+
+        out = []
+        for x in vals:
+            x = x[keep]
+            if agg_type == 'count':
+                out.append(counts.tolist())
+                continue
+            if agg_type in ['sum', 'avg']:
+                if x.dtype.kind == 'i':
+                    s = np.zeros(n_bins, dtype=np.int64)
+                    np.add.at(s, k, x)
+                else:
+                    # bincount adds the rows in order, like the python loop
+                    s = np.bincount(k, weights=x, minlength=n_bins)
+                if agg_type == 'sum':
+                    out.append(s.tolist())
+                else:
+                    out.append([None if c == 0 else a / c for a, c in zip(s.tolist(), counts.tolist())])
+                continue
+            if x.dtype.kind == 'i':
+                info = np.iinfo(np.int64)
+                acc = np.full(n_bins, info.max if agg_type == 'min' else info.min, dtype=np.int64)
+            else:
+                acc = np.full(n_bins, np.inf if agg_type == 'min' else -np.inf)
+            if agg_type == 'min':
+                np.minimum.at(acc, k, x)
+            else:
+                np.maximum.at(acc, k, x)
+            out.append([a if c else None for a, c in zip(acc.tolist(), counts.tolist())])
+
+        return counts.tolist(), out
+
+    def join_pairs(self, df_left, df_right, on_columns, how, l_left, l_right):
+        # (left rows, right rows) in the python join's output order, -1 for
+        # the missing side of an outer row; single typed key column only
+        if len(on_columns) != 1 or not l_left or not l_right:
+            return None
+        lk = self.vector(df_left[on_columns[0]])
+        rk = self.vector(df_right[on_columns[0]])
+        if lk is None or rk is None or lk.dtype != rk.dtype:
+            return None
+        if lk.dtype.kind == 'f' and (np.isnan(lk).any() or np.isnan(rk).any()):
+            return None
+
+        # right rows sorted by key, equal keys in row order (stable)
+        rorder = np.argsort(rk, kind='stable')
+        rsorted = rk[rorder]
+        lo = np.searchsorted(rsorted, lk, side='left')
+        hi = np.searchsorted(rsorted, lk, side='right')
+        counts = hi - lo
+
+        outer_left = how in ['left', 'full']
+        per_left = np.maximum(counts, 1) if outer_left else counts
+        total = int(per_left.sum())
+        left_idx = np.repeat(np.arange(l_left, dtype=np.int64), per_left)
+        start = np.repeat(np.cumsum(per_left) - per_left, per_left)
+        pos = np.repeat(lo, per_left) + (np.arange(total, dtype=np.int64) - start)
+        right_idx = rorder[np.minimum(pos, l_right - 1)]
+        if outer_left:
+            right_idx = np.where(np.repeat(counts, per_left) == 0, -1, right_idx)
+
+        if how in ['right', 'full']:
+            used = np.zeros(l_right, dtype=bool)
+            used[right_idx[right_idx >= 0]] = True
+            extra = np.flatnonzero(~used)
+            left_idx = np.concatenate([left_idx, np.full(len(extra), -1, dtype=np.int64)])
+            right_idx = np.concatenate([right_idx, extra])
+
+        return left_idx, right_idx
+
+    def gather(self, col, idx):
+        # column values at idx, None where idx is -1 (outer join rows); a
+        # typed column with no missing rows stays typed
+        v = self.vector(col)
+        missing = idx < 0
+        if v is not None and not missing.any():
+            return typed_column(v[idx])
+        if v is not None:
+            out = v[np.where(missing, 0, idx)].tolist() if len(v) else [None] * len(idx)
+        else:
+            out = [col[i] for i in np.where(missing, 0, idx).tolist()] if len(col) else [None] * len(idx)
+        for p in np.flatnonzero(missing).tolist():
+            out[p] = None
+        return out
+
+
+BACKENDS = {'python': None}
+if np is not None:
+    BACKENDS['numpy'] = numpybackend()
+
+# backend for functions() created without one: CINEDASH_BACKEND or python
+default = {'name': os.environ.get('CINEDASH_BACKEND', 'python')}
+
+
+def available():
+    return list(BACKENDS)
+
+
+def resolve(name):
+    if name not in BACKENDS:
+        if name == 'numpy':
+            raise ValueError('the numpy backend needs numpy installed (pip install numpy)')
+        raise ValueError('Not a valid backend, choose from : ' + ', '.join(BACKENDS))
+    return BACKENDS[name]
+
+
+def set_backend(name):
+    # global default for every functions() that did not pick its own
+    resolve(name)
+    default['name'] = name
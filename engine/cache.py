@@ -0,0 +1,92 @@
+import json
+import os
+from array import array
+
+# binary cache file: MAGIC, header length (8 bytes), json header, then the
+# raw bytes of every array one after the other. The header lists
+# (name, typecode, length) for each array plus free form meta, so loading
+# is one read per array with no parsing
+MAGIC = b'CINEDASH-BIN1'
+
+
+def cache_dir(source):
+    # CINEDASH_CACHE_DIR, or a .cache folder next to the source file
+    d = os.environ.get('CINEDASH_CACHE_DIR')
+    if not d:
+        d = os.path.join(os.path.dirname(os.path.abspath(source)), '.cache')
+    return d
+
+
+def cache_path(source, name):
+    return os.path.join(cache_dir(source), os.path.basename(source) + '.' + name + '.bin')
+
+
+def source_stamp(source):
+    # a cache file is only valid for the exact source file it was built from
+    st = os.stat(source)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def write_arrays(path, arrays, meta=None):
+    # arrays = {name: array}; written to a temp file and renamed into place,
+    # so a reader never sees half a cache file
+    header = {
+        'meta': meta or {},
+        'arrays': [[name, a.typecode, len(a)] for name, a in arrays.items()],
+    }
+    head = json.dumps(header).encode('utf-8')
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp' + str(os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(head).to_bytes(8, 'little'))
+        f.write(head)
+        for a in arrays.values():
+            a.tofile(f)
+    os.replace(tmp, path)
+
+
+def read_arrays(path, names=None):
+    # -> (arrays, meta); ValueError if the file is not a cache file. With
+    # names, only those arrays are read, the others are skipped over
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a CineDash cache file')
+        n = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(n).decode('utf-8'))
+
+        arrays = {}
+        for name, typecode, length in header['arrays']:
+            if names is not None and name not in names:
+                f.seek(length * array(typecode).itemsize, 1)
+                continue
+            a = array(typecode)
+            try:
+                a.fromfile(f, length)
+            except EOFError:
+                raise ValueError(path + ' is truncated')
+            arrays[name] = a
+
+    return arrays, header['meta']
+
+
+def cached(source, name, build, save, load):
+    # load(path) -> (obj, meta) from the cache when it was built from the
+    # current source file, otherwise obj = build() and save(obj, path, meta).
+    # A cache that cannot be written is skipped, the result is still returned
+    path = cache_path(source, name)
+    stamp = source_stamp(source)
+    try:
+        obj, meta = load(path)
+        if meta.get('source') == stamp:
+            return obj
+    except (OSError, ValueError, KeyError):
+        pass
+
+    obj = build()
+    try:
+        save(obj, path, {'source': stamp})
+    except OSError:
+        pass
+    return obj
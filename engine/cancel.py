@@ -0,0 +1,92 @@
+import functools
+import threading
+import time
+
+# cooperative cancellation for long running operators. A query runs as
+#   with querycontext(timeout=10, max_rows=10**6, progress=cb) as q:
+#       df = ops.join(...); df = ops.groupby(df, ...)
+# and the loops of functions.join / filter / groupby / order_rows tick the
+# context of their thread every few thousand rows. A cancelled, timed out or
+# over budget query stops with querystopped, which the operator returns as
+# its error string, like its other errors.
+
+# rows between two real checks of a tick()
+CHECK_EVERY = 4096
+
+local = threading.local()
+
+
+class querystopped(Exception):
+    pass
+
+
+class querycontext:
+
+    # timeout in seconds and max_rows (rows one operator may produce) are
+    # optional; progress(stage, done, total) is called at most every
+    # interval seconds. cancel() may come from any thread. A context can be
+    # entered once per step of a query, the time limit runs from the first
+    # enter
+    def __init__(self, timeout=None, max_rows=None, progress=None, interval=0.1):
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.progress = progress
+        self.interval = interval
+        self.cancelled = False
+        self.deadline = None
+        self.last = 0.0
+        self.ticks = 0
+        self.outer = None
+
+    def __enter__(self):
+        if self.timeout and self.deadline is None:
+            self.deadline = time.monotonic() + self.timeout
+        self.outer = current_query()
+        local.query = self
+        return self
+
+    def __exit__(self, *exc):
+        local.query = self.outer
+        return False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self, stage, done=None, total=None, rows=None):
+        if self.cancelled:
+            raise querystopped('query cancelled during ' + stage)
+        now = time.monotonic()
+        if self.deadline is not None and now > self.deadline:
+            raise querystopped(f'query stopped: {stage} went over the {self.timeout:g}s time limit')
+        if rows is not None:
+            self.rows(stage, rows)
+        if self.progress is not None and now - self.last >= self.interval:
+            self.last = now
+            self.progress(stage, done, total)
+
+    def tick(self, stage, done=None, total=None, rows=None, step=1):
+        # cheap per row call, a real check every CHECK_EVERY rows
+        self.ticks = self.ticks + step
+        if self.ticks >= CHECK_EVERY:
+            self.ticks = 0
+            self.check(stage, done, total, rows)
+
+    def rows(self, stage, n):
+        if self.max_rows is not None and n > self.max_rows:
+            raise querystopped(f'query stopped: {stage} produced more than {self.max_rows:,} rows')
+
+
+def current_query():
+    # the querycontext the calling thread runs in, or None
+    return getattr(local, 'query', None)
+
+
+def stoppable(op):
+    # operator wrapper: a stopped query comes back as the error string
+    @functools.wraps(op)
+    def run(*args, **kwargs):
+        try:
+            return op(*args, **kwargs)
+        except querystopped as e:
+            return str(e)
+    return run
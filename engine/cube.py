@@ -0,0 +1,227 @@
+from itertools import product
+
+# pre-aggregated rollups of a frame. A cube keeps count / sum / min / max of
+# one measure column for every combination of its dimensions (year, decade,
+# genre, rating_bucket, ...), one cuboid per subset of the dimensions, so
+# any slice or roll-up of those dimensions is answered from the cells
+# instead of the rows:
+#   c = cube(movies_ratings, ['year', 'genre', 'rating_bucket'], 'rating')
+#   c.groupby(['year'], 'avg', where={'genre': 'Comedy'})
+# genre is multi valued: a row counts once in the cell of each of its
+# genres, and once (not once per genre) when genre is rolled up, which is
+# why every subset gets its own cuboid instead of summing the finest one.
+# Queries the cells cannot answer (other columns, another measure, several
+# genres at once) are computed from the rows.
+AGG_TYPES = ['count', 'sum', 'avg', 'min', 'max']
+
+
+def decade_of(df):
+    return [None if y is None else y // 10 * 10 for y in df['year']]
+
+
+def rating_bucket_of(df):
+    # [b, b + 1) buckets: 0.5 -> 0, 3.5 -> 3, 5.0 -> 5
+    return [None if r is None else int(r // 1) for r in df['rating']]
+
+
+def genre_of(df):
+    # per row key of the genres: the bitmask of an encoded column, the
+    # joined string otherwise
+    col = df['genres']
+    return col.codes if hasattr(col, 'codes') else col
+
+
+def genre_labels(df):
+    # key -> the genres it stands for
+    col = df['genres']
+    if hasattr(col, 'codes'):
+        return col.labels_of
+    return lambda s: s.split('|') if s else []
+
+
+# derived dimensions, anything else is read from the column of that name
+DIMENSIONS = {
+    'decade': decade_of,
+    'rating_bucket': rating_bucket_of,
+    'genre': genre_of,
+}
+
+# multi valued dimensions and how to expand their keys
+MULTI = {
+    'genre': genre_labels,
+}
+
+
+def dimension(df, name):
+    if name in DIMENSIONS:
+        return DIMENSIONS[name](df)
+    return df[name]
+
+
+def new_cell():
+    # [rows, rows with a number, sum, min, max]: count is every row, like
+    # functions.groupby; avg divides by the rows that have a number
+    return [0, 0, 0, None, None]
+
+
+def merge(cell, other):
+    cell[0] = cell[0] + other[0]
+    cell[1] = cell[1] + other[1]
+    cell[2] = cell[2] + other[2]
+    if other[3] is not None and (cell[3] is None or other[3] < cell[3]):
+        cell[3] = other[3]
+    if other[4] is not None and (cell[4] is None or other[4] > cell[4]):
+        cell[4] = other[4]
+
+
+def add_value(cell, v):
+    cell[0] = cell[0] + 1
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        cell[1] = cell[1] + 1
+        cell[2] = cell[2] + v
+        if cell[3] is None or v < cell[3]:
+            cell[3] = v
+        if cell[4] is None or v > cell[4]:
+            cell[4] = v
+
+
+def wanted(value):
+    # a where value is one value or a list / tuple / set of values
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return set(value)
+    return {value}
+
+
+class cube:
+
+    def __init__(self, df, dims, measure):
+        for d in dims:
+            if d not in DIMENSIONS and d not in df:
+                raise ValueError('Not a valid cube dimension : ' + str(d))
+        if measure not in df:
+            raise ValueError('Not a valid measure column : ' + str(measure))
+
+        self.df = df
+        self.dims = list(dims)
+        self.measure = measure
+        self.expand = {d: MULTI[d](df) for d in self.dims if d in MULTI}
+
+        # finest cells first, keyed by the raw dimension keys (a genre
+        # bitmask is one key), then every cuboid is rolled up from those
+        cols = [dimension(df, d) for d in self.dims]
+        vals = df[measure]
+        base = {}
+        for i in range(len(vals)):
+            key = tuple(c[i] for c in cols)
+            cell = base.get(key)
+            if cell is None:
+                cell = base[key] = new_cell()
+            add_value(cell, vals[i])
+        self.rows = len(vals)
+
+        # cuboids[frozenset(dims)] = {key tuple in self.dims order: cell}
+        self.cuboids = {}
+        for bits in range(2 ** len(self.dims)):
+            keep = [k for k in range(len(self.dims)) if bits >> k & 1]
+            cuboid = {}
+            for key, cell in base.items():
+                parts = []
+                for k in keep:
+                    d = self.dims[k]
+                    parts.append(self.expand[d](key[k]) if d in self.expand else [key[k]])
+                for sub in product(*parts):
+                    c = cuboid.get(sub)
+                    if c is None:
+                        c = cuboid[sub] = new_cell()
+                    merge(c, cell)
+            self.cuboids[frozenset(self.dims[k] for k in keep)] = cuboid
+
+    def cells(self):
+        return sum(len(c) for c in self.cuboids.values())
+
+    def supports(self, groupby_columns, where=None, agg_column=None):
+        # True when groupby() can answer from the cells
+        where = where or {}
+        if agg_column is not None and agg_column != self.measure:
+            return False
+        if any(d not in self.dims for d in list(groupby_columns) + list(where)):
+            return False
+        # a row with several of the wanted genres would be counted once per
+        # genre when the genre cells are added up
+        for d, v in where.items():
+            if d in self.expand and d not in groupby_columns and len(wanted(v)) > 1:
+                return False
+        return True
+
+    def groupby(self, groupby_columns, agg_type, where=None, agg_column=None):
+        # like functions.groupby over the rows matching where ({dimension:
+        # value or values}), groups in key order. O(cells) when supports(),
+        # a pass over the rows otherwise
+        if agg_type not in AGG_TYPES:
+            return 'Not a valid aggregation type, choose from : ' + ', '.join(AGG_TYPES)
+        where = where or {}
+        if not self.supports(groupby_columns, where, agg_column):
+            return self.raw_groupby(groupby_columns, agg_type, where, agg_column or self.measure)
+
+        used = [d for d in self.dims if d in groupby_columns or d in where]
+        pos = {d: k for k, d in enumerate(used)}
+        tests = [(pos[d], wanted(v)) for d, v in where.items()]
+        out = [pos[d] for d in groupby_columns]
+
+        groups = {}
+        for key, cell in self.cuboids[frozenset(used)].items():
+            if all(key[k] in vals for k, vals in tests):
+                g = tuple(key[k] for k in out)
+                c = groups.get(g)
+                if c is None:
+                    c = groups[g] = new_cell()
+                merge(c, cell)
+        return self.frame(groupby_columns, agg_type, groups, self.measure)
+
+    def raw_groupby(self, groupby_columns, agg_type, where, agg_column):
+        # the same answer from the rows, for queries outside the cube
+        for d in list(groupby_columns) + list(where):
+            if d not in DIMENSIONS and d not in self.df:
+                return 'Column not found : ' + str(d)
+        if agg_column not in self.df:
+            return 'Column not found : ' + str(agg_column)
+
+        names = list(dict.fromkeys(list(groupby_columns) + list(where)))
+        cols = [dimension(self.df, d) for d in names]
+        expand = [MULTI[d](self.df) if d in MULTI else None for d in names]
+        tests = [(names.index(d), wanted(v)) for d, v in where.items()]
+        out = [names.index(d) for d in groupby_columns]
+        vals = self.df[agg_column]
+
+        groups = {}
+        for i in range(len(vals)):
+            parts = [[c[i]] if e is None else e(c[i]) for c, e in zip(cols, expand)]
+            # a multi valued where passes when any of the row's values is wanted
+            if not all(any(p in vals_ for p in parts[k]) for k, vals_ in tests):
+                continue
+            for k, vals_ in tests:
+                if k in out:
+                    parts[k] = [p for p in parts[k] if p in vals_]
+            for g in set(product(*[parts[k] for k in out])):
+                c = groups.get(g)
+                if c is None:
+                    c = groups[g] = new_cell()
+                add_value(c, vals[i])
+        return self.frame(groupby_columns, agg_type, groups, agg_column)
+
+    def frame(self, groupby_columns, agg_type, groups, agg_column):
+        keys = sorted(groups, key=lambda g: [(v is None, v) for v in g])
+        d = {c: [g[k] for g in keys] for k, c in enumerate(groupby_columns)}
+        cells = [groups[g] for g in keys]
+        if agg_type == 'count':
+            vals = [c[0] for c in cells]
+        elif agg_type == 'sum':
+            vals = [c[2] for c in cells]
+        elif agg_type == 'avg':
+            vals = [c[2] / c[1] if c[1] else None for c in cells]
+        elif agg_type == 'min':
+            vals = [c[3] for c in cells]
+        else:
+            vals = [c[4] for c in cells]
+        d[agg_column + '_' + agg_type] = vals
+        return d
@@ -1,35 +1,33 @@
-import re 
+from engine.parser import csvreader
+from engine.schema import named_schema
 
 class dataframe:
 
-    def create_frame(self, columns, rows, extract_year=False):
-        columns = columns
-        rows = rows
+    # bad rows of every read are kept in self.errors, {path (or 'rows'):
+    # ['line N: ...', ...]}, for the caller to show; nothing is printed
+    def __init__(self):
+        self.errors = {}
 
-        if extract_year == True:
-            for r in rows:
-                if len(r) > 1:
-                    yrs = re.findall(r"\(\d{4}\)", r[1])
-                    if yrs:
-                        year_val = yrs[0][1:5]
-                        r.append(year_val)
-                        r[1] = r[1].replace(yrs[0], '').strip()
-                    else:   
-                        r.append('0')
-                else:
-                    r.append('0')
+    def create_frame(self, columns, rows, extract_year=False, schema=None):
+        # typed frame from already split rows (see csvreader.read_doc);
+        # csvreader.read_frame does the same straight from the file
+        if schema is None:
+            schema = named_schema(columns, extract_year)
 
-            columns.append('year')
+        bound = schema.bind(columns)
+        d = bound.new_frame()
+        errors = []
+        bound.extend(d, rows, range(2, len(rows) + 2), errors)
+        self.errors['rows'] = errors
 
-        d = {}
-        for i, c in enumerate(columns):  # 0 , movieId
-            for r in rows:
-                if c not in ['timestamp']:
-                    if c in ['movieId', 'year', 'userId']:
-                        d.setdefault(c, []).append(int(r[i]))
-                    elif c == 'rating':
-                        d.setdefault(c, []).append(float(r[i]))
-                    else:
-                        d.setdefault(c, []).append(r[i])
+        return d
 
+    def read_frame(self, path, sep=',', schema=None, with_errors=False):
+        # with_errors=True returns (frame, bad rows), for reads that run in
+        # another process where self.errors is not the caller's
+        reader = csvreader()
+        d = reader.read_frame(path, schema, sep)
+        self.errors[path] = reader.errors
+        if with_errors:
+            return d, reader.errors
         return d
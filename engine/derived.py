@@ -0,0 +1,184 @@
+import threading
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional, derived columns are then computed in python
+    np = None
+
+from engine.backend import typed_column
+from engine.index import lowered
+from engine.memory import budget
+
+# derived (virtual) columns: a column of a frame defined from other columns of
+# that frame, computed on first use and cached in the column object, so a
+# frame gets "decade" or "rating_bucket" without copying any column:
+#   df = ops.derive(df, 'decade', 'bucket', ['year'], 10)
+# The cache is dropped when a base column is replaced, its length changes or
+# one of a few sampled values changes, and recomputed on the next read. Read
+# through the ops (which resolve derived columns against the frame they are
+# given), a copy of the frame with a base column swapped gets values computed
+# from the new column. functions
+#   bucket  v // arg * arg (year -> decade, rating -> whole star bucket)
+#   const   arg on every row (the key of a global aggregation)
+#   map     arg.get(v), a dict
+#   lookup  arg = (other frame, key, value column[, default]): the value of
+#           the first row of other whose key is v, default (None) when there
+#           is none (movieId -> title). key is a column of other or a
+#           hashindex (engine.index) of one, built once and shared by every
+#           lookup instead of a pass over other per lookup
+#   within  arg = (low, high): v when low <= v <= high, None otherwise, a
+#           None bound is open (years before 1801 -> None)
+#   apply   arg(*values of the row), plain python
+# bucket and const are vectorized with numpy when it is installed and the base
+# column is typed.
+FUNCS = ['bucket', 'const', 'map', 'lookup', 'within', 'apply']
+
+
+def typed(vals):
+    # an int64 / float64 array when every value is an int / a float
+    if vals and all(type(v) is int for v in vals):
+        return array('q', vals)
+    if vals and all(type(v) is float for v in vals):
+        return array('d', vals)
+    return vals
+
+
+def stamp(col):
+    # cheap version of a column: its length and its first, middle and last
+    # values, so a column changed in place is noticed without a full pass
+    n = len(col)
+    if not n:
+        return (0,)
+    return (n, col[0], col[n // 2], col[n - 1])
+
+
+class lazycolumn:
+
+    def __init__(self, df, func, columns=(), arg=None):
+        if func not in FUNCS:
+            raise ValueError('Not a valid derived column function, choose from : ' + ', '.join(FUNCS))
+        self.df = df
+        self.func = func
+        self.columns = list(columns)
+        self.arg = arg
+        if not self.columns:
+            # no inputs (const): any other column gives the row count,
+            # a stored one if there is one
+            others = sorted((isinstance(col, lazycolumn), c) for c, col in df.items())
+            if not others:
+                raise ValueError('a derived column needs a frame with at least one column')
+            self.columns = [others[0][1]]
+        # (base column objects, their stamps, values) of the last computation
+        self.cached = None
+        self.builds = 0
+        self.lock = threading.Lock()
+
+    def sources(self, df=None):
+        # base columns read from df (a copy of the frame this column is read
+        # through) when it has them all, from the defining frame otherwise
+        if df is None or not all(c in df for c in self.columns):
+            df = self.df
+        return [df[c] for c in self.columns]
+
+    def valid(self, cached, base):
+        return (cached is not None
+                and all(a is b for a, b in zip(cached[0], base))
+                and cached[1] == [stamp(col) for col in base])
+
+    def values(self, df=None):
+        base = self.sources(df)
+        cached = self.cached
+        if self.valid(cached, base):
+            return cached[2]
+        with self.lock:
+            cached = self.cached
+            if self.valid(cached, base):
+                return cached[2]
+            vals = self.compute(base)
+            self.cached = (base, [stamp(col) for col in base], vals)
+            self.builds = self.builds + 1
+        return vals
+
+    def compute(self, base):
+        src = base[0]
+        n = len(src)
+        arg = self.arg
+        if self.func == 'const':
+            if type(arg) in (int, float):
+                return array('q' if type(arg) is int else 'd', [arg]) * n
+            return [arg] * n
+
+        if self.func == 'bucket':
+            if np is not None and isinstance(src, array) and src.typecode in 'qd' and n:
+                v = np.frombuffer(src, dtype='int64' if src.typecode == 'q' else 'float64')
+                return typed_column(np.floor_divide(v, arg) * arg)
+            return typed([None if x is None else x // arg * arg for x in src])
+
+        if self.func == 'map':
+            return typed([arg.get(x) for x in src])
+
+        if self.func == 'lookup':
+            other, key, value = arg[:3]
+            default = arg[3] if len(arg) > 3 else None
+            if isinstance(key, str):
+                pos = {}
+                for i, k in enumerate(other[key]):
+                    pos.setdefault(k, i)
+                rows = [pos.get(k) for k in src]
+            else:
+                pos = key.first_rows()
+                rows = [pos.get(lowered(k)) for k in src]
+            vals = other[value]
+            if hasattr(vals, 'take') and None not in rows:
+                # every key found: gathered by the column itself, an
+                # encoded column (genres) stays encoded
+                return vals.take(rows)
+            return typed([default if p is None else vals[p] for p in rows])
+
+        if self.func == 'within':
+            low, high = arg
+            return typed([
+                None if x is None or (low is not None and x < low)
+                or (high is not None and x > high) else x
+                for x in src
+            ])
+
+        return typed([arg(*row) for row in zip(*base)])
+
+    def __len__(self):
+        return len(self.sources()[0])
+
+    def __getitem__(self, i):
+        return self.values()[i]
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def take(self, idx):
+        vals = self.values()
+        if hasattr(vals, 'take'):
+            return vals.take(idx)
+        if isinstance(vals, array):
+            return array(vals.typecode, [vals[i] for i in idx])
+        return [vals[i] for i in idx]
+
+    def to_array(self):
+        # the computed values, a typed array for numbers (a list otherwise)
+        return self.values()
+
+    def memory_usage(self):
+        cached = self.cached
+        return 0 if cached is None else budget.column_bytes(cached[2])
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        del d['lock']
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f'lazycolumn({self.func}, {self.columns!r})'
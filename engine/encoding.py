@@ -0,0 +1,288 @@
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, chain, repeat
+
+# compressed int columns. Each one reads like a column (len, [i], slices,
+# iteration, take) so it drops into a frame, and answers comparisons without
+# decoding every row:
+#   rlecolumn     runs of one value (ratings.userId: the file is sorted by
+#                 user), filters and group counts cost O(runs)
+#   packedcolumn  blocks of BLOCK values bit packed at the width of the block:
+#                 'for' stores value - block minimum (frame of reference),
+#                 'delta' the zigzag difference to the previous value (sorted
+#                 or slowly changing columns like timestamps). Every block
+#                 keeps its min / max, so a filter only unpacks the blocks
+#                 that straddle the value
+# compress(col) picks the smallest of them, or keeps the column as it is.
+BLOCK = 128
+
+COMPARE = {
+    '=': lambda v, x: v == x,
+    '!=': lambda v, x: v != x,
+    '>': lambda v, x: v > x,
+    '<': lambda v, x: v < x,
+    '>=': lambda v, x: v >= x,
+    '<=': lambda v, x: v <= x,
+}
+
+
+def block_match(cond, lo, hi, val):
+    # True when every value in [lo, hi] passes, False when none does, None
+    # when the block has to be looked at
+    if cond == '=':
+        return None if lo <= val <= hi and lo != hi else lo == hi == val
+    if cond == '!=':
+        return None if lo <= val <= hi and lo != hi else not lo == hi == val
+    if cond in ['>', '>=']:
+        return True if COMPARE[cond](lo, val) else (None if COMPARE[cond](hi, val) else False)
+    return True if COMPARE[cond](hi, val) else (None if COMPARE[cond](lo, val) else False)
+
+
+def is_int_column(col):
+    if isinstance(col, array):
+        return col.typecode == 'q'
+    return all(type(v) is int for v in col)
+
+
+class rlecolumn:
+
+    # values[k] repeats over the rows starts[k] .. starts[k + 1] - 1
+    def __init__(self, values, starts, length):
+        self.values = values
+        self.starts = starts
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def run_count(self):
+        return len(self.values)
+
+    def runs(self):
+        # (value, first row, row after the last) per run
+        ends = chain(self.starts[1:], [self.length])
+        return zip(self.values, self.starts, ends)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(range(*i.indices(self.length)))
+        if i < 0:
+            i = i + self.length
+        if not 0 <= i < self.length:
+            raise IndexError('column index out of range')
+        return self.values[bisect_right(self.starts, i) - 1]
+
+    def __iter__(self):
+        return chain.from_iterable(repeat(v, e - s) for v, s, e in self.runs())
+
+    def to_array(self):
+        out = array('q')
+        for v, s, e in self.runs():
+            out.extend(array('q', [v]) * (e - s))
+        return out
+
+    def take(self, idx):
+        # ascending positions walk the runs once, others look each run up
+        out = array('q')
+        k = 0
+        last = -1
+        starts = self.starts
+        for i in idx:
+            if i < last or i >= self.length or i < 0:
+                out.append(self[i])
+                continue
+            while k + 1 < len(starts) and starts[k + 1] <= i:
+                k = k + 1
+            out.append(self.values[k])
+            last = i
+        return out
+
+    def positions(self, cond, val):
+        # rows where value <cond> val, one test per run
+        test = COMPARE.get(cond)
+        if test is None:
+            return 'invalid condition'
+        out = []
+        try:
+            for v, s, e in self.runs():
+                if test(v, val):
+                    out.extend(range(s, e))
+        except TypeError:
+            return 'Datatype error check the filter value of the condition!'
+        return out
+
+    def memory_usage(self):
+        return sys.getsizeof(self.values) + sys.getsizeof(self.starts)
+
+
+def rle_encode(col):
+    values = array('q')
+    starts = array('q')
+    prev = None
+    for i, v in enumerate(col):
+        if i == 0 or v != prev:
+            values.append(v)
+            starts.append(i)
+            prev = v
+    return rlecolumn(values, starts, len(col))
+
+
+def zigzag(d):
+    return d << 1 if d >= 0 else (-d << 1) - 1
+
+
+def unzigzag(z):
+    return (z >> 1) ^ -(z & 1)
+
+
+def pack(vals, width):
+    x = 0
+    for k, v in enumerate(vals):
+        x = x | (v << (k * width))
+    return x.to_bytes((len(vals) * width + 7) // 8, 'little')
+
+
+def unpack(data, width, n):
+    if not width:
+        return [0] * n
+    x = int.from_bytes(data, 'little')
+    mask = (1 << width) - 1
+    return [(x >> (k * width)) & mask for k in range(n)]
+
+
+class packedcolumn:
+
+    # mode is 'for' or 'delta'; refs[b] is the block minimum ('for') or its
+    # first value ('delta'), data[offsets[b]:offsets[b + 1]] its packed bits
+    def __init__(self, mode, length, refs, widths, offsets, data, mins, maxs, block=BLOCK):
+        self.mode = mode
+        self.length = length
+        self.refs = refs
+        self.widths = widths
+        self.offsets = offsets
+        self.data = data
+        self.mins = mins
+        self.maxs = maxs
+        self.block = block
+        # last unpacked block, so row by row reads unpack each block once
+        self.cached = (-1, None)
+
+    def __len__(self):
+        return self.length
+
+    def block_count(self):
+        return len(self.refs)
+
+    def block_values(self, b):
+        cached = self.cached
+        if cached[0] == b:
+            return cached[1]
+        n = min(self.block, self.length - b * self.block)
+        raw = self.data[self.offsets[b]:self.offsets[b + 1]]
+        ref = self.refs[b]
+        if self.mode == 'for':
+            vals = [ref + u for u in unpack(raw, self.widths[b], n)]
+        else:
+            vals = list(accumulate(map(unzigzag, unpack(raw, self.widths[b], n - 1)), initial=ref))
+        self.cached = (b, vals)
+        return vals
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(range(*i.indices(self.length)))
+        if i < 0:
+            i = i + self.length
+        if not 0 <= i < self.length:
+            raise IndexError('column index out of range')
+        return self.block_values(i // self.block)[i % self.block]
+
+    def __iter__(self):
+        return chain.from_iterable(self.block_values(b) for b in range(len(self.refs)))
+
+    def to_array(self):
+        return array('q', self)
+
+    def take(self, idx):
+        return array('q', [self[i] for i in idx])
+
+    def positions(self, cond, val):
+        # whole blocks in or out from their min / max, only the blocks in
+        # between are unpacked
+        test = COMPARE.get(cond)
+        if test is None:
+            return 'invalid condition'
+        out = []
+        try:
+            for b in range(len(self.refs)):
+                start = b * self.block
+                stop = min(self.length, start + self.block)
+                whole = block_match(cond, self.mins[b], self.maxs[b], val)
+                if whole is False:
+                    continue
+                if whole:
+                    out.extend(range(start, stop))
+                    continue
+                vals = self.block_values(b)
+                out.extend(start + k for k, v in enumerate(vals) if test(v, val))
+        except TypeError:
+            return 'Datatype error check the filter value of the condition!'
+        return out
+
+    def memory_usage(self):
+        return (sys.getsizeof(self.data) + sys.getsizeof(self.refs) + sys.getsizeof(self.widths)
+                + sys.getsizeof(self.offsets) + sys.getsizeof(self.mins) + sys.getsizeof(self.maxs))
+
+
+def pack_encode(col, mode='for', block=BLOCK):
+    if mode not in ['for', 'delta']:
+        raise ValueError('Not a valid packing mode, choose from : for, delta')
+    refs = array('q')
+    widths = array('B')
+    offsets = array('q', [0])
+    mins = array('q')
+    maxs = array('q')
+    parts = []
+    size = 0
+    for start in range(0, len(col), block):
+        vals = list(col[start:start + block])
+        lo = min(vals)
+        mins.append(lo)
+        maxs.append(max(vals))
+        if mode == 'for':
+            refs.append(lo)
+            us = [v - lo for v in vals]
+        else:
+            refs.append(vals[0])
+            us = [zigzag(b - a) for a, b in zip(vals, vals[1:])]
+        width = max(us, default=0).bit_length()
+        raw = pack(us, width)
+        widths.append(width)
+        parts.append(raw)
+        size = size + len(raw)
+        offsets.append(size)
+    return packedcolumn(mode, len(col), refs, widths, offsets, b''.join(parts), mins, maxs, block)
+
+
+def compress(col, kinds=('rle', 'for', 'delta')):
+    # the smallest encoding of an int column, or col when none is smaller
+    # (or it is not an int column)
+    if not len(col) or not is_int_column(col):
+        return col
+    plain = sys.getsizeof(col) if isinstance(col, array) else sys.getsizeof(array('q', col))
+    best = col
+    size = plain
+    for kind in kinds:
+        enc = rle_encode(col) if kind == 'rle' else pack_encode(col, kind)
+        if enc.memory_usage() < size:
+            best = enc
+            size = enc.memory_usage()
+    return best
+
+
+def compress_frame(df, columns=None, kinds=('rle', 'for', 'delta')):
+    # a frame with its int columns (or the given ones) compressed
+    d = dict(df)
+    for c in columns if columns is not None else list(df.keys()):
+        d[c] = compress(df[c], kinds)
+    return d
@@ -0,0 +1,244 @@
+import csv
+import json
+from array import array
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional, to_arrow() falls back to plain lists
+    pa = None
+
+from engine.multivalue import multivalue
+
+# streaming writers for query results. A source is a frame (dict of
+# columns), a csvscan (read batch by batch) or any iterable of frames, e.g. a
+# generator producing a large result piece by piece. Rows are written CHUNK
+# at a time, so only one chunk is converted / encoded in memory at once.
+CHUNK = 4096
+
+# binary columnar file: MAGIC, then one block per chunk and an empty block at
+# the end. A block is an 8 byte header length, a json header
+# {"rows": n, "columns": [[name, kind, nbytes], ...]} and the bytes of each
+# column. kinds:
+#   'q' / 'd'  raw int64 / float64 values
+#   'i' / 'f'  int64 / float64 values that fit int32 / float32 exactly
+#   's'        strings: int64 utf-8 lengths (-1 for None), then the utf-8 bytes
+#   'k'        repetitive strings: distinct count (8 bytes), the distinct
+#              strings as 's', then one int32 code per row
+#   'm'        multivalue: json {labels, sep} length (8 bytes), json, uint64 masks
+#   'j'        anything else, a json list
+MAGIC = b'CINEDASH-COL1'
+
+
+def chunks(src, rows=CHUNK):
+    # frames of at most rows rows from a frame, a csvscan or frames
+    if hasattr(src, 'batches'):
+        src = src.batches(batch=rows)
+    elif isinstance(src, dict):
+        src = [src]
+
+    for df in src:
+        if not df:
+            continue
+        l = len(df[list(df.keys())[0]])
+        if l <= rows:
+            yield df
+            continue
+        for a in range(0, l, rows):
+            yield {c: col[a:a + rows] for c, col in df.items()}
+
+
+def write_csv(src, out, rows=CHUNK, sep=','):
+    # out is a path or a text file; None cells are written empty.
+    # Returns the number of rows written
+    if isinstance(out, str):
+        with open(out, 'w', newline='', encoding='utf-8') as f:
+            return write_csv(src, f, rows, sep)
+
+    w = csv.writer(out, delimiter=sep, lineterminator='\n')
+    header = None
+    n = 0
+    for df in chunks(src, rows):
+        if header is None:
+            header = list(df.keys())
+            w.writerow(header)
+        cols = [df[c] for c in header]
+        l = len(cols[0])
+        w.writerows(['' if col[i] is None else col[i] for col in cols] for i in range(l))
+        n = n + l
+    return n
+
+
+def narrow(a):
+    # int32 / float32 when every value survives the round trip
+    if a.typecode == 'q':
+        if not len(a) or (-2 ** 31 <= min(a) and max(a) < 2 ** 31):
+            return 'i', array('i', a).tobytes()
+    else:
+        small = array('f', a)
+        if small == a:
+            return 'f', small.tobytes()
+    return a.typecode, a.tobytes()
+
+
+def encode_strings(vals):
+    parts = [None if v is None else v.encode('utf-8') for v in vals]
+    lens = array('q', [-1 if b is None else len(b) for b in parts])
+    return lens.tobytes() + b''.join(b for b in parts if b is not None)
+
+
+def encode_column(col):
+    # -> (kind, bytes) for one chunk of a column
+    if hasattr(col, 'codes') and hasattr(col, 'labels'):
+        meta = json.dumps({'labels': col.labels, 'sep': col.sep}).encode('utf-8')
+        return 'm', len(meta).to_bytes(8, 'little') + meta + array('Q', col.codes).tobytes()
+    if hasattr(col, 'to_array'):
+        col = col.to_array()
+    if isinstance(col, array) and col.typecode in 'qd':
+        return narrow(col)
+
+    vals = list(col)
+    if all(type(v) is int for v in vals) and all(-2 ** 63 <= v < 2 ** 63 for v in vals):
+        return narrow(array('q', vals))
+    if all(type(v) is float for v in vals):
+        return narrow(array('d', vals))
+    if all(v is None or isinstance(v, str) for v in vals):
+        codes = {}
+        for v in vals:
+            if v not in codes:
+                codes[v] = len(codes)
+        if len(codes) * 2 <= len(vals):
+            return 'k', (len(codes).to_bytes(8, 'little') + encode_strings(list(codes))
+                         + array('i', [codes[v] for v in vals]).tobytes())
+        return 's', encode_strings(vals)
+    return 'j', json.dumps(vals).encode('utf-8')
+
+
+def decode_strings(data, rows):
+    lens = array('q')
+    lens.frombytes(data[:rows * 8])
+    out = []
+    pos = rows * 8
+    for k in lens:
+        if k < 0:
+            out.append(None)
+        else:
+            out.append(data[pos:pos + k].decode('utf-8'))
+            pos = pos + k
+    return out, pos
+
+
+def decode_column(kind, data, rows):
+    if kind in 'qdif':
+        a = array(kind)
+        a.frombytes(data)
+        if kind == 'i':
+            return array('q', a)
+        if kind == 'f':
+            return array('d', a)
+        return a
+    if kind == 's':
+        return decode_strings(data, rows)[0]
+    if kind == 'k':
+        n = int.from_bytes(data[:8], 'little')
+        distinct, pos = decode_strings(data[8:], n)
+        codes = array('i')
+        codes.frombytes(data[8 + pos:])
+        return [distinct[c] for c in codes]
+    if kind == 'm':
+        n = int.from_bytes(data[:8], 'little')
+        meta = json.loads(data[8:8 + n].decode('utf-8'))
+        codes = array('Q')
+        codes.frombytes(data[8 + n:])
+        return multivalue(meta['labels'], codes, meta['sep'])
+    return json.loads(data.decode('utf-8'))
+
+
+def write_columnar(src, out, rows=CHUNK):
+    # out is a path or a binary file. Returns the number of rows written
+    if isinstance(out, str):
+        with open(out, 'wb') as f:
+            return write_columnar(src, f, rows)
+
+    out.write(MAGIC)
+    n = 0
+    for df in chunks(src, rows):
+        l = len(df[list(df.keys())[0]])
+        cols = []
+        blobs = []
+        for c, col in df.items():
+            kind, data = encode_column(col)
+            cols.append([c, kind, len(data)])
+            blobs.append(data)
+        head = json.dumps({'rows': l, 'columns': cols}).encode('utf-8')
+        out.write(len(head).to_bytes(8, 'little'))
+        out.write(head)
+        for data in blobs:
+            out.write(data)
+        n = n + l
+    out.write((0).to_bytes(8, 'little'))
+    return n
+
+
+def read_columnar_chunks(path):
+    # one frame per block of a write_columnar file
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a CineDash columnar file')
+        while True:
+            n = int.from_bytes(f.read(8), 'little')
+            if not n:
+                return
+            header = json.loads(f.read(n).decode('utf-8'))
+            df = {}
+            for name, kind, nbytes in header['columns']:
+                data = f.read(nbytes)
+                if len(data) != nbytes:
+                    raise ValueError(path + ' is truncated')
+                df[name] = decode_column(kind, data, header['rows'])
+            yield df
+
+
+def read_columnar(path):
+    # the whole file as one frame
+    d = None
+    for df in read_columnar_chunks(path):
+        if d is None:
+            d = df
+        else:
+            for c, col in df.items():
+                try:
+                    d[c].extend(col)
+                except TypeError:
+                    # a typed chunk followed by one with None / mixed values
+                    d[c] = list(d[c]) + list(col)
+    return d or {}
+
+
+def arrow_column(col):
+    # typed columns wrap their own buffer (no copy), genre masks become a
+    # dictionary column with each distinct mask decoded once
+    if hasattr(col, 'to_array'):
+        col = col.to_array()
+    if isinstance(col, array) and col.typecode in 'qd':
+        kind = pa.int64() if col.typecode == 'q' else pa.float64()
+        return pa.Array.from_buffers(kind, len(col), [None, pa.py_buffer(col)])
+    if hasattr(col, 'codes') and hasattr(col, 'decode'):
+        codes = {}
+        idx = array('i', [codes.setdefault(c, len(codes)) for c in col.codes])
+        labels = pa.array([col.decode(c) for c in codes], pa.string())
+        return pa.DictionaryArray.from_arrays(pa.Array.from_buffers(pa.int32(), len(idx), [None, pa.py_buffer(idx)]), labels)
+    try:
+        return pa.array(list(col))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed types, shown as text
+        return pa.array([None if v is None else str(v) for v in col], pa.string())
+
+
+def to_arrow(df, cols=None):
+    # a frame as one columnar object for table widgets: a pyarrow Table when
+    # pyarrow is installed, otherwise a {column: list} mapping
+    if cols is None:
+        cols = list(df.keys())
+    if pa is None:
+        return {c: list(df[c]) for c in cols}
+    return pa.table({c: arrow_column(df[c]) for c in cols})
@@ -0,0 +1,276 @@
+import re
+from operator import eq, ne, gt, lt, ge, le
+
+from engine.cancel import current_query
+
+# boolean filter expressions for functions.where():
+#   all_of(pred('rating', '>=', 4), any_of(pred('year', '<', 1980), negate(pred('genres', '=', 'drama'))))
+# Every node evaluates on a list of row positions and returns the ones that
+# match, so an AND only looks at the rows its earlier branches kept and an OR
+# only at the rows its earlier branches have not matched yet. Branches run
+# most selective first (AND) / least selective first (OR), estimated on a
+# small sample of the frame.
+
+COMPARE = {'=': eq, '!=': ne, '>': gt, '<': lt, '>=': ge, '<=': le}
+
+# value is a list of values / a (low, high) pair / a string / a pattern
+SET_OPS = ['in', 'between', 'prefix', 'like']
+
+# rows looked at to estimate how selective a predicate is
+SAMPLE = 256
+
+
+def sample_rows(n):
+    step = max(1, n // SAMPLE)
+    return range(0, n, step)
+
+
+def lowered(v):
+    return v.lower() if isinstance(v, str) else v
+
+
+def like_regex(pattern):
+    # SQL LIKE: % any run of characters, _ exactly one
+    parts = []
+    for ch in pattern.lower():
+        if ch == '%':
+            parts.append('.*')
+        elif ch == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(ch))
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+def like_prefix(pattern):
+    # literal text before the first wildcard, narrows a LIKE through an index
+    for k, ch in enumerate(pattern):
+        if ch in '%_':
+            return pattern[:k]
+    return pattern
+
+
+class pred:
+
+    # column <op> value; strings compare case-insensitively, like filter().
+    # op is one of = != > < >= <= or
+    #   'in'       value is a list of values
+    #   'between'  value is (low, high), both ends included
+    #   'prefix'   value is the text the (string) cell starts with
+    #   'like'     value is a SQL LIKE pattern with % and _
+    def __init__(self, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def check(self, df):
+        if self.op not in COMPARE and self.op not in SET_OPS:
+            return 'invalid condition'
+        if self.column not in df:
+            return 'Column ' + str(self.column) + ' not found'
+        if self.op == 'between' and (not isinstance(self.value, (list, tuple)) or len(self.value) != 2):
+            return 'between needs a (low, high) pair'
+        if self.op == 'in' and not isinstance(self.value, (list, tuple, set, frozenset)):
+            return 'in needs a list of values'
+        if self.op in ['prefix', 'like'] and not isinstance(self.value, str):
+            return self.op + ' needs a text value'
+        return None
+
+    def columns(self):
+        return [self.column]
+
+    def matcher(self):
+        op = self.op
+        if op == 'in':
+            vals = set(lowered(v) for v in self.value)
+            return lambda x: lowered(x) in vals
+        if op == 'between':
+            low, high = lowered(self.value[0]), lowered(self.value[1])
+            return lambda x: low <= lowered(x) <= high
+        if op == 'prefix':
+            text = self.value.lower()
+            return lambda x: isinstance(x, str) and x.lower().startswith(text)
+        if op == 'like':
+            rx = like_regex(self.value)
+            return lambda x: isinstance(x, str) and rx.fullmatch(x.lower()) is not None
+
+        op = COMPARE[op]
+        val = self.value
+        if isinstance(val, str):
+            val = val.lower()
+
+            def match(x):
+                if isinstance(x, str):
+                    x = x.lower()
+                return op(x, val)
+            return match
+        return lambda x: op(x, val)
+
+    def probe(self, index):
+        # candidate positions from an index on the column, None when the
+        # index cannot answer this predicate. Every candidate still goes
+        # through matcher() except for exact answers (= / in / between)
+        op = self.op
+        if op not in ['=', 'in', 'between', 'prefix', 'like']:
+            return None, False
+        vals = self.value if op in ['in', 'between'] else [self.value]
+        # sorted indexes keep the original case unless built with lower=True
+        if getattr(index, 'lower', True) is False and any(isinstance(v, str) for v in vals):
+            return None, False
+        if op == '=':
+            return index.lookup(self.value), True
+        if op == 'in':
+            return index.lookup_many(self.value), True
+        if not hasattr(index, 'between'):
+            return None, False
+        if op == 'between':
+            return index.between(self.value[0], self.value[1]), True
+        if op == 'prefix':
+            return index.prefix(self.value), True
+        if op == 'like' and like_prefix(self.value):
+            return index.prefix(like_prefix(self.value)), False
+        return None, False
+
+    def eval(self, df, rows, vec=None, indexes=None):
+        q = current_query()
+        if q is not None:
+            q.check('filter', rows=len(rows))
+        col = df[self.column]
+        index = (indexes or {}).get(self.column)
+        hits = None
+        if index is not None and len(index) == len(col):
+            hits, exact = self.probe(index)
+
+        # a vectorized scan beats sorting a large share of the rows out of
+        # an index
+        if vec is not None and self.op in ['=', '!=', '>', '<', '>=', '<=', 'in', 'between'] and (
+                hits is None or len(hits) * 8 > len(col)):
+            fast = vec.compare_positions(col, self.op, self.value, rows)
+            if fast is not None:
+                return fast
+
+        match = self.matcher()
+        if hits is not None:
+            hits = sorted(hits)
+            if not exact:
+                hits = [i for i in hits if match(col[i])]
+            if isinstance(rows, range) and rows == range(len(col)):
+                return hits
+            keep = set(hits)
+            return [i for i in rows if i in keep]
+        return [i for i in rows if match(col[i])]
+
+    def estimate(self, df):
+        col = df[self.column]
+        rows = sample_rows(len(col))
+        if not len(rows):
+            return 1.0
+        match = self.matcher()
+        try:
+            return sum(1 for i in rows if match(col[i])) / len(rows)
+        except TypeError:
+            return 1.0
+
+    def __str__(self):
+        if self.op == 'between':
+            return f'{self.column} BETWEEN {self.value[0]!r} AND {self.value[1]!r}'
+        if self.op == 'in':
+            return f'{self.column} IN ({", ".join(map(repr, self.value))})'
+        return f'{self.column} {self.op.upper() if self.op in SET_OPS else self.op} {self.value!r}'
+
+
+class all_of:
+
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def check(self, df):
+        for c in self.children:
+            err = c.check(df)
+            if err:
+                return err
+        return None
+
+    def columns(self):
+        return [col for c in self.children for col in c.columns()]
+
+    def eval(self, df, rows, vec=None, indexes=None):
+        # most selective branch first, each one on the survivors only
+        for c in sorted(self.children, key=lambda c: c.estimate(df)):
+            if not rows:
+                break
+            rows = c.eval(df, rows, vec, indexes)
+        return rows
+
+    def estimate(self, df):
+        s = 1.0
+        for c in self.children:
+            s = s * c.estimate(df)
+        return s
+
+    def __str__(self):
+        return '(' + ' AND '.join(map(str, self.children)) + ')' if self.children else 'TRUE'
+
+
+class any_of:
+
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def check(self, df):
+        for c in self.children:
+            err = c.check(df)
+            if err:
+                return err
+        return None
+
+    def columns(self):
+        return [col for c in self.children for col in c.columns()]
+
+    def eval(self, df, rows, vec=None, indexes=None):
+        # broadest branch first; later branches only see the rows that
+        # nothing has matched yet
+        if not self.children:
+            return rows
+        hit = set()
+        rest = rows
+        for c in sorted(self.children, key=lambda c: -c.estimate(df)):
+            if not rest:
+                break
+            got = c.eval(df, rest, vec, indexes)
+            if got:
+                hit.update(got)
+                got = set(got)
+                rest = [i for i in rest if i not in got]
+        return [i for i in rows if i in hit]
+
+    def estimate(self, df):
+        miss = 1.0
+        for c in self.children:
+            miss = miss * (1.0 - c.estimate(df))
+        return 1.0 - miss if self.children else 1.0
+
+    def __str__(self):
+        return '(' + ' OR '.join(map(str, self.children)) + ')' if self.children else 'TRUE'
+
+
+class negate:
+
+    def __init__(self, child):
+        self.child = child
+
+    def check(self, df):
+        return self.child.check(df)
+
+    def columns(self):
+        return self.child.columns()
+
+    def eval(self, df, rows, vec=None, indexes=None):
+        got = set(self.child.eval(df, rows, vec, indexes))
+        return [i for i in rows if i not in got]
+
+    def estimate(self, df):
+        return 1.0 - self.child.estimate(df)
+
+    def __str__(self):
+        return 'NOT ' + str(self.child)
@@ -0,0 +1,66 @@
+from bisect import bisect_right
+
+# histogram bins of a column, described by their edges e0 < e1 < ... < en:
+# bin k holds e_k <= v < e_k+1, the last bin also its upper edge, values
+# outside [e0, en] and None fall in no bin. Kinds of bins
+#   width     n bins of equal width from low to high (default the
+#             column's min / max)
+#   edges     the edges are given
+#   quantile  n bins holding about as many rows each; a value is never
+#             split across two bins, so heavy ties leave fewer bins
+KINDS = ['width', 'edges', 'quantile']
+
+
+def bin_edges(col, bins=10, kind='width', low=None, high=None):
+    # the edges for col, or an error message
+    if kind not in KINDS:
+        return 'Not a valid bin kind, choose from : ' + ', '.join(KINDS)
+
+    if kind == 'edges':
+        try:
+            edges = list(bins)
+        except TypeError:
+            edges = None
+        if edges is None or any(isinstance(b, bool) or not isinstance(b, (int, float)) for b in edges):
+            return 'bin edges need a list of increasing numbers'
+        if len(edges) < 2 or any(b <= a for a, b in zip(edges, edges[1:])):
+            return 'bin edges need at least two increasing values'
+        return edges
+
+    if isinstance(bins, bool) or not isinstance(bins, int) or bins < 1:
+        return 'the number of bins must be a positive integer'
+    try:
+        vals = [v for v in col if v is not None]
+        if kind == 'quantile':
+            vals.sort()
+        else:
+            lo = min(vals) if low is None and vals else low
+            hi = max(vals) if high is None and vals else high
+    except TypeError:
+        return 'Datatype error check the histogram column, type usage!'
+    if not vals and (kind == 'quantile' or lo is None or hi is None):
+        return 'no values to bin in the histogram column'
+
+    if kind == 'quantile':
+        n = len(vals)
+        edges = [vals[k * (n - 1) // bins] for k in range(bins)] + [vals[-1]]
+        edges = sorted(set(edges))
+        return edges if len(edges) > 1 else [edges[0], edges[0]]
+
+    try:
+        if hi < lo:
+            return 'the histogram range needs low <= high'
+        if hi == lo:
+            # one value: a single bin holding it
+            return [lo, hi]
+        w = (hi - lo) / bins
+        return [lo + k * w for k in range(bins)] + [hi]
+    except TypeError:
+        return 'Datatype error check the histogram column, type usage!'
+
+
+def bin_of(edges, v):
+    # bin number of v, -1 when v is in no bin
+    if v is None or v < edges[0] or v > edges[-1]:
+        return -1
+    return min(bisect_right(edges, v) - 1, len(edges) - 2)
@@ -0,0 +1,125 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+# sorts after every other character, closes a prefix range
+MAX_CHAR = '\U0010ffff'
+
+
+def lowered(v):
+    return v.lower() if isinstance(v, str) else v
+
+
+class sortedindex:
+
+    # keys of one column in sorted order, with the row position of each key,
+    # so range lookups only touch the rows that fall inside the range.
+    # lower=True keys a string column by its lowercased values, for the
+    # case-insensitive filters (=, in, between, prefix, like)
+    def __init__(self, df, column, lower=False):
+        vals = df[column]
+        if lower:
+            vals = [lowered(v) for v in vals]
+        order = sorted(range(len(vals)), key=vals.__getitem__)
+
+        self.column = column
+        self.lower = lower
+        if isinstance(vals, array):
+            self.keys = array(vals.typecode, [vals[i] for i in order])
+        else:
+            self.keys = [vals[i] for i in order]
+        self.positions = array('q', order)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bounds(self, low=None, high=None):
+        # [low, high) half open, like a time window
+        if low is None:
+            lo = 0
+        else:
+            lo = bisect_left(self.keys, low)
+
+        if high is None:
+            hi = len(self.keys)
+        else:
+            hi = bisect_left(self.keys, high)
+
+        return lo, max(lo, hi)
+
+    def range(self, low=None, high=None):
+        lo, hi = self.bounds(low, high)
+        return self.positions[lo:hi]
+
+    def lookup(self, value):
+        if self.lower:
+            value = lowered(value)
+        lo = bisect_left(self.keys, value)
+        hi = bisect_right(self.keys, value)
+        return self.positions[lo:hi]
+
+    def lookup_many(self, values):
+        out = []
+        for v in set(values):
+            out.extend(self.lookup(v))
+        return out
+
+    def between(self, low, high):
+        # [low, high] closed, like SQL BETWEEN
+        if self.lower:
+            low, high = lowered(low), lowered(high)
+        lo = bisect_left(self.keys, low)
+        hi = bisect_right(self.keys, high)
+        return self.positions[lo:max(lo, hi)]
+
+    def prefix(self, text):
+        # string keys starting with text
+        if self.lower:
+            text = text.lower()
+        lo = bisect_left(self.keys, text)
+        hi = bisect_left(self.keys, text + MAX_CHAR)
+        return self.positions[lo:max(lo, hi)]
+
+    def min(self):
+        return self.keys[0] if self.keys else None
+
+    def max(self):
+        return self.keys[-1] if self.keys else None
+
+
+class hashindex:
+
+    # row positions of every distinct key of one column, for = and IN
+    # probes. String keys are lowercased, like the filters compare them
+    def __init__(self, df, column):
+        vals = df[column]
+        rows = {}
+        for i, v in enumerate(vals):
+            v = lowered(v)
+            if v in rows:
+                rows[v].append(i)
+            else:
+                rows[v] = array('q', [i])
+
+        self.column = column
+        self.rows = rows
+        self.length = len(vals)
+        self.first = None
+
+    def __len__(self):
+        return self.length
+
+    def lookup(self, value):
+        return self.rows.get(lowered(value), array('q'))
+
+    def first_rows(self):
+        # key -> position of its first row, for derived lookups; built on
+        # first use and kept with the index
+        if self.first is None:
+            self.first = {v: rows[0] for v, rows in self.rows.items()}
+        return self.first
+
+    def lookup_many(self, values):
+        out = []
+        for v in set(lowered(v) for v in values):
+            out.extend(self.rows.get(v, ()))
+        return out
@@ -0,0 +1,94 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+class backgroundloader:
+
+    # runs named load steps one after another in a daemon thread, so a caller
+    # can use each result as soon as it is built instead of waiting for all
+    # steps = [(name, label, fn)], fn gets the loader and reads the results
+    # built so far with get(); on_done(loader) is called once all steps ran
+    def __init__(self, steps, on_done=None):
+        self.steps = steps
+        self.on_done = on_done
+        self.results = {}
+        self.errors = {}
+        self.current = None
+        self.cond = threading.Condition()
+        self.thread = None
+        self.pool = None
+
+    def start(self):
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='cinedash-loader', daemon=True
+                )
+                self.thread.start()
+        return self
+
+    def run(self):
+        for name, label, fn in self.steps:
+            with self.cond:
+                self.current = label
+
+            try:
+                res = fn(self)
+            except Exception as e:  # later steps depend on this one, stop here
+                with self.cond:
+                    self.errors[name] = f'{label} failed: {e!r}'
+                    self.current = None
+                    self.cond.notify_all()
+                break
+
+            with self.cond:
+                self.results[name] = res
+                self.cond.notify_all()
+
+        with self.cond:
+            self.current = None
+            self.cond.notify_all()
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+        if self.on_done is not None:
+            self.on_done(self)
+
+    def remote(self, fn, *args, **kwargs):
+        # run fn in a lower priority worker process; the loader thread only
+        # waits for the pickled result, so heavy parsing does not hold the
+        # GIL (or the CPU) that the app's own threads need to render
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=1, mp_context=get_context('spawn'),
+                initializer=os.nice if hasattr(os, 'nice') else None,
+                initargs=(10,),
+            )
+        return self.pool.submit(fn, *args, **kwargs).result()
+
+    def ready(self, *names):
+        with self.cond:
+            return all(n in self.results for n in names)
+
+    def get(self, name):
+        with self.cond:
+            return self.results.get(name)
+
+    def finished(self):
+        with self.cond:
+            return bool(self.errors) or len(self.results) == len(self.steps)
+
+    def progress(self):
+        # (fraction of steps done, label of the step running now)
+        with self.cond:
+            return len(self.results) / len(self.steps), self.current
+
+    def wait(self, name, timeout=None):
+        with self.cond:
+            self.cond.wait_for(
+                lambda: name in self.results or bool(self.errors), timeout
+            )
+            return self.results.get(name)
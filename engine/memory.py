@@ -0,0 +1,76 @@
+import os
+import sys
+from array import array
+
+# rough per-row cost of a hash table entry (dict slot, row index list slot,
+# boxed row index) and of one sort buffer entry, used to size operator state
+HASH_ROW_BYTES = 120
+SORT_ROW_BYTES = 72
+
+class memorybudget:
+
+    # engine wide cap on the memory an operator may use for its intermediate
+    # state (join hash table, groupby groups, sort buffer). None = no cap.
+    # Operators whose estimated state is over the cap spill to temp files.
+    def __init__(self, limit=None):
+        self.limit = limit
+
+    def set_limit(self, nbytes):
+        self.limit = nbytes
+
+    def exceeds(self, nbytes):
+        return self.limit is not None and nbytes > self.limit
+
+    def partitions(self, nbytes):
+        # enough partitions that one partition's state fits, with headroom
+        if not self.limit:
+            return 1
+        return min(256, max(2, 2 * (nbytes // self.limit + 1)))
+
+    def value_bytes(self, v):
+        if isinstance(v, tuple):
+            return sys.getsizeof(v) + sum(self.value_bytes(x) for x in v)
+        return sys.getsizeof(v)
+
+    def column_bytes(self, col):
+        if hasattr(col, 'memory_usage'):
+            return col.memory_usage()
+        if isinstance(col, array):
+            return sys.getsizeof(col)
+
+        # container plus every distinct object it points to; small ints and
+        # repeated strings are shared, so they are only counted once
+        total = sys.getsizeof(col)
+        seen = set()
+        for v in col:
+            if id(v) not in seen:
+                seen.add(id(v))
+                total = total + sys.getsizeof(v)
+        return total
+
+    def key_bytes(self, df, columns, sample=256):
+        # average size of a key tuple, from the first rows of the frame
+        if not columns or not df:
+            return 0
+        cols = [df[c] for c in columns]
+        n = min(sample, len(cols[0]))
+        if n == 0:
+            return 0
+        total = 0
+        for i in range(n):
+            total = total + self.value_bytes(tuple(c[i] for c in cols))
+        return total // n
+
+    def hash_state_bytes(self, df, columns, rows):
+        return rows * (HASH_ROW_BYTES + self.key_bytes(df, columns))
+
+    def sort_state_bytes(self, rows):
+        return rows * SORT_ROW_BYTES
+
+
+def _env_limit():
+    mb = os.environ.get('CINEDASH_MEMORY_BUDGET_MB')
+    return int(float(mb) * 1024 * 1024) if mb else None
+
+
+budget = memorybudget(_env_limit())
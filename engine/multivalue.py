@@ -0,0 +1,106 @@
+import sys
+import threading
+from array import array
+
+# MovieLens genre vocabulary, in the order the genres appear in movies.csv,
+# so a decoded bitmask gives back the original "A|B|C" string
+MOVIELENS_GENRES = [
+    'Action', 'Adventure', 'Animation', 'Children', 'Comedy', 'Crime',
+    'Documentary', 'Drama', 'Fantasy', 'Film-Noir', 'Horror', 'Musical',
+    'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western', 'IMAX',
+    '(no genres listed)',
+]
+
+class multivalue:
+
+    # multi valued string column ("Adventure|Animation|Children") stored as
+    # one 64 bit mask per row over a small label vocabulary. Reading a row
+    # gives the joined string back, so the column drops into any frame;
+    # label predicates are single bitwise ops on the codes.
+    def __init__(self, labels=None, codes=None, sep='|'):
+        self.labels = list(labels or [])
+        self.bits = {l: 1 << k for k, l in enumerate(self.labels)}
+        self.codes = codes if codes is not None else array('Q')
+        self.sep = sep
+        # decode memo: single key inserts of a value every thread agrees on,
+        # safe to share without a lock. New labels are added under the lock
+        self.decoded = {0: ''}
+        self.lock = threading.Lock()
+
+    def code(self, value):
+        c = 0
+        if not value:
+            return c
+        for part in value.split(self.sep):
+            bit = self.bits.get(part)
+            if bit is None:
+                bit = self.add_label(part)
+            c = c | bit
+        return c
+
+    def add_label(self, label):
+        with self.lock:
+            bit = self.bits.get(label)
+            if bit is None:
+                if len(self.labels) >= 64:
+                    raise ValueError('multivalue column holds at most 64 distinct labels')
+                bit = 1 << len(self.labels)
+                self.labels.append(label)
+                self.bits[label] = bit
+        return bit
+
+    def decode(self, c):
+        s = self.decoded.get(c)
+        if s is None:
+            s = self.sep.join(self.labels_of(c))
+            self.decoded[c] = s
+        return s
+
+    def labels_of(self, c):
+        return [l for l in self.labels if c & self.bits[l]]
+
+    def mask(self, labels):
+        # unknown labels match nothing
+        m = 0
+        for l in labels:
+            m = m | self.bits.get(l, 0)
+        return m
+
+    def append(self, value):
+        self.codes.append(self.code(value))
+
+    def extend(self, values):
+        if isinstance(values, multivalue) and values.labels == self.labels[:len(values.labels)]:
+            self.codes.extend(values.codes)
+        else:
+            self.codes.extend(map(self.code, values))
+
+    def take(self, idx):
+        codes = self.codes
+        return multivalue(self.labels, array('Q', [codes[i] for i in idx]), self.sep)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return multivalue(self.labels, self.codes[i], self.sep)
+        return self.decode(self.codes[i])
+
+    def __iter__(self):
+        return map(self.decode, self.codes)
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        del d['lock']
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f'multivalue({list(self)!r})'
+
+    def memory_usage(self):
+        return sys.getsizeof(self.codes) + sum(sys.getsizeof(l) for l in self.labels)
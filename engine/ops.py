@@ -1,7 +1,45 @@
-import copy
+import heapq
+from array import array
+from datetime import date, timedelta
+
+from engine.backend import default as default_backend, resolve as resolve_backend
+from engine.cancel import current_query, stoppable
+from engine.derived import lazycolumn, FUNCS as DERIVED_FUNCS
+from engine.encoding import COMPARE as ENCODED_COMPARE
+from engine.expr import pred, SET_OPS
+from engine.histogram import bin_edges, bin_of
+from engine.memory import budget, SORT_ROW_BYTES
+from engine.multivalue import multivalue, MOVIELENS_GENRES
+from engine.sampling import STRATUM, z_value, stratum_variance
+from engine.spill import spillfile, partitionset
+
+class reversedkey:
+
+    # inverts the order of a value inside a heap (for asc top_n)
+    __slots__ = ('v',)
+
+    def __init__(self, v):
+        self.v = v
+
+    def __lt__(self, other):
+        return other.v < self.v
+
+    def __eq__(self, other):
+        return self.v == other.v
 
 class functions:
 
+    # backend=None follows the global default (engine.backend.set_backend /
+    # CINEDASH_BACKEND); 'python' is the reference implementation, 'numpy'
+    # vectorizes typed columns and falls back to python for everything else
+    def __init__(self, backend=None):
+        if backend is not None:
+            resolve_backend(backend)
+        self.backend = backend
+
+    def vec(self):
+        return resolve_backend(self.backend or default_backend['name'])
+
     def df_len(self,df):
         
         return len(df[list(df.keys())[0]])
@@ -37,27 +75,100 @@ class functions:
         return d
     
     def set_index(self,df):
-        df = copy.deepcopy(df)
+        df = dict(df)
         l = self.df_len(df)
         df['index'] = [i for i in range(l)]
 
         return df
 
+    def take(self, df, idx):
+        d = {}
+        for c in df.keys():
+            d[c] = self.take_column(df[c], idx)
+
+        return d
+
+    def take_column(self, col, idx):
+        # encoded columns (multivalue) gather their codes and stay encoded
+        if hasattr(col, 'take'):
+            return col.take(idx)
+        vec = self.vec()
+        if vec is not None:
+            out = vec.take_column(col, idx)
+            if out is not None:
+                return out
+        if isinstance(col, array):
+            return array(col.typecode, [col[i] for i in idx])
+        return [col[i] for i in idx]
+
+
+    def derive(self, df, name, func, columns=(), arg=None):
+        # the frame plus a derived column (engine.derived), computed on first
+        # use; the other columns are shared, not copied
+        if func not in DERIVED_FUNCS:
+            return 'Not a valid derived column function, choose from : ' + ', '.join(DERIVED_FUNCS)
+        for c in columns:
+            if c not in df:
+                return 'Column not found : ' + str(c)
+        if not df:
+            return {name: []}
+        d = dict(df)
+        d[name] = lazycolumn(d, func, columns, arg)
+        return d
+
+    def resolve(self, df, columns):
+        # derived columns among columns swapped for their computed values,
+        # so the row loops index plain columns. The base columns are read
+        # from df, a copy with a base column replaced does not see stale values
+        if not any(isinstance(df.get(c), lazycolumn) for c in columns):
+            return df
+        d = dict(df)
+        for c in columns:
+            if isinstance(d.get(c), lazycolumn):
+                d[c] = d[c].values(df)
+        return d
     
-    def filter(self,df,columns,conditions,values,seperators=[]):
-        df = copy.deepcopy(df)
+    @stoppable
+    def filter(self,df,columns,conditions,values,seperators=[],indexes=None):
+        df = self.resolve(df, columns)
+        # per run / block answers for plain comparisons on compressed columns;
+        # in / between / prefix / like and index probes take the paths below
+        if (columns and all(hasattr(df[c], 'positions') for c in columns)
+                and all(cond in ENCODED_COMPARE for cond in conditions)
+                and not any(c in (indexes or {}) for c in columns)):
+            return self.encoded_filter(df, columns, conditions, values, seperators)
+
         df = self.set_index(df) 
+        q = current_query()
 
         d = {}
         all_idx = list(df['index'])
         if len(seperators) < len(columns):
             seperators = seperators + ['and'] * (len(columns) - len(seperators))
+
+        vec = self.vec()
+        fast = None if vec is None else vec.filter_positions(df, columns, conditions, values, seperators)
+        if fast is not None:
+            columns = []
+            all_idx = fast
+
         for col,cond,val,sep in zip(columns,conditions,values,seperators):
 
             cur_col_values = df[col]
             
             cur_idx = []
+            # in / between / prefix / like, and probes of a given index
+            if cond in SET_OPS or (indexes and col in indexes and cond == '='):
+                p = pred(col, cond, val)
+                err = p.check(df)
+                if err:
+                    return err
+                cur_idx = p.eval(df, range(len(cur_col_values)), vec, indexes)
+                cur_col_values = []
+
             for i,j in enumerate(cur_col_values):
+                if q is not None:
+                    q.tick('filter', i, len(cur_col_values))
                 if col not in ['movieId','year','userId','rating']:
                     try:
                         j = j.lower()
@@ -94,42 +205,98 @@ class functions:
 
             if sep.lower() == 'and':
                 for i in all_idx[:]:
+                    if q is not None:
+                        q.tick('filter')
                     if i not in cur_idx:
                         all_idx.remove(i)
             
             if sep.lower() == 'or':
                 for i in cur_idx:
+                    if q is not None:
+                        q.tick('filter')
                     if i not in all_idx:
                         all_idx.append(i)
 
         all_idx.sort()
+        if q is not None:
+            q.check('filter', rows=len(all_idx))
 
         for c in df.keys():
-            if c!='index':
-
-                for i in all_idx:
-                    d.setdefault(c,[]).append(df[c][i])
+            if c!='index' and all_idx:
+                d[c] = self.take_column(df[c], all_idx)
 
         return d
 
+    def encoded_filter(self, df, columns, conditions, values, seperators):
+        # conditions on compressed columns (engine.encoding) only: each one
+        # is answered per run / block, then combined left to right like the
+        # row by row filter. rows None stands for every row
+        q = current_query()
+        if len(seperators) < len(columns):
+            seperators = seperators + ['and'] * (len(columns) - len(seperators))
+        rows = None
+        for col, cond, val, sep in zip(columns, conditions, values, seperators):
+            if q is not None:
+                q.check('filter')
+            cur = df[col].positions(cond, val)
+            if isinstance(cur, str):
+                return cur
+            if sep.lower() == 'and':
+                rows = cur if rows is None else sorted(set(rows).intersection(cur))
+            elif sep.lower() == 'or' and rows is not None:
+                rows = sorted(set(rows).union(cur))
+        if rows is None:
+            rows = range(self.df_len(df))
+        if q is not None:
+            q.check('filter', rows=len(rows))
+        if not rows:
+            return {}
+        return self.take(df, rows)
+
+    @stoppable
+    def where(self, df, expr, indexes=None):
+        # filter with an engine.expr tree (all_of / any_of / negate / pred);
+        # branches only look at the rows still undecided. indexes maps a
+        # column to a hashindex / sortedindex built on this same frame
+        err = expr.check(df)
+        if err:
+            return err
+        df = self.resolve(df, expr.columns())
+        rows = expr.eval(df, range(self.df_len(df)), self.vec(), indexes)
+        q = current_query()
+        if q is not None:
+            q.check('filter', rows=len(rows))
+        if not rows:
+            return {}
+        return self.take(df, list(rows))
+
+    @stoppable
     def order_rows(self,df,cols,type='asc',limit=None):
-        df = copy.deepcopy(df)
-        df = df 
         if type == 'dsc':
+            df = self.resolve(df, cols)
             d= {}
-            for c in cols:
+            q = current_query()
+            vec = self.vec()
+            if vec is not None and limit and cols and (len(cols) == 1 or limit <= self.df_len(df)):
+                # only the first limit rows of the first sort are kept
+                idx = vec.sorted_positions(df[cols[0]], reverse=True, limit=limit)
+                if idx is not None:
+                    return self.head(self.take(df, idx) if idx else {}, limit)
+
+            for k, c in enumerate(cols):
+                if q is not None:
+                    q.check('order_rows', k, len(cols))
                 cur_col_vals = df[c]
-                idx_d = {}
-                for i,j in enumerate(cur_col_vals):
-                    idx_d[i] = j 
-                
-                idx = dict(sorted(idx_d.items(), key=lambda x:x[1],reverse=True))
-                #print(idx)
-                idx = list(idx.keys())
-                #print(idx)
+                idx = None
+                if vec is not None:
+                    idx = vec.sorted_positions(cur_col_vals, reverse=True)
+                if idx is None:
+                    idx = self.sorted_positions(cur_col_vals, reverse=True)
                 for c in df.keys():
-                    for i in idx:
-                        d.setdefault(c,[]).append(df[c][i])
+                    if c in d:
+                        d[c].extend(self.take_column(df[c], idx))
+                    elif idx:
+                        d[c] = self.take_column(df[c], idx)
             if limit:
                 d = self.head(d,limit)
 
@@ -137,100 +304,417 @@ class functions:
         else:
             
             return df
+
+    def sorted_positions(self, vals, reverse=False):
+        # row positions ordered by value (stable); when the sort buffer would
+        # go over the memory budget, sort budget sized runs, spill each run to
+        # a temp file and merge them back (external merge sort)
+        l = len(vals)
+        if not budget.exceeds(budget.sort_state_bytes(l)):
+            return sorted(range(l), key=vals.__getitem__, reverse=reverse)
+
+        run_rows = max(1, budget.limit // SORT_ROW_BYTES)
+        runs = []
+        q = current_query()
+        try:
+            for start in range(0, l, run_rows):
+                if q is not None:
+                    q.check('order_rows', start, l)
+                run = sorted(range(start, min(l, start + run_rows)), key=vals.__getitem__, reverse=reverse)
+                f = spillfile()
+                for i in run:
+                    f.append((vals[i], i))
+                runs.append(f)
+                run = None
+
+            # heapq.merge is stable across runs, and earlier runs hold earlier
+            # rows, so ties keep input order just like sorted()
+            return [i for _, i in heapq.merge(*runs, key=lambda r: r[0], reverse=reverse)]
+        finally:
+            for f in runs:
+                f.close()
         
     
-    def groupby(self, df, groupby_columns, agg_column, agg_type):
-        
-        groups = {}
+    @stoppable
+    def groupby(self, df, groupby_columns, agg_column, agg_type, bins=10):
+        # agg_type 'hist' gives every group a list of counts per bin of each
+        # aggregation column; bins is a number of equal width bins over the
+        # whole column or a list of edges, the same bins for every group
+        df = self.resolve(df, list(groupby_columns) + list(agg_column))
         l = self.df_len(df)
+        d = {}
+        q = current_query()
+
+        edges = None
+        if agg_type == 'hist':
+            edges = {}
+            for a_col in agg_column:
+                if a_col not in df:
+                    return 'Column not found : ' + str(a_col)
+                e = bin_edges(df[a_col], bins, 'width' if isinstance(bins, int) else 'edges')
+                if isinstance(e, str):
+                    return e
+                edges[a_col] = e
+
+        if len(groupby_columns) == 1 and hasattr(df[groupby_columns[0]], 'runs') and edges is None:
+            return self.runs_groupby(df, groupby_columns[0], agg_column, agg_type)
+
+        if budget.exceeds(budget.hash_state_bytes(df, groupby_columns, l)):
+            return self.spilled_groupby(df, groupby_columns, agg_column, agg_type, l, edges)
+
+        vec = self.vec()
+        if vec is not None:
+            fast = vec.groupby(df, groupby_columns, agg_column, agg_type, edges)
+            if fast is not None:
+                if q is not None:
+                    q.check('groupby', rows=len(fast[groupby_columns[0]]))
+                return fast
+
+        groups = {}
 
         for i in range(l):
+            if q is not None:
+                q.tick('groupby', i, l, len(groups))
 
             cur_row = []
             for c in groupby_columns:
                 cur_row.append(df[c][i])
 
             groups.setdefault(tuple(cur_row), []).append(i) # cur_row-values tuple : idx where it occured 
-       
-        d = {}
         
+        if q is not None:
+            q.check('groupby', l, l, len(groups))
         for col, val_idx in groups.items():
+            if q is not None:
+                q.tick('groupby', step=len(val_idx))
             for i, col_name in enumerate(groupby_columns):
                 d.setdefault(col_name, []).append(col[i]) 
-                
-
-            try:
-                for a_col in agg_column:
-                    agg_data = []
-                    for idx in val_idx:
-                        agg_data.append(df[a_col][idx])
 
+            aggs = self.aggregate(df, val_idx, agg_column, agg_type, edges)
+            if isinstance(aggs, str):
+                return aggs
+            for name, val in aggs:
+                d.setdefault(name, []).append(val)
 
-                    if agg_type == 'count':
-                        cnt = 0
-                        for i in agg_data:
-                            cnt = cnt + 1 
-                        d.setdefault(a_col+'_count',[]).append(cnt)
-                    
-                    elif agg_type == 'sum':
-                        su = 0
-                        for i in agg_data:
-                            try:
-                                su = su + i
-                            except TypeError: # Handle mixed types
-                                su = su + float(i) 
-                        d.setdefault(a_col + '_sum', []).append(su)
-
-                    elif agg_type == 'avg':
-                        su = 0
-                        cnt = 0
-                        
-                        for i in agg_data:
-                            cnt = cnt + 1 
-                            try:
-                                su = su + i
-                            except TypeError:
-                                su = su + float(i)
-
-                        if cnt<1:
-                            # return 'no records found to calcuate the average, zero divide error!'
-                            d.setdefault(a_col+'_avg',[]).append(0) # Safer return
-                        else:
-                            d.setdefault(a_col+'_avg',[]).append(su/cnt)
+        return d 
 
+    def runs_groupby(self, df, column, agg_column, agg_type):
+        # groupby on a run length encoded column: one group update per run,
+        # counts cost O(runs); other aggregates read the rows of each run
+        # in row order, so results match the row by row groupby
+        if agg_type not in ['count', 'sum', 'avg', 'min', 'max']:
+            return 'Not a valid aggregation type, choose from : sum, count, min, max, avg'
+        q = current_query()
+        groups = {}  # value : [rows, per agg column state]
+        try:
+            for v, s, e in df[column].runs():
+                if q is not None:
+                    q.tick('groupby', s, len(df[column]), len(groups), step=e - s)
+                g = groups.get(v)
+                if g is None:
+                    g = groups[v] = [0] + [None] * len(agg_column)
+                g[0] = g[0] + e - s
+                if agg_type == 'count':
+                    continue
+                for k, a_col in enumerate(agg_column):
+                    cur = g[k + 1]
+                    vals = df[a_col][s:e]
+                    if agg_type in ['sum', 'avg']:
+                        if cur is None:
+                            cur = 0
+                        for x in vals:
+                            cur = cur + x
                     elif agg_type == 'min':
-                        if not agg_data:
-                            min_val = None
-                        else:
-                            min_val = agg_data[0]
-                        for i in agg_data:
-                            if i<min_val:
-                                min_val = i 
-                        d.setdefault(a_col + '_min', []).append(min_val)
+                        m = min(vals)
+                        cur = m if cur is None or m < cur else cur
+                    else:
+                        m = max(vals)
+                        cur = m if cur is None or m > cur else cur
+                    g[k + 1] = cur
+        except (TypeError, ValueError):
+            return 'Datatype error check the aggregation columns, type usage!'
+
+        if q is not None:
+            q.check('groupby', rows=len(groups))
+        d = {column: list(groups)}
+        for k, a_col in enumerate(agg_column):
+            if agg_type == 'count':
+                d[a_col + '_count'] = [g[0] for g in groups.values()]
+            elif agg_type == 'avg':
+                d[a_col + '_avg'] = [g[k + 1] / g[0] for g in groups.values()]
+            else:
+                d[a_col + '_' + agg_type] = [g[k + 1] for g in groups.values()]
+        return d
+
+    def spilled_groupby(self, df, groupby_columns, agg_column, agg_type, l, edges=None):
+        # partitioned groupby: (key, row idx) pairs go to hash partitions on
+        # disk, and only one partition's groups are in memory at a time.
+        # Groups are put back in first occurrence order at the end, so the
+        # result is the same as the in memory path
+        parts = partitionset(budget.partitions(budget.hash_state_bytes(df, groupby_columns, l)))
+        q = current_query()
+        try:
+            for i in range(l):
+                if q is not None:
+                    q.tick('groupby', i, l)
+                key = tuple(df[c][i] for c in groupby_columns)
+                parts.add(key, (key, i))
+
+            out = []
+            for part in parts:
+                groups = {}
+                for key, i in part:
+                    groups.setdefault(key, []).append(i)
+
+                for key, val_idx in groups.items():
+                    if q is not None:
+                        q.tick('groupby', rows=len(out), step=len(val_idx))
+                    aggs = self.aggregate(df, val_idx, agg_column, agg_type, edges)
+                    if isinstance(aggs, str):
+                        return aggs
+                    out.append((val_idx[0], key, aggs))
+                groups = None
+        finally:
+            parts.close()
+
+        out.sort(key=lambda r: r[0])
+        d = {}
+        for _, key, aggs in out:
+            for i, col_name in enumerate(groupby_columns):
+                d.setdefault(col_name, []).append(key[i])
+            for name, val in aggs:
+                d.setdefault(name, []).append(val)
+
+        return d
+
+    def aggregate(self, df, val_idx, agg_column, agg_type, edges=None):
+        # [(output column, value)] for one group, or an error message;
+        # edges holds the bin edges of each column for 'hist'
+        res = []
+        try:
+            for a_col in agg_column:
+                agg_data = []
+                for idx in val_idx:
+                    agg_data.append(df[a_col][idx])
+
+
+                if agg_type == 'count':
+                    cnt = 0
+                    for i in agg_data:
+                        cnt = cnt + 1 
+                    res.append((a_col+'_count', cnt))
+                
+                elif agg_type == 'sum':
+                    su = 0
+                    for i in agg_data:
+                        try:
+                            su = su + i
+                        except TypeError: # Handle mixed types
+                            su = su + float(i) 
+                    res.append((a_col + '_sum', su))
+
+                elif agg_type == 'avg':
+                    su = 0
+                    cnt = 0
                     
-                    elif agg_type == 'max':
-                        if not agg_data:
-                            max_val = None
-                        else:
-                            max_val = agg_data[0]
-                        for i in agg_data:
-                            if i>max_val:
-                                max_val = i 
-                        d.setdefault(a_col + '_max', []).append(max_val)
+                    for i in agg_data:
+                        cnt = cnt + 1 
+                        try:
+                            su = su + i
+                        except TypeError:
+                            su = su + float(i)
 
+                    if cnt<1:
+                        # return 'no records found to calcuate the average, zero divide error!'
+                        res.append((a_col+'_avg', 0)) # Safer return
                     else:
-                        return 'Not a valid aggregation type, choose from : sum, count, min, max, avg'
-            except ValueError:
-                return 'Datatype error check the aggregation columns, type usage!'
-            except TypeError:
-                return 'Datatype error check the aggregation columns, type usage!'
+                        res.append((a_col+'_avg', su/cnt))
 
-        return d 
+                elif agg_type == 'min':
+                    if not agg_data:
+                        min_val = None
+                    else:
+                        min_val = agg_data[0]
+                    for i in agg_data:
+                        if i<min_val:
+                            min_val = i 
+                    res.append((a_col + '_min', min_val))
+                
+                elif agg_type == 'max':
+                    if not agg_data:
+                        max_val = None
+                    else:
+                        max_val = agg_data[0]
+                    for i in agg_data:
+                        if i>max_val:
+                            max_val = i 
+                    res.append((a_col + '_max', max_val))
+
+                elif agg_type == 'hist' and edges is not None:
+                    e = edges[a_col]
+                    hist = [0] * (len(e) - 1)
+                    for i in agg_data:
+                        k = bin_of(e, i)
+                        if k >= 0:
+                            hist[k] = hist[k] + 1
+                    res.append((a_col + '_hist', hist))
+
+                else:
+                    return 'Not a valid aggregation type, choose from : sum, count, min, max, avg, hist'
+        except ValueError:
+            return 'Datatype error check the aggregation columns, type usage!'
+        except TypeError:
+            return 'Datatype error check the aggregation columns, type usage!'
+
+        return res
         
-    def join(self, df_left, df_right, on_columns, how='inner', left_suffix='', right_suffix=''):
+    @stoppable
+    def histogram(self, df, column, bins=10, kind='width', low=None, high=None, agg_column=[], agg_type='count'):
+        # rows per bin of column in one pass (engine.histogram: bins is a
+        # number of bins for 'width' / 'quantile', the edges for 'edges'),
+        # plus agg_type of each agg_column over the rows of every bin.
+        # One row per bin, empty bins included: bin_low, bin_high, count and
+        # <agg column>_<agg_type>
+        if agg_type not in ['count', 'sum', 'avg', 'min', 'max']:
+            return 'Not a valid aggregation type, choose from : sum, count, min, max, avg'
+        for c in [column] + list(agg_column):
+            if c not in df:
+                return 'Column not found : ' + str(c)
+        df = self.resolve(df, [column] + list(agg_column))
+        edges = bin_edges(df[column], bins, kind, low, high)
+        if isinstance(edges, str):
+            return edges
+        n_bins = len(edges) - 1
+        d = {'bin_low': edges[:-1], 'bin_high': edges[1:]}
+
+        vec = self.vec()
+        if vec is not None:
+            fast = vec.histogram(df[column], edges, [df[c] for c in agg_column], agg_type)
+            if fast is not None:
+                d['count'] = fast[0]
+                for a_col, vals in zip(agg_column, fast[1]):
+                    d[a_col + '_' + agg_type] = vals
+                return d
+
+        col = df[column]
+        l = len(col)
+        q = current_query()
+        counts = [0] * n_bins
+        accs = [[None] * n_bins for _ in agg_column]
+        cols = [df[c] for c in agg_column]
+        try:
+            for i in range(l):
+                if q is not None:
+                    q.tick('histogram', i, l)
+                k = bin_of(edges, col[i])
+                if k < 0:
+                    continue
+                counts[k] = counts[k] + 1
+                if agg_type == 'count':
+                    continue
+                for acc, vals in zip(accs, cols):
+                    v = vals[i]
+                    cur = acc[k]
+                    if cur is None:
+                        acc[k] = v
+                    elif agg_type in ['sum', 'avg']:
+                        acc[k] = cur + v
+                    elif agg_type == 'min':
+                        acc[k] = v if v < cur else cur
+                    else:
+                        acc[k] = v if v > cur else cur
+        except TypeError:
+            return 'Datatype error check the histogram / aggregation columns, type usage!'
+
+        d['count'] = counts
+        for a_col, acc in zip(agg_column, accs):
+            if agg_type == 'count':
+                acc = counts
+            elif agg_type == 'sum':
+                acc = [0 if a is None else a for a in acc]
+            elif agg_type == 'avg':
+                acc = [None if a is None else a / c for a, c in zip(acc, counts)]
+            d[a_col + '_' + agg_type] = acc
+
+        return d
+
+    @stoppable
+    def approx_groupby(self, df, groupby_columns, agg_column, agg_type, strata, confidence=0.95):
+        # groupby over (a frame derived from) an engine.sampling sample: count,
+        # sum and avg are estimates for the full data with a confidence
+        # interval in <column>_low / <column>_high; min and max are the
+        # sampled ones, without bounds. sample_rows = sampled rows per group
+        if agg_type not in ['count', 'sum', 'avg', 'min', 'max']:
+            return 'Not a valid aggregation type, choose from : sum, count, min, max, avg'
+        if STRATUM not in df:
+            return 'approx_groupby needs a frame built from a sample (' + STRATUM + ' column)'
+        df = self.resolve(df, list(groupby_columns) + list(agg_column))
+
+        z = z_value(confidence)
+        l = self.df_len(df)
+        q = current_query()
+        hcol = df[STRATUM]
+        groups = {}
+        for i in range(l):
+            if q is not None:
+                q.tick('groupby', i, l)
+            h = hcol[i]
+            if h not in strata:
+                continue  # rows an outer join added, not sampled
+            key = tuple(df[c][i] for c in groupby_columns)
+            groups.setdefault(key, {}).setdefault(h, []).append(i)
 
-        df_left = copy.deepcopy(df_left)
-        df_right = copy.deepcopy(df_right)
+        d = {}
+        try:
+            for key, by_h in groups.items():
+                for i, col_name in enumerate(groupby_columns):
+                    d.setdefault(col_name, []).append(key[i])
+                d.setdefault('sample_rows', []).append(sum(len(rows) for rows in by_h.values()))
+                count = sum(strata[h][1] / strata[h][0] * len(rows) for h, rows in by_h.items())
+
+                for a_col in agg_column:
+                    name = a_col + '_' + agg_type
+                    low = high = None
+                    if agg_type in ['min', 'max']:
+                        vals = [df[a_col][i] for rows in by_h.values() for i in rows]
+                        est = min(vals) if agg_type == 'min' else max(vals)
+                    elif agg_type == 'count':
+                        est = count
+                        var = stratum_variance(strata, {h: (len(rows), len(rows)) for h, rows in by_h.items()})
+                    else:
+                        sums = {}
+                        total = 0.0
+                        for h, rows in by_h.items():
+                            ys = [df[a_col][i] for i in rows]
+                            s1 = sum(ys)
+                            sums[h] = (s1, sum(y * y for y in ys), len(ys))
+                            total = total + strata[h][1] / strata[h][0] * s1
+                        if agg_type == 'sum':
+                            est = total
+                            var = stratum_variance(strata, {h: (s1, s2) for h, (s1, s2, c) in sums.items()})
+                        else:
+                            # ratio estimator, variance by linearization
+                            est = total / count
+                            var = stratum_variance(strata, {
+                                h: (s1 - est * c, s2 - 2 * est * s1 + est * est * c)
+                                for h, (s1, s2, c) in sums.items()
+                            }) / (count * count)
+                    if agg_type not in ['min', 'max']:
+                        low = est - z * var ** 0.5
+                        high = est + z * var ** 0.5
+                    d.setdefault(name, []).append(est)
+                    d.setdefault(name + '_low', []).append(low)
+                    d.setdefault(name + '_high', []).append(high)
+        except (TypeError, ValueError):
+            return 'Datatype error check the aggregation columns, type usage!'
+
+        if q is not None:
+            q.check('groupby', rows=len(groups))
+        return d
+
+    @stoppable
+    def join(self, df_left, df_right, on_columns, how='inner', left_suffix='', right_suffix=''):
+        q = current_query()
 
         if not df_left:
             l_left = 0
@@ -242,14 +726,6 @@ class functions:
         else:
             l_right = len(df_right[list(df_right.keys())[0]])
 
-        right_index = {}
-        for j in range(l_right):
-            key_vals = []
-            for c in on_columns:
-                key_vals.append(df_right[c][j])
-            key = tuple(key_vals)
-            right_index.setdefault(key, []).append(j)
-
         result_cols = {}
 
         for c in df_left.keys():
@@ -294,6 +770,7 @@ class functions:
         d = {}
         for col in result_cols.keys():
             d[col] = []
+        out = d[next(iter(d))] if d else []
 
         used_right_indices = set()
 
@@ -310,6 +787,36 @@ class functions:
                     else:
                         d[col].append(df_right[orig][idx_right])
 
+        if budget.exceeds(budget.hash_state_bytes(df_right, on_columns, l_right)):
+            for i, j in self.grace_join_pairs(df_left, df_right, on_columns, how, l_left, l_right):
+                if q is not None:
+                    q.tick('join', rows=len(out))
+                append_row(i, j)
+            return d
+
+        vec = self.vec()
+        pairs = None if vec is None else vec.join_pairs(df_left, df_right, on_columns, how, l_left, l_right)
+        if pairs is not None:
+            left_idx, right_idx = pairs
+            for col, (side, orig) in result_cols.items():
+                if q is not None:
+                    q.check('join', rows=len(left_idx))
+                if side == "left":
+                    d[col] = vec.gather(df_left[orig], left_idx)
+                else:
+                    d[col] = vec.gather(df_right[orig], right_idx)
+            return d
+
+        right_index = {}
+        for j in range(l_right):
+            if q is not None:
+                q.tick('join', j, l_left + l_right)
+            key_vals = []
+            for c in on_columns:
+                key_vals.append(df_right[c][j])
+            key = tuple(key_vals)
+            right_index.setdefault(key, []).append(j)
+
         for i in range(l_left):
             key_vals = []
             for c in on_columns:
@@ -317,6 +824,8 @@ class functions:
             key = tuple(key_vals)
 
             matches = right_index.get(key)
+            if q is not None:
+                q.tick('join', l_right + i, l_left + l_right, len(out), len(matches) if matches else 1)
 
             if matches:
                 for j in matches:
@@ -328,7 +837,340 @@ class functions:
 
         if how == "right" or how == "full":
             for j in range(l_right):
+                if q is not None:
+                    q.tick('join', rows=len(out))
                 if j not in used_right_indices:
                     append_row(None, j)
 
         return d
+
+    def grace_join_pairs(self, df_left, df_right, on_columns, how, l_left, l_right):
+        # grace hash join: both sides are hash partitioned on the join key into
+        # temp files, then each partition is joined with a hash table of only
+        # its own right rows. Within a partition matches come out in left row
+        # order, so merging the partitions on the left row gives the same row
+        # order as the in memory join
+        n = budget.partitions(budget.hash_state_bytes(df_right, on_columns, l_right))
+        left_parts = partitionset(n)
+        right_parts = partitionset(n)
+        matched = [spillfile() for _ in range(n)]
+        unmatched_right = [spillfile() for _ in range(n)]
+        q = current_query()
+        try:
+            for j in range(l_right):
+                if q is not None:
+                    q.tick('join', j, l_left + l_right)
+                key = tuple(df_right[c][j] for c in on_columns)
+                right_parts.add(key, (key, j))
+            for i in range(l_left):
+                if q is not None:
+                    q.tick('join', l_right + i, l_left + l_right)
+                key = tuple(df_left[c][i] for c in on_columns)
+                left_parts.add(key, (key, i))
+
+            for p, (lp, rp) in enumerate(zip(left_parts, right_parts)):
+                right_index = {}
+                for key, j in rp:
+                    right_index.setdefault(key, []).append(j)
+
+                used_right_indices = set()
+                for key, i in lp:
+                    matches = right_index.get(key)
+                    if q is not None:
+                        q.tick('join', step=len(matches) if matches else 1)
+                    if matches:
+                        for j in matches:
+                            matched[p].append((i, j))
+                            used_right_indices.add(j)
+                    elif how == "left" or how == "full":
+                        matched[p].append((i, None))
+
+                if how == "right" or how == "full":
+                    for key, j in rp:
+                        if j not in used_right_indices:
+                            unmatched_right[p].append(j)
+                right_index = None
+
+            for i, j in heapq.merge(*matched, key=lambda r: r[0]):
+                yield i, j
+            for j in heapq.merge(*unmatched_right):
+                yield None, j
+        finally:
+            left_parts.close()
+            right_parts.close()
+            for f in matched + unmatched_right:
+                f.close()
+
+    def memory_usage(self, df):
+        # bytes held by each column of a frame, plus the frame total
+        d = {'column': [], 'rows': [], 'bytes': []}
+        total = 0
+        for c in df.keys():
+            nbytes = budget.column_bytes(df[c])
+            d['column'].append(c)
+            d['rows'].append(len(df[c]))
+            d['bytes'].append(nbytes)
+            total = total + nbytes
+
+        d['column'].append('(frame total)')
+        d['rows'].append(self.df_len(df) if df else 0)
+        d['bytes'].append(total)
+
+        return d
+
+    def time_bucket(self, df, column='timestamp', unit='month', name=None):
+        if unit not in ['day', 'week', 'month', 'year']:
+            return 'Not a valid time unit, choose from : day, week, month, year'
+
+        epoch = date(1970, 1, 1)
+        labels = {}  # day number : bucket label, each day is formatted only once
+        out = []
+        for ts in df[column]:
+            if ts is None:
+                out.append(None)
+                continue
+
+            day = ts // 86400
+            lab = labels.get(day)
+            if lab is None:
+                dt = epoch + timedelta(days=day)
+                if unit == 'day':
+                    lab = dt.isoformat()
+                elif unit == 'week':
+                    lab = (dt - timedelta(days=dt.weekday())).isoformat()
+                elif unit == 'month':
+                    lab = dt.isoformat()[:7]
+                else:
+                    lab = dt.isoformat()[:4]
+                labels[day] = lab
+            out.append(lab)
+
+        d = dict(df)
+        d[name or column + '_' + unit] = out
+
+        return d
+
+    def time_window(self, df, index, start=None, end=None):
+        # rows with start <= timestamp < end, found through a sortedindex
+        idx = sorted(index.range(start, end))
+
+        return self.take(df, idx)
+
+    def window(self, df, partition_by, order_by, func, column=None, type='asc', offset=1, name=None):
+        ranking = ['row_number', 'rank', 'dense_rank']
+        running = ['running_sum', 'running_avg']
+        shifts = ['lag', 'lead']
+        whole = ['count', 'sum', 'avg', 'min', 'max']
+
+        if func not in ranking + running + shifts + whole:
+            return 'Not a valid window function, choose from : ' + ', '.join(ranking + running + shifts + whole)
+        if func not in ranking and column is None:
+            return 'window function ' + func + ' needs a column to work on'
+
+        n = self.df_len(df)
+        out = [None] * n
+        vals = df[column] if column is not None else None
+
+        # hash partition once: partition values tuple : row idx in input order
+        parts = {}
+        pcols = [df[c] for c in partition_by]
+        for i in range(n):
+            parts.setdefault(tuple(c[i] for c in pcols), []).append(i)
+
+        ocols = [df[c] for c in order_by]
+        if len(ocols) == 1:
+            sort_key = ocols[0].__getitem__
+        else:
+            sort_key = lambda i: tuple(c[i] for c in ocols)
+
+        try:
+            for rows in parts.values():
+                if ocols:
+                    rows.sort(key=sort_key, reverse=(type == 'dsc'))
+
+                if func in ranking:
+                    rnk = 0
+                    prev = None
+                    for k, i in enumerate(rows):
+                        if func == 'row_number':
+                            out[i] = k + 1
+                            continue
+                        cur = sort_key(i) if ocols else None
+                        if k == 0 or cur != prev:
+                            rnk = k + 1 if func == 'rank' else rnk + 1
+                        prev = cur
+                        out[i] = rnk
+
+                elif func in running:
+                    su = 0
+                    for k, i in enumerate(rows):
+                        su = su + vals[i]
+                        out[i] = su if func == 'running_sum' else su / (k + 1)
+
+                elif func in shifts:
+                    step = -offset if func == 'lag' else offset
+                    m = len(rows)
+                    for k, i in enumerate(rows):
+                        if 0 <= k + step < m:
+                            out[i] = vals[rows[k + step]]
+
+                else:
+                    agg_data = [vals[i] for i in rows]
+                    if func == 'count':
+                        res = len(agg_data)
+                    elif func == 'sum':
+                        res = sum(agg_data)
+                    elif func == 'avg':
+                        res = sum(agg_data) / len(agg_data)
+                    elif func == 'min':
+                        res = min(agg_data)
+                    else:
+                        res = max(agg_data)
+                    for i in rows:
+                        out[i] = res
+        except TypeError:
+            return 'Datatype error check the window columns, type usage!'
+
+        if name is None:
+            name = func if column is None else column + '_' + func
+
+        d = dict(df)
+        d[name] = out
+
+        return d
+
+    def top_n(self, df, groupby_columns, order_column, n, type='dsc', min_count=None, count_column=None):
+        # top n rows of every group in one scan: each group keeps a heap of
+        # at most n (key, row) entries whose root is the weakest row kept, so
+        # memory is groups x n instead of the whole frame.
+        # min_count drops rows whose count_column is below it (e.g. movies
+        # with too few ratings) before they reach a heap.
+        # Groups come out in first occurrence order, each one sorted like
+        # order_rows would (ties keep row order).
+        if type not in ['asc', 'dsc']:
+            return 'Not a valid order type, choose from : asc, dsc'
+        if isinstance(n, bool) or not isinstance(n, int) or n < 1:
+            return 'top_n needs n to be a positive integer'
+        if min_count is not None and count_column is None:
+            return 'top_n needs a count_column to apply min_count to'
+
+        l = self.df_len(df)
+        vals = df[order_column]
+        counts = df[count_column] if count_column is not None else None
+        keycols = [df[c] for c in groupby_columns]
+
+        heaps = {}
+        for i in range(l):
+            v = vals[i]
+            if v is None:
+                continue
+
+            # root = weakest kept row: lowest value (dsc) or highest (asc),
+            # later row first on ties
+            item = (v, -i) if type == 'dsc' else (reversedkey(v), -i)
+            try:
+                if counts is not None and counts[i] < min_count:
+                    continue
+
+                key = tuple(col[i] for col in keycols)
+                h = heaps.get(key)
+                if h is None:
+                    h = []
+                    heaps[key] = h
+
+                if len(h) < n:
+                    heapq.heappush(h, item)
+                elif h[0] < item:
+                    heapq.heapreplace(h, item)
+            except TypeError:
+                return 'Datatype error check the order and count columns, type usage!'
+
+        idx = []
+        for h in heaps.values():
+            h.sort(reverse=True)
+            idx.extend(-i for _, i in h)
+
+        return self.take(df, idx)
+
+    def genre_column(self, df, column):
+        col = df[column]
+        if isinstance(col, multivalue):
+            return col
+        # plain "A|B|C" strings (e.g. after a join): encode once
+        enc = multivalue(MOVIELENS_GENRES)
+        enc.extend(col)
+        return enc
+
+    def has_genre(self, df, column, genre):
+        return self.has_any(df, column, [genre])
+
+    def has_any(self, df, column, genres):
+        col = self.genre_column(df, column)
+        m = col.mask(genres)
+        return self.take(df, [i for i, c in enumerate(col.codes) if c & m])
+
+    def has_all(self, df, column, genres):
+        col = self.genre_column(df, column)
+        m = col.mask(genres)
+        if len(col.labels_of(m)) < len(set(genres)):  # a label nobody has
+            return self.take(df, [])
+        return self.take(df, [i for i, c in enumerate(col.codes) if c & m == m])
+
+    def groupby_exploded(self, df, column, agg_column, agg_type):
+        # groupby over each label of a multi valued column, as if every row
+        # was repeated once per label, without building the repeated rows:
+        # one aggregate state per label, updated from the set bits of a row
+        if agg_type not in ['count', 'sum', 'avg', 'min', 'max']:
+            return 'Not a valid aggregation type, choose from : sum, count, min, max, avg'
+
+        col = self.genre_column(df, column)
+        n_labels = len(col.labels)
+        row_labels = {}  # code : label positions, worked out once per distinct code
+
+        d = {column: []}
+        states = []
+        for a_col in agg_column:
+            vals = df[a_col]
+            cnt = [0] * n_labels
+            acc = [None] * n_labels
+            try:
+                for i, c in enumerate(col.codes):
+                    ks = row_labels.get(c)
+                    if ks is None:
+                        ks = [k for k in range(n_labels) if c >> k & 1]
+                        row_labels[c] = ks
+                    if not ks:
+                        continue
+                    v = vals[i]
+                    for k in ks:
+                        cnt[k] = cnt[k] + 1
+                        if agg_type == 'count':
+                            continue
+                        cur = acc[k]
+                        if cur is None:
+                            acc[k] = v
+                        elif agg_type in ['sum', 'avg']:
+                            acc[k] = cur + v
+                        elif agg_type == 'min':
+                            if v < cur:
+                                acc[k] = v
+                        elif v > cur:
+                            acc[k] = v
+            except (TypeError, ValueError):
+                return 'Datatype error check the aggregation columns, type usage!'
+            states.append((a_col, cnt, acc))
+
+        used = [k for k in range(n_labels) if states and states[0][1][k]]
+        for k in used:
+            d[column].append(col.labels[k])
+        for a_col, cnt, acc in states:
+            out = d.setdefault(a_col + '_' + agg_type, [])
+            for k in used:
+                if agg_type == 'count':
+                    out.append(cnt[k])
+                elif agg_type == 'avg':
+                    out.append(acc[k] / cnt[k])
+                else:
+                    out.append(acc[k])
+
+        return d
@@ -1,3 +1,13 @@
+import mmap
+import os
+import threading
+from array import array
+from itertools import accumulate, compress, islice
+from operator import itemgetter
+
+from engine.schema import builtin_schema, infer_schema
+from engine.sync import once
+
 class csvreader:
 
     def quote_split(self, s, sep=','):
@@ -47,3 +57,247 @@ class csvreader:
                 return b[0], b[1:]
         except FileNotFoundError:
             print("There is no file at the given path, please check")
+
+    def read_frame(self, path, schema=None, sep=','):
+        # one pass from text lines to typed columns. schema: declared (or the
+        # builtin MovieLens one for the file name), else inferred from the
+        # first lines. Bad cells end up in self.errors with their line number
+        self.errors = []
+        if schema is None:
+            schema = builtin_schema(path)
+
+        with open(path, 'r', encoding="utf-8") as a:
+            lineno = 0
+            header = None
+            for i in a:
+                lineno = lineno + 1
+                if i.strip():
+                    header = self.split_line(i, sep)
+                    break
+            if header is None:
+                return {}
+
+            bound = None
+            d = None
+            # lines are split and converted in bounded batches, column by
+            # column; there is never a full rows-of-strings copy of the file
+            while True:
+                chunk = list(islice(a, 4096))
+                if not chunk:
+                    break
+
+                rows = [i.strip().split(sep) if '"' not in i else self.quote_split(i, sep) for i in chunk]
+                if [''] in rows:  # blank lines
+                    linenos = [lineno + k + 1 for k, r in enumerate(rows) if r != ['']]
+                    rows = [r for r in rows if r != ['']]
+                else:
+                    linenos = range(lineno + 1, lineno + len(rows) + 1)
+                lineno = lineno + len(chunk)
+
+                if bound is None:
+                    if schema is None:
+                        schema = infer_schema(header, rows[:1000])
+                    bound = schema.bind(header)
+                    d = bound.new_frame()
+                bound.extend(d, rows, linenos, self.errors)
+
+        if d is None:
+            d = (schema or infer_schema(header, [])).bind(header).new_frame()
+        return d
+
+    def split_line(self, line, sep=','):
+        if '"' in line:
+            return self.quote_split(line, sep)
+        return line.strip().split(sep)
+
+
+# bytes of the file split at a time when building the line index
+BLOCK = 1 << 18
+
+
+class csvscan:
+
+    # memory mapped scan of a csv file. Nothing is parsed up front: the line
+    # start offsets are found in one pass when first needed (a compact int64
+    # array), rows are split and converted only when asked for, and only the
+    # requested columns are converted
+    def __init__(self, path, schema=None, sep=','):
+        self.path = path
+        self.sep = sep
+        self.reader = csvreader()
+        self.errors = []
+        # a scan is shared by every session: the line index is built once,
+        # errors from concurrent reads are appended under a lock
+        self.lines = once()
+        self.lock = threading.Lock()
+
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+        # header = first non blank line; first_line is the file line number
+        # of the line after it
+        pos = 0
+        n = 1
+        self.header = []
+        while pos < len(self.mm):
+            end = self.line_end(pos)
+            line = self.mm[pos:end].decode('utf-8')
+            pos = end + 1
+            n = n + 1
+            if line.strip():
+                self.header = self.reader.split_line(line, sep)
+                break
+        self.start = pos
+        self.first_line = n
+
+        if schema is None:
+            schema = builtin_schema(path)
+        if schema is None:
+            schema = infer_schema(self.header, [self.reader.split_line(l, sep) for _, l in self.iter_lines(1000)])
+        self.schema = schema
+        self.columns = schema.bind(self.header).names
+
+    def line_end(self, pos):
+        end = self.mm.find(b'\n', pos)
+        return len(self.mm) if end < 0 else end
+
+    def iter_lines(self, n=None):
+        # (file line number, line) of up to n non blank rows, without the
+        # line index
+        pos = self.start
+        lineno = self.first_line
+        while pos < len(self.mm) and n != 0:
+            end = self.line_end(pos)
+            line = self.mm[pos:end].decode('utf-8')
+            pos = end + 1
+            if line.strip():
+                if n is not None:
+                    n = n - 1
+                yield lineno, line
+            lineno = lineno + 1
+
+    def index(self):
+        return self.lines.get(self.build_index)[0]
+
+    def build_index(self):
+        # (start offsets, line numbers) of the non blank rows. The file is
+        # split a block of whole lines at a time, so at most one block is
+        # ever copied. Row i is file line first_line + i; only when blank
+        # lines are skipped are the line numbers kept, next to the offsets
+        mm = self.mm
+        size = len(mm)
+        offs = array('q')
+        nums = None
+        pos = self.start
+        lineno = self.first_line
+        while pos < size:
+            end = size
+            if pos + BLOCK < size:
+                end = mm.rfind(b'\n', pos, pos + BLOCK)
+                if end < 0:
+                    # a line longer than a block
+                    end = self.line_end(pos)
+            lines = mm[pos:end].split(b'\n')
+            if end == size and not lines[-1]:
+                lines.pop()  # after the file's last newline
+            starts = accumulate(map((1).__add__, map(len, lines)), initial=pos)
+            nonblank = list(map(bytes.strip, lines))
+            before = len(offs)
+            offs.extend(compress(starts, nonblank))
+            if nums is None and len(offs) - before < len(lines):
+                nums = array('q', range(self.first_line, self.first_line + before))
+            if nums is not None:
+                nums.extend(compress(range(lineno, lineno + len(lines)), nonblank))
+            lineno = lineno + len(lines)
+            pos = end + 1
+        return offs, nums
+
+    def __len__(self):
+        return len(self.index())
+
+    def plan(self, columns):
+        # which file columns to split out for the requested (or all) columns
+        if columns is None:
+            columns = self.columns
+        need = set(columns)
+        for d in self.schema.derived:
+            if d.name in need:
+                need.add(d.source)
+        need = [c for c in self.header if c in need]
+        return self.schema.bind(need), [self.header.index(c) for c in need], columns
+
+    def frame(self, lines, columns, linenos):
+        bound, pos, columns = self.plan(columns)
+        d = bound.new_frame()
+        if not pos:
+            return {}
+
+        sep = self.sep
+        split = self.reader.quote_split
+        # only split as far as the last needed column
+        rows = [l.strip().split(sep, pos[-1] + 1) if '"' not in l else split(l, sep) for l in lines]
+        if len(pos) < len(self.header):
+            get = itemgetter(*pos) if len(pos) > 1 else lambda r: (r[pos[0]],)
+            if rows and min(map(len, rows)) > pos[-1]:
+                rows = list(map(get, rows))
+            else:
+                rows = [get(r) if len(r) > pos[-1] else r for r in rows]
+        errors = []
+        bound.extend(d, rows, linenos, errors)
+        if errors:
+            with self.lock:
+                self.errors.extend(errors)
+
+        return {c: d[c] for c in columns}
+
+    def lineno(self, i):
+        # file line number of row i, from the line index
+        nums = self.lines.get(self.build_index)[1]
+        return self.first_line + i if nums is None else nums[i]
+
+    def head(self, rows=5, columns=None):
+        numbered = list(self.iter_lines(rows))
+        return self.frame([l for _, l in numbered], columns, [n for n, _ in numbered])
+
+    def take(self, idx, columns=None):
+        offs = self.index()
+        idx = list(idx)
+        lines = [self.mm[offs[i]:self.line_end(offs[i])].decode('utf-8') for i in idx]
+        return self.frame(lines, columns, map(self.lineno, idx))
+
+    def tail(self, rows=5, columns=None):
+        n = len(self)
+        return self.take(range(max(0, n - rows), n), columns)
+
+    def row(self, i, columns=None):
+        d = self.take([i], columns)
+        return {c: col[0] for c, col in d.items() if len(col)}
+
+    def batches(self, columns=None, batch=4096):
+        # the file as frames of up to batch rows, parsed one batch at a time
+        offs = self.index()
+        for a in range(0, len(offs), batch):
+            b = min(a + batch, len(offs))
+            end = offs[b] if b < len(offs) else len(self.mm)
+            lines = [l for l in self.mm[offs[a]:end].decode('utf-8').split('\n') if l.strip()]
+            yield self.frame(lines, columns, map(self.lineno, range(a, b)))
+
+    def read(self, columns=None, batch=4096):
+        # whole file, only the requested columns, in batches of lines
+        d = None
+        for part in self.batches(columns, batch):
+            if d is None:
+                d = part
+            else:
+                for c, col in part.items():
+                    d[c].extend(col)
+
+        if d is None:
+            d = self.frame([], columns, [])
+        return d
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
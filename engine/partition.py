@@ -0,0 +1,551 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from engine.cache import cache_dir, read_arrays, source_stamp, write_arrays
+from engine.cancel import current_query
+from engine.export import chunks, decode_column, encode_column
+from engine.ops import functions
+from engine.parser import csvscan
+
+# partitioned datasets for tables that do not fit in memory (ml-25m / ml-32m
+# ratings). A dataset is a directory of binary cache files plus MANIFEST:
+#   {"key": "movieId", "scheme": "hash", "n": 8, "bounds": null,
+#    "columns": [...], "generation": 1, "source": [size, mtime_ns],
+#    "partitions": [{"files": [...], "rows": n, "stats": {col: [min, max]}}]}
+# Rows go to partition hash(key) % n ('hash') or bisect(bounds, key)
+# ('range'); a partition is one or more segment files of at most
+# SEGMENT_ROWS rows, so writing needs one segment per partition in memory.
+# Filters skip partitions that cannot match (the key's partition for = / in,
+# the per column min / max for comparisons), scans run one partition per
+# worker process and merge the results, and joins of two datasets
+# partitioned the same way on the join key join partition k with partition
+# k, with no shuffle. Results come back in partition order.
+MANIFEST = 'manifest.json'
+SCHEMES = ['hash', 'range']
+SEGMENT_ROWS = 1 << 16
+
+
+def stable_hash(v):
+    # the same for every process (str hashes are salted per process), and
+    # equal ints / floats hash alike so int and float keys still join
+    if v is None:
+        return 0
+    if isinstance(v, (bool, int)):
+        return int(v)
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return zlib.crc32(str(v).encode('utf-8'))
+
+
+def take(col, idx):
+    if hasattr(col, 'take'):
+        return col.take(idx)
+    if isinstance(col, array):
+        return array(col.typecode, [col[i] for i in idx])
+    return [col[i] for i in idx]
+
+
+def concat(frames):
+    # frames appended to the first non empty one
+    d = None
+    for df in frames:
+        if not df or not len(df[list(df.keys())[0]]):
+            continue
+        if d is None:
+            d = df
+            continue
+        for c, col in df.items():
+            try:
+                d[c].extend(col)
+            except TypeError:
+                # typed column followed by None / mixed values
+                d[c] = list(d[c]) + list(col)
+    return d or {}
+
+
+def write_segment(path, df):
+    # typed columns are stored as they are, others through the columnar
+    # export encoding as a byte array
+    arrays = {}
+    kinds = {}
+    for c, col in df.items():
+        if isinstance(col, array) and col.typecode in 'qd':
+            arrays[c] = col
+            kinds[c] = col.typecode
+        else:
+            kind, data = encode_column(col)
+            arrays[c] = array('B', data)
+            kinds[c] = kind
+    write_arrays(path, arrays, {'rows': len(df[list(df.keys())[0]]), 'kinds': kinds})
+
+
+def read_segment(path, columns=None):
+    arrays, meta = read_arrays(path, columns)
+    d = {}
+    for c in columns if columns is not None else list(arrays):
+        a = arrays[c]
+        if a.typecode == 'B':
+            d[c] = decode_column(meta['kinds'][c], a.tobytes(), meta['rows'])
+        else:
+            d[c] = a
+    return d
+
+
+def read_segments(files, columns):
+    if not files:
+        return {c: [] for c in columns}
+    return concat(read_segment(f, columns) for f in files)
+
+
+def column_stats(col):
+    if isinstance(col, array) and col.typecode in 'qd' and len(col):
+        return [min(col), max(col)]
+    return None
+
+
+def may_match(stats, cond, val):
+    # False when no value in [lo, hi] can pass <cond> val
+    if stats is None:
+        return True
+    lo, hi = stats
+    try:
+        if cond == '=':
+            return lo <= val <= hi
+        if cond == '<':
+            return lo < val
+        if cond == '<=':
+            return lo <= val
+        if cond == '>':
+            return hi > val
+        if cond == '>=':
+            return hi >= val
+        if cond == 'in':
+            return any(lo <= v <= hi for v in val)
+        if cond == 'between':
+            return val[0] <= hi and lo <= val[1]
+    except TypeError:
+        pass
+    return True
+
+
+def run_jobs(fn, jobs, workers, stage):
+    # fn(*job) for every job, in a spawned process pool when there is more
+    # than one job and worker; results in job order. The query context of
+    # the calling thread is checked as results come in
+    q = current_query()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(jobs) <= 1:
+        out = []
+        for k, job in enumerate(jobs):
+            if q is not None:
+                q.check(stage, k, len(jobs))
+            out.append(fn(*job))
+        return out
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=get_context('spawn')) as pool:
+        futures = [pool.submit(fn, *job) for job in jobs]
+        out = []
+        try:
+            for k, f in enumerate(futures):
+                if q is not None:
+                    q.check(stage, k, len(jobs))
+                out.append(f.result())
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+        return out
+
+
+def scan_partition(files, columns, task, args, backend):
+    return task(functions(backend), read_segments(files, columns), *args)
+
+
+def join_partitions(left_files, left_columns, right_files, right_columns, args, backend):
+    ops = functions(backend)
+    return ops.join(read_segments(left_files, left_columns), read_segments(right_files, right_columns), *args)
+
+
+def filter_task(ops, df, columns, conditions, values, seperators, select):
+    if not df or not len(df[list(df.keys())[0]]):
+        return {}
+    res = ops.filter(df, columns, conditions, values, seperators)
+    if isinstance(res, str) or not res or select is None:
+        return res
+    return ops.select_columns(res, select)
+
+
+def groupby_task(ops, df, where, groupby_columns, agg_column, agg_type):
+    if where is not None:
+        df = filter_task(ops, df, *where, None)
+        if isinstance(df, str):
+            return df
+    if not df or not len(df[list(df.keys())[0]]):
+        return {}
+    if agg_type != 'avg':
+        return ops.groupby(df, groupby_columns, agg_column, agg_type)
+    # partial averages are merged from their sums and counts
+    s = ops.groupby(df, groupby_columns, agg_column, 'sum')
+    if isinstance(s, str):
+        return s
+    c = ops.groupby(df, groupby_columns, agg_column, 'count')
+    s.update({k: v for k, v in c.items() if k.endswith('_count')})
+    return s
+
+
+def merge_groups(parts, groupby_columns, agg_column, agg_type):
+    # partial group results of every partition -> one row per group, in
+    # first occurrence order
+    groups = {}
+    for df in parts:
+        if not df:
+            continue
+        keys = list(zip(*[df[c] for c in groupby_columns]))
+        for i, g in enumerate(keys):
+            acc = groups.get(g)
+            for k, a_col in enumerate(agg_column):
+                if agg_type == 'avg':
+                    v = (df[a_col + '_sum'][i], df[a_col + '_count'][i])
+                else:
+                    v = df[a_col + '_' + agg_type][i]
+                if acc is None:
+                    acc = groups[g] = [None] * len(agg_column)
+                cur = acc[k]
+                if cur is None:
+                    acc[k] = v
+                elif agg_type == 'avg':
+                    acc[k] = (cur[0] + v[0], cur[1] + v[1])
+                elif agg_type in ['count', 'sum']:
+                    acc[k] = cur + v
+                elif agg_type == 'min':
+                    acc[k] = v if v < cur else cur
+                else:
+                    acc[k] = v if v > cur else cur
+
+    d = {c: [g[k] for g in groups] for k, c in enumerate(groupby_columns)}
+    for k, a_col in enumerate(agg_column):
+        if agg_type == 'avg':
+            d[a_col + '_avg'] = [acc[k][0] / acc[k][1] for acc in groups.values()]
+        else:
+            d[a_col + '_' + agg_type] = [acc[k] for acc in groups.values()]
+    return d
+
+
+class dataset:
+
+    def __init__(self, path):
+        try:
+            with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+                m = json.load(f)
+        except (OSError, ValueError):
+            raise ValueError(path + ' is not a partitioned dataset')
+        self.path = path
+        self.manifest = m
+        self.key = m['key']
+        self.scheme = m['scheme']
+        self.n = m['n']
+        self.bounds = m['bounds']
+        self.columns = m['columns']
+        self.partitions = m['partitions']
+
+    def __len__(self):
+        return sum(p['rows'] for p in self.partitions)
+
+    def partition_of(self, v):
+        return partition_of(self.scheme, self.n, self.bounds, v)
+
+    def files(self, k):
+        return [os.path.join(self.path, f) for f in self.partitions[k]['files']]
+
+    def read_partition(self, k, columns=None):
+        return read_segments(self.files(k), columns or self.columns)
+
+    def read(self, columns=None, partitions=None):
+        # the whole dataset (or some partitions) as one frame
+        if partitions is None:
+            partitions = range(self.n)
+        return concat(self.read_partition(k, columns) for k in partitions) or {c: [] for c in columns or self.columns}
+
+    def may_match(self, k, column, cond, val):
+        # a filter value only sits in the key's own partition; string keys
+        # are left out since = on strings is case insensitive
+        if column == self.key and cond in ['=', 'in']:
+            vals = val if cond == 'in' else [val]
+            if not any(isinstance(v, str) for v in vals):
+                return k in {self.partition_of(v) for v in vals}
+        return may_match(self.partitions[k]['stats'].get(column), cond, val)
+
+    def prune(self, columns, conditions, values, seperators=[]):
+        # partitions that may hold rows passing the filter, combined left
+        # to right like functions.filter (None stands for every partition)
+        if len(seperators) < len(columns):
+            seperators = seperators + ['and'] * (len(columns) - len(seperators))
+        every = [k for k in range(self.n) if self.partitions[k]['rows']]
+        keep = None
+        for col, cond, val, sep in zip(columns, conditions, values, seperators):
+            cur = {k for k in every if self.may_match(k, col, cond, val)}
+            if sep.lower() == 'and':
+                keep = cur if keep is None else keep & cur
+            elif sep.lower() == 'or' and keep is not None:
+                keep = keep | cur
+        return every if keep is None else sorted(keep)
+
+    def scan(self, task, args=(), columns=None, partitions=None, workers=None, backend=None):
+        # task(ops, partition frame, *args) for every (non empty) partition,
+        # task must be a module level function so worker processes can load it
+        if partitions is None:
+            partitions = [k for k in range(self.n) if self.partitions[k]['rows']]
+        jobs = [(self.files(k), columns or self.columns, task, args, backend) for k in partitions]
+        return run_jobs(scan_partition, jobs, workers, 'partition scan')
+
+    def filter(self, columns, conditions, values, seperators=[], select=None, workers=None, backend=None):
+        # functions.filter over the partitions that can match; select limits
+        # the columns read and returned
+        for c in list(columns) + list(select or []):
+            if c not in self.columns:
+                return 'Column not found : ' + str(c)
+        read = None if select is None else list(dict.fromkeys(list(select) + list(columns)))
+        parts = self.scan(
+            filter_task, (columns, conditions, values, seperators, select),
+            read, self.prune(columns, conditions, values, seperators), workers, backend,
+        )
+        return self.merge(parts, 'filter')
+
+    def groupby(self, groupby_columns, agg_column, agg_type, where=None, workers=None, backend=None):
+        # functions.groupby per partition, merged; where = (columns,
+        # conditions, values, seperators) is applied (and pruned) first. Groups
+        # of a key partitioned column cannot span partitions, so those
+        # results are only concatenated
+        if agg_type not in ['count', 'sum', 'avg', 'min', 'max']:
+            return 'Not a valid aggregation type, choose from : sum, count, min, max, avg'
+        read = list(groupby_columns) + list(agg_column)
+        partitions = None
+        if where is not None:
+            where = tuple(where) + ([],) * (4 - len(where))
+            read = read + list(where[0])
+            partitions = self.prune(*where)
+        for c in read:
+            if c not in self.columns:
+                return 'Column not found : ' + str(c)
+        parts = self.scan(
+            groupby_task, (where, groupby_columns, agg_column, agg_type),
+            list(dict.fromkeys(read)), partitions, workers, backend,
+        )
+        for p in parts:
+            if isinstance(p, str):
+                return p
+        if self.key in groupby_columns and agg_type != 'avg':
+            return self.merge(parts, 'groupby')
+        return merge_groups(parts, groupby_columns, agg_column, agg_type)
+
+    def merge(self, parts, stage):
+        for p in parts:
+            if isinstance(p, str):
+                return p
+        d = concat(parts)
+        q = current_query()
+        if q is not None and d:
+            q.check(stage, rows=len(d[list(d.keys())[0]]))
+        return d
+
+    def co_partitioned(self, other, column):
+        return (self.key == other.key == column and self.scheme == other.scheme
+                and self.n == other.n and self.bounds == other.bounds)
+
+    def join(self, other, on_columns, how='inner', left_suffix='', right_suffix='', workers=None, backend=None):
+        # functions.join partition by partition. When the datasets are not
+        # partitioned alike on the join key, the side(s) that are not are
+        # repartitioned first (the shuffle), one partition at a time
+        if len(on_columns) != 1:
+            return 'partitioned joins need a single join column'
+        on = on_columns[0]
+        if on not in self.columns or on not in other.columns:
+            return 'Column not found : ' + str(on)
+
+        tmp = []
+        try:
+            left, right = self, other
+            if not left.co_partitioned(right, on):
+                if left.key == on:
+                    layout = left
+                elif right.key == on:
+                    layout = right
+                else:
+                    layout = None
+                if left.key != on:
+                    tmp.append(tempfile.mkdtemp(prefix='cinedash-shuffle-'))
+                    left = left.repartition(tmp[-1], on, layout, max(left.n, right.n))
+                if not left.co_partitioned(right, on):
+                    tmp.append(tempfile.mkdtemp(prefix='cinedash-shuffle-'))
+                    right = right.repartition(tmp[-1], on, left)
+
+            jobs = []
+            for k in range(left.n):
+                l_rows = left.partitions[k]['rows']
+                r_rows = right.partitions[k]['rows']
+                # inner rows need both sides, outer rows the side they keep
+                if not (l_rows and r_rows) and not (
+                        (l_rows and how in ['left', 'full']) or (r_rows and how in ['right', 'full'])):
+                    continue
+                jobs.append((
+                    left.files(k), left.columns, right.files(k), right.columns,
+                    (on_columns, how, left_suffix, right_suffix), backend,
+                ))
+            return self.merge(run_jobs(join_partitions, jobs, workers, 'partitioned join'), 'join')
+        finally:
+            for d in tmp:
+                shutil.rmtree(d, ignore_errors=True)
+
+    def repartition(self, path, key, layout=None, n=8):
+        # this dataset partitioned on key like layout (or hash into n), read
+        # one partition at a time
+        scheme = 'hash' if layout is None else layout.scheme
+        n = n if layout is None else layout.n
+        bounds = None if layout is None else layout.bounds
+        frames = (self.read_partition(k) for k in range(self.n) if self.partitions[k]['rows'])
+        return write_dataset(frames, path, key, scheme, n, bounds)
+
+
+def partition_of(scheme, n, bounds, v):
+    if scheme == 'range':
+        return 0 if v is None else bisect_right(bounds, v)
+    return stable_hash(v) % n
+
+
+def write_dataset(src, path, key, scheme='hash', n=8, bounds=None, segment_rows=SEGMENT_ROWS, source=None):
+    # src is a frame, a csvscan or an iterable of frames (see export.chunks).
+    # A dataset already at path is replaced: new files are written under
+    # the next generation, then the manifest, then the old files go
+    if scheme not in SCHEMES:
+        raise ValueError('Not a valid partition scheme, choose from : ' + ', '.join(SCHEMES))
+    if scheme == 'range':
+        if not bounds or list(bounds) != sorted(bounds):
+            raise ValueError('range partitioning needs sorted bounds')
+        bounds = list(bounds)
+        n = len(bounds) + 1
+    elif n < 1:
+        raise ValueError('hash partitioning needs n >= 1')
+
+    try:
+        old = dataset(path)
+    except ValueError:
+        old = None
+    gen = old.manifest.get('generation', 0) + 1 if old is not None else 1
+    os.makedirs(path, exist_ok=True)
+
+    columns = None
+    parts = [{'files': [], 'rows': 0, 'stats': {}} for _ in range(n)]
+    buffers = [None] * n
+
+    def flush(k):
+        buf = buffers[k]
+        buffers[k] = None
+        if buf is None:
+            return
+        name = f'g{gen}-part-{k:05d}-{len(parts[k]["files"]):05d}.bin'
+        write_segment(os.path.join(path, name), buf)
+        p = parts[k]
+        p['files'].append(name)
+        p['rows'] = p['rows'] + len(buf[key])
+        for c, col in buf.items():
+            st = column_stats(col)
+            if c not in p['stats']:
+                p['stats'][c] = st
+            elif p['stats'][c] is not None:
+                cur = p['stats'][c]
+                p['stats'][c] = None if st is None else [min(st[0], cur[0]), max(st[1], cur[1])]
+
+    for df in chunks(src):
+        if columns is None:
+            columns = list(df.keys())
+            if key not in columns:
+                raise ValueError('Column not found : ' + str(key))
+        rows = [[] for _ in range(n)]
+        for i, v in enumerate(df[key]):
+            rows[partition_of(scheme, n, bounds, v)].append(i)
+        for k, idx in enumerate(rows):
+            if not idx:
+                continue
+            piece = {c: take(col, idx) for c, col in df.items()}
+            if buffers[k] is None:
+                buffers[k] = piece
+            else:
+                for c, col in piece.items():
+                    try:
+                        buffers[k][c].extend(col)
+                    except TypeError:
+                        buffers[k][c] = list(buffers[k][c]) + list(col)
+            if len(buffers[k][key]) >= segment_rows:
+                flush(k)
+    for k in range(n):
+        flush(k)
+
+    manifest = {
+        'key': key, 'scheme': scheme, 'n': n, 'bounds': bounds,
+        'columns': columns or [key], 'generation': gen, 'source': source,
+        'partitions': parts,
+    }
+    tmp = os.path.join(path, MANIFEST + '.tmp' + str(os.getpid()))
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+    if old is not None:
+        for p in old.partitions:
+            for name in p['files']:
+                try:
+                    os.remove(os.path.join(path, name))
+                except OSError:
+                    pass
+    return dataset(path)
+
+
+def partitioned_csv(source, key, scheme='hash', n=8, bounds=None, path=None):
+    # dataset for a csv file, kept in the cache directory next to it and
+    # rebuilt only when the csv or the layout changed
+    if path is None:
+        name = os.path.basename(source) + '.parts-' + key + '-' + scheme + '-' + str(
+            n if scheme == 'hash' else len(bounds or []) + 1)
+        path = os.path.join(cache_dir(source), name)
+    stamp = source_stamp(source)
+    try:
+        ds = dataset(path)
+        if ds.manifest.get('source') == stamp and ds.key == key and ds.scheme == scheme and (
+                ds.n == n if scheme == 'hash' else ds.bounds == list(bounds or [])):
+            return ds
+    except ValueError:
+        pass
+    scan = csvscan(source)
+    try:
+        return write_dataset(scan, path, key, scheme, n, bounds, source=stamp)
+    finally:
+        scan.close()
+
+
+if __name__ == '__main__':
+    # batch job: python -m engine.partition ratings.csv key [hash n | range b1,b2,...] [out dir]
+    import time
+
+    args = sys.argv[1:]
+    source = args[0] if args else os.path.join('data', 'ratings.csv')
+    key = args[1] if len(args) > 1 else 'movieId'
+    scheme = args[2] if len(args) > 2 else 'hash'
+    spec = args[3] if len(args) > 3 else '8'
+    out = args[4] if len(args) > 4 else None
+
+    t = time.perf_counter()
+    if scheme == 'range':
+        ds = partitioned_csv(source, key, 'range', bounds=[int(b) for b in spec.split(',')], path=out)
+    else:
+        ds = partitioned_csv(source, key, 'hash', n=int(spec), path=out)
+    print(f'{len(ds):,} rows in {ds.n} {ds.scheme} partitions on {ds.key} at {ds.path}, '
+          f'{time.perf_counter() - t:.2f}s')
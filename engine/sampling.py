@@ -0,0 +1,105 @@
+import random
+from array import array
+from statistics import NormalDist
+
+# row samples of a frame for approximate queries. A sample keeps the sampled
+# rows (in row order) plus a STRATUM column, and for every stratum h the
+# number of sampled rows n_h and of rows in the full frame N_h. A uniform
+# sample is one stratum; a stratified sample keeps up to k rows of every
+# value of a column (movieId, userId, ...), so small groups are not lost.
+# Estimates weight each row by N_h / n_h (Horvitz-Thompson); confidence
+# intervals come from the per stratum variance with the finite population
+# correction, so a stratum that was sampled whole adds no error.
+STRATUM = '_stratum'
+
+
+class sample:
+
+    def __init__(self, df, strata, method, column=None):
+        self.df = df
+        self.strata = strata  # stratum -> (sampled rows, rows in the frame)
+        self.method = method
+        self.column = column
+
+    def __len__(self):
+        return len(self.df[STRATUM])
+
+    def population(self):
+        return sum(N for _, N in self.strata.values())
+
+
+def reservoir(n, k, rnd):
+    # k positions out of range(n), each equally likely (algorithm R)
+    res = list(range(min(n, k)))
+    for i in range(k, n):
+        j = rnd.randrange(i + 1)
+        if j < k:
+            res[j] = i
+    return res
+
+
+def take_rows(ops, df, idx, strata_of):
+    d = ops.take(df, idx)
+    d[STRATUM] = strata_of
+    return d
+
+
+def uniform_sample(ops, df, k, seed=0):
+    # k rows drawn uniformly without replacement
+    n = ops.df_len(df)
+    idx = sorted(reservoir(n, k, random.Random(seed)))
+    return sample(take_rows(ops, df, idx, array('q', [0] * len(idx))), {0: (len(idx), n)}, 'uniform')
+
+
+def stratified_sample(ops, df, column, k, seed=0):
+    # up to k rows of every value of column, one reservoir per value in a
+    # single pass over the column
+    rnd = random.Random(seed)
+    col = df[column]
+    seen = {}
+    res = {}
+    for i in range(len(col)):
+        h = col[i]
+        c = seen.get(h, 0)
+        seen[h] = c + 1
+        if c < k:
+            res.setdefault(h, []).append(i)
+        else:
+            j = rnd.randrange(c + 1)
+            if j < k:
+                res[h][j] = i
+
+    idx = sorted(i for rows in res.values() for i in rows)
+    strata = {h: (len(rows), seen[h]) for h, rows in res.items()}
+    return sample(take_rows(ops, df, idx, [col[i] for i in idx]), strata, 'stratified', column)
+
+
+def z_value(confidence):
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def stratum_variance(strata, sums):
+    # variance of sum_h N_h / n_h * sum(z) over the sampled rows of h, from
+    # sums = {h: (sum z, sum z^2)}; rows of h outside the group have z = 0.
+    # A stratum with one sampled row out of several has no variance of its
+    # own: it takes the pooled variance of the strata that have one, or its
+    # mean square when none has, rather than adding nothing
+    own = {}
+    pooled = pooled_df = 0.0
+    for h, (s1, s2) in sums.items():
+        n = strata[h][0]
+        if n >= 2:
+            own[h] = max((s2 - s1 * s1 / n) / (n - 1), 0.0)
+            pooled = pooled + (n - 1) * own[h]
+            pooled_df = pooled_df + n - 1
+
+    var = 0.0
+    for h, (s1, s2) in sums.items():
+        n, N = strata[h]
+        if n >= N:
+            continue
+        s = own.get(h)
+        if s is None:
+            s = pooled / pooled_df if pooled_df else s2 / n
+        var = var + N * N * (1 - n / N) * s / n
+    return var
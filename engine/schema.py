@@ -0,0 +1,256 @@
+import os
+import re
+from array import array
+
+from engine.multivalue import multivalue, MOVIELENS_GENRES
+
+YEAR_RE = re.compile(r"\(\d{4}\)")
+
+# compact storage for columns that can never hold None
+TYPECODES = {'int': 'q', 'float': 'd'}
+# 'multi': '|' separated labels, stored as a bitmask per row (multivalue)
+CONVERTERS = {'int': int, 'float': float, 'str': str, 'multi': str}
+
+
+def split_title_year(title):
+    # "Toy Story (1995)" -> (1995, "Toy Story"), no year -> (0, title)
+    m = YEAR_RE.search(title)
+    if m is None:
+        return 0, title
+    return int(m.group()[1:5]), title.replace(m.group(), '').strip()
+
+
+class field:
+
+    def __init__(self, name, type='str', nullable=False, labels=None):
+        if type not in CONVERTERS:
+            raise ValueError('Not a valid field type, choose from : ' + ', '.join(CONVERTERS))
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+        self.labels = labels
+
+    def new_column(self):
+        if self.type == 'multi':
+            return multivalue(self.labels)
+        if not self.nullable and self.type in TYPECODES:
+            return array(TYPECODES[self.type])
+        return []
+
+    def convert_column(self, values):
+        # whole batch of one column at once; ValueError on any bad cell
+        if self.type in ['str', 'multi']:
+            return list(values)
+        if not self.nullable:
+            return array(TYPECODES[self.type], map(CONVERTERS[self.type], values))
+        return list(map(CONVERTERS[self.type], values))
+
+
+class derivedfield(field):
+
+    # a column computed from another column of the same row while parsing.
+    # fn(source value) -> (derived value, new source value)
+    def __init__(self, name, type, source, fn, nullable=False):
+        field.__init__(self, name, type, nullable)
+        self.source = source
+        self.fn = fn
+
+
+class schema:
+
+    def __init__(self, fields, derived=()):
+        self.fields = list(fields)
+        self.derived = list(derived)
+
+    def field(self, name):
+        for f in self.fields:
+            if f.name == name:
+                return f
+        return None
+
+    def bind(self, header):
+        # match the schema to a file's header; columns the schema does not
+        # declare are read as nullable strings
+        fields = []
+        for name in header:
+            f = self.field(name)
+            fields.append(f if f is not None else field(name, 'str', nullable=True))
+
+        derived = []
+        for d in self.derived:
+            if d.source in header:
+                derived.append((header.index(d.source), d))
+
+        return boundschema(fields, derived)
+
+
+class boundschema:
+
+    def __init__(self, fields, derived):
+        self.fields = fields
+        self.derived = derived
+        self.names = [f.name for f in fields] + [d.name for _, d in derived]
+        self.convs = [CONVERTERS[f.type] for f in fields]
+
+    def new_frame(self):
+        d = {}
+        for f in self.fields:
+            d[f.name] = f.new_column()
+        for _, f in self.derived:
+            d[f.name] = f.new_column()
+        return d
+
+    def extend(self, d, rows, linenos, errors):
+        # convert a batch of split lines column by column and append it to
+        # the frame; a batch with a bad row is redone row by row so every
+        # problem is reported with its line number
+        n = len(self.fields)
+        if rows and set(map(len, rows)) == {n}:
+            cols = list(zip(*rows))
+            try:
+                vals = [f.convert_column(col) for f, col in zip(self.fields, cols)]
+            except ValueError:
+                vals = None
+
+            if vals is not None:
+                for i, f in self.derived:
+                    out = [f.fn(x) for x in vals[i]]
+                    vals.append([v for v, _ in out])
+                    vals[i] = [x for _, x in out]
+                for name, col in zip(self.names, vals):
+                    d[name].extend(col)
+                return
+
+        cols = [d[name] for name in self.names]
+        for parts, lineno in zip(rows, linenos):
+            vals = self.convert(parts, lineno, errors)
+            if vals is not None:
+                for col, v in zip(cols, vals):
+                    col.append(v)
+
+    def convert(self, parts, lineno, errors):
+        # typed values for one row, or None when the row has to be dropped;
+        # every problem is reported in errors with its line number
+        if len(parts) != len(self.fields):
+            errors.append(f'line {lineno}: expected {len(self.fields)} fields, got {len(parts)}')
+            return None
+
+        vals = self.convert_cells(parts, lineno, errors)
+        if vals is None:
+            return None
+
+        for i, d in self.derived:
+            src = vals[i]
+            if src is None:
+                vals.append(None if d.nullable else 0)
+                continue
+            value, vals[i] = d.fn(src)
+            vals.append(value)
+
+        return vals
+
+    def convert_cells(self, parts, lineno, errors):
+        # slow path, one cell at a time to find the bad ones
+        vals = []
+        ok = True
+        for f, conv, x in zip(self.fields, self.convs, parts):
+            # an empty number is None; an empty string stays '', as on the
+            # batch path (convert_column)
+            if x == '' and f.nullable and f.type in TYPECODES:
+                vals.append(None)
+                continue
+            try:
+                vals.append(conv(x))
+            except ValueError:
+                if f.nullable:
+                    errors.append(f'line {lineno}: {f.name} {x!r} is not a valid {f.type}, stored as empty')
+                    vals.append(None)
+                else:
+                    errors.append(f'line {lineno}: {f.name} {x!r} is not a valid {f.type}, row skipped')
+                    ok = False
+        return vals if ok else None
+
+
+def infer_schema(header, sample):
+    # narrowest type that parses every sampled value; empty cells make a
+    # column nullable
+    fields = []
+    for i, name in enumerate(header):
+        vals = [r[i] for r in sample if i < len(r)]
+        nullable = any(v == '' for v in vals)
+        vals = [v for v in vals if v != '']
+
+        ftype = 'str'
+        for t in ['int', 'float']:
+            try:
+                for v in vals:
+                    CONVERTERS[t](v)
+            except ValueError:
+                continue
+            if vals:
+                ftype = t
+                break
+        # ids with leading zeros (imdbId) are labels, not numbers
+        if ftype == 'int' and any(len(v) > 1 and v[0] == '0' for v in vals):
+            ftype = 'str'
+
+        fields.append(field(name, ftype, nullable))
+
+    return schema(fields)
+
+
+MOVIES = schema(
+    [field('movieId', 'int'), field('title', 'str'), field('genres', 'multi', labels=MOVIELENS_GENRES)],
+    derived=[derivedfield('year', 'int', 'title', split_title_year)],
+)
+
+RATINGS = schema([
+    field('userId', 'int'),
+    field('movieId', 'int'),
+    field('rating', 'float'),
+    field('timestamp', 'int'),
+])
+
+TAGS = schema([
+    field('userId', 'int'),
+    field('movieId', 'int'),
+    field('tag', 'str'),
+    field('timestamp', 'int'),
+])
+
+LINKS = schema([
+    field('movieId', 'int'),
+    field('imdbId', 'str'),
+    field('tmdbId', 'int', nullable=True),
+])
+
+BUILTIN = {
+    'movies': MOVIES,
+    'ratings': RATINGS,
+    'tags': TAGS,
+    'links': LINKS,
+}
+
+
+# column types create_frame has always used for these names
+NAMED_TYPES = {
+    'movieId': 'int',
+    'userId': 'int',
+    'year': 'int',
+    'rating': 'float',
+    'timestamp': 'int',
+}
+
+
+def named_schema(columns, extract_year=False):
+    fields = [field(c, NAMED_TYPES.get(c, 'str')) for c in columns]
+    derived = []
+    if extract_year and len(columns) > 1:
+        derived.append(derivedfield('year', 'int', columns[1], split_title_year))
+    return schema(fields, derived)
+
+
+def builtin_schema(path):
+    # MovieLens files by name: data/ratings.csv, tests/tiny/ratings_20.csv, ...
+    name = os.path.basename(path).split('.')[0].split('_')[0]
+    return BUILTIN.get(name)
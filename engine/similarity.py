@@ -0,0 +1,353 @@
+import heapq
+import os
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from math import sqrt
+from multiprocessing import get_context
+
+from engine.cache import cache_path, read_arrays, source_stamp, write_arrays
+from engine.sparse import ratings_matrix
+
+METHODS = ['cosine', 'adjusted']
+
+
+class similarityindex:
+
+    # top k most similar movies of every movie, as one sorted id array and
+    # one slice of (neighbor id, score) per movie, best first. A lookup is a
+    # binary search plus a slice of k entries.
+    # fingerprints of every user row and movie column remember the ratings
+    # the lists were built from, and the movies every user had rated then
+    # (user_ptr / user_movies, one slice per user_ids entry), so update()
+    # only recomputes the movies a change can affect
+    ARRAYS = [
+        'ids', 'ptr', 'neighbors', 'scores',
+        'user_ids', 'user_digests', 'movie_keys', 'movie_digests',
+        'user_ptr', 'user_movies',
+    ]
+
+    def __init__(self, k=20, method='adjusted', min_common=3, min_ratings=5):
+        self.k = k
+        self.method = method
+        self.min_common = min_common
+        self.min_ratings = min_ratings
+        self.ids = array('q')
+        self.ptr = array('q', [0])
+        self.neighbors = array('q')
+        self.scores = array('d')
+        self.user_ids = array('q')
+        self.user_digests = array('q')
+        self.movie_keys = array('q')
+        self.movie_digests = array('q')
+        self.user_ptr = array('q', [0])
+        self.user_movies = array('q')
+
+    def params(self):
+        return {
+            'k': self.k, 'method': self.method,
+            'min_common': self.min_common, 'min_ratings': self.min_ratings,
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors_of(self, movie_id):
+        # (neighbor ids, scores), best first; empty for unknown movies
+        p = bisect_left(self.ids, movie_id)
+        if p == len(self.ids) or self.ids[p] != movie_id:
+            return [], []
+        a, b = self.ptr[p], self.ptr[p + 1]
+        return self.neighbors[a:b].tolist(), self.scores[a:b].tolist()
+
+    def lookup(self, movie_id, limit=None):
+        ids, scores = self.neighbors_of(movie_id)
+        if limit is not None:
+            ids, scores = ids[:limit], scores[:limit]
+        return {'movieId': ids, 'similarity': scores}
+
+    def build(self, matrix, workers=None):
+        lists = compute_neighbors(matrix, candidates(matrix, self.min_ratings), self.params(), workers)
+        self.fill(matrix, lists)
+        return self
+
+    def update(self, matrix, workers=None):
+        # recompute only the movies whose neighbor list can have changed;
+        # returns how many were recomputed
+        users, movies = digests(matrix)
+        old_users = dict(zip(self.user_ids, self.user_digests))
+        old_movies = dict(zip(self.movie_keys, self.movie_digests))
+        before = self.rated_before()
+
+        # a movie's vector changed if its own ratings did, or (adjusted
+        # cosine) if one of its raters' mean did, before or after the change
+        changed = {m for m, d in movies.items() if old_movies.get(m) != d}
+        changed.update(m for m in old_movies if m not in movies)
+        for u in set(users) | set(old_users):
+            if old_users.get(u) != users.get(u):
+                changed.update(before.get(u, ()))
+                if u in users:
+                    changed.update(matrix.row(u)[matrix.col_column])
+
+        # a changed vector moves its score with every movie sharing a rater
+        # with it, now or in the ratings the lists were built from (a pair
+        # linked only through a removed rating must be recomputed too)
+        raters_before = {}
+        for u, rated in before.items():
+            for m in rated:
+                if m in changed:
+                    raters_before.setdefault(m, []).append(u)
+        dirty = set(changed)
+        for m in changed:
+            for u in matrix.column(m)[matrix.row_column]:
+                dirty.update(matrix.row(u)[matrix.col_column])
+            for u in raters_before.get(m, ()):
+                dirty.update(before[u])
+
+        lists = {}
+        for m in self.ids.tolist():
+            if m not in dirty:
+                lists[m] = self.neighbors_of(m)
+
+        todo = [m for m in candidates(matrix, self.min_ratings) if m not in lists]
+        lists.update(compute_neighbors(matrix, todo, self.params(), workers))
+        self.fill(matrix, lists, users, movies)
+        return len(todo)
+
+    def rated_before(self):
+        # user id -> the movie ids they had rated when the lists were built
+        ptr = self.user_ptr
+        return {u: self.user_movies[ptr[k]:ptr[k + 1]].tolist() for k, u in enumerate(self.user_ids)}
+
+    def fill(self, matrix, lists, users=None, movies=None):
+        if users is None:
+            users, movies = digests(matrix)
+        live = set(candidates(matrix, self.min_ratings))
+
+        self.ids = array('q')
+        self.ptr = array('q', [0])
+        self.neighbors = array('q')
+        self.scores = array('d')
+        for m in sorted(lists):
+            if m not in live:
+                continue
+            ids, scores = lists[m]
+            self.ids.append(m)
+            self.neighbors.extend(ids)
+            self.scores.extend(scores)
+            self.ptr.append(len(self.neighbors))
+
+        self.user_ids = array('q', sorted(users))
+        self.user_digests = array('q', [users[u] for u in self.user_ids])
+        self.movie_keys = array('q', sorted(movies))
+        self.movie_digests = array('q', [movies[m] for m in self.movie_keys])
+
+        self.user_ptr = array('q', [0])
+        self.user_movies = array('q')
+        for u in self.user_ids:
+            self.user_movies.extend(matrix.row(u)[matrix.col_column])
+            self.user_ptr.append(len(self.user_movies))
+
+    def memory_usage(self):
+        return sum(sys.getsizeof(getattr(self, name)) for name in self.ARRAYS)
+
+    def save(self, path, meta=None):
+        meta = dict(meta or {})
+        meta['params'] = self.params()
+        write_arrays(path, {name: getattr(self, name) for name in self.ARRAYS}, meta)
+
+    @staticmethod
+    def load(path):
+        # -> (index, meta) from a file written by save()
+        arrays, meta = read_arrays(path)
+        idx = similarityindex(**meta['params'])
+        for name in similarityindex.ARRAYS:
+            setattr(idx, name, arrays[name])
+        return idx, meta
+
+
+def candidates(matrix, min_ratings):
+    # movies with too few ratings get no list and are no one's neighbor
+    out = []
+    for k, m in enumerate(matrix.col_ids):
+        if matrix.col_ptr[k + 1] - matrix.col_ptr[k] >= min_ratings:
+            out.append(m)
+    return out
+
+
+def digests(matrix):
+    # one fingerprint per user row and per movie column of the matrix
+    # (crc32, stable across runs unlike hash())
+    users = {}
+    for k, u in enumerate(matrix.row_ids):
+        a, b = matrix.row_ptr[k], matrix.row_ptr[k + 1]
+        users[u] = zlib.crc32(matrix.row_vals[a:b], zlib.crc32(matrix.row_cols[a:b]))
+
+    movies = {}
+    for k, m in enumerate(matrix.col_ids):
+        a, b = matrix.col_ptr[k], matrix.col_ptr[k + 1]
+        movies[m] = zlib.crc32(matrix.col_vals[a:b], zlib.crc32(matrix.col_rows[a:b]))
+    return users, movies
+
+
+def vectors(matrix, method, min_ratings):
+    # per user (movie positions, weights) over the candidate movies, and
+    # the norm of every movie's column; adjusted cosine centers each
+    # rating on the user's mean first
+    keep = array('b', [
+        matrix.col_ptr[j + 1] - matrix.col_ptr[j] >= min_ratings
+        for j in range(len(matrix.col_ids))
+    ])
+    norms = [0.0] * len(matrix.col_ids)
+    rows = []
+    for k in range(len(matrix.row_ids)):
+        a, b = matrix.row_ptr[k], matrix.row_ptr[k + 1]
+        mean = matrix.row_means[k] if method == 'adjusted' else 0.0
+        cols = []
+        vals = []
+        for j, r in zip(matrix.row_cols[a:b], matrix.row_vals[a:b]):
+            if keep[j]:
+                w = r - mean
+                cols.append(j)
+                vals.append(w)
+                norms[j] += w * w
+        rows.append((cols, vals))
+    return rows, [sqrt(n) for n in norms]
+
+
+# state of a pool process, set once by start_worker; the in-process path
+# passes its own state instead, so concurrent builds never share one
+WORKER = {}
+
+
+def start_worker(matrix, params):
+    # pool processes run at a lower priority, like the app's loader worker
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    WORKER.update(worker_state(matrix, params))
+
+
+def worker_state(matrix, params):
+    rows, norms = vectors(matrix, params['method'], params['min_ratings'])
+    if params['method'] == 'adjusted':
+        means = matrix.row_means
+    else:
+        means = [0.0] * len(matrix.row_ids)
+    return dict(matrix=matrix, params=params, rows=rows, norms=norms, means=means)
+
+
+def neighbors_chunk(movie_ids):
+    # pool task: a chunk against the process's state
+    return neighbors(WORKER, movie_ids)
+
+
+def neighbors(state, movie_ids):
+    # sparse product of one movie's column with the user rows it touches:
+    # only co-rated movies are ever visited. Pairs with fewer than
+    # min_common shared raters are pruned before the top k is taken.
+    matrix = state['matrix']
+    params = state['params']
+    rows = state['rows']
+    norms = state['norms']
+    means = state['means']
+    k, min_common = params['k'], params['min_common']
+    col_ids = matrix.col_ids
+
+    n = len(col_ids)
+    dot = [0.0] * n
+    common = [0] * n
+    out = {}
+    for m in movie_ids:
+        i = bisect_left(col_ids, m)
+        touched = []
+        for p in range(matrix.col_ptr[i], matrix.col_ptr[i + 1]):
+            u = matrix.col_rows[p]
+            w = matrix.col_vals[p] - means[u]
+            cols, vals = rows[u]
+            for j, v in zip(cols, vals):
+                if common[j] == 0:
+                    touched.append(j)
+                common[j] += 1
+                dot[j] += w * v
+
+        scored = []
+        ni = norms[i]
+        for j in touched:
+            if j != i and common[j] >= min_common and ni and norms[j]:
+                scored.append((dot[j] / (ni * norms[j]), -col_ids[j]))
+            dot[j] = 0.0
+            common[j] = 0
+
+        best = heapq.nlargest(k, scored)
+        out[m] = ([-j for _, j in best], [s for s, _ in best])
+    return out
+
+
+def compute_neighbors(matrix, movie_ids, params, workers=None):
+    # {movieId: (neighbor ids, scores)}; chunks of movies go to a process
+    # pool, each worker holding its own copy of the matrix vectors
+    if params['method'] not in METHODS:
+        raise ValueError('Not a valid similarity method, choose from : ' + ', '.join(METHODS))
+    movie_ids = list(movie_ids)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(movie_ids) < 64:
+        return neighbors(worker_state(matrix, params), movie_ids)
+
+    size = max(16, len(movie_ids) // (workers * 4))
+    chunks = [movie_ids[a:a + size] for a in range(0, len(movie_ids), size)]
+    out = {}
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context('spawn'),
+        initializer=start_worker, initargs=(matrix, params),
+    ) as pool:
+        for part in pool.map(neighbors_chunk, chunks):
+            out.update(part)
+    return out
+
+
+def similar_movies(path, workers=None, **params):
+    # similarity index for a ratings csv, kept in the binary cache next to
+    # it. A cache built from an older ratings file is updated in place,
+    # recomputing only the movies the changed ratings can affect
+    idx = similarityindex(**params)
+    out = cache_path(path, 'similar-' + idx.method + '-' + str(idx.k))
+    stamp = source_stamp(path)
+    matrix = ratings_matrix(path)
+
+    try:
+        old, meta = similarityindex.load(out)
+    except (OSError, ValueError, KeyError):
+        old, meta = None, {}
+
+    if old is not None and old.params() == idx.params():
+        if meta.get('source') == stamp:
+            return old
+        old.update(matrix, workers)
+        idx = old
+    else:
+        idx.build(matrix, workers)
+
+    try:
+        idx.save(out, {'source': stamp})
+    except OSError:
+        pass
+    return idx
+
+
+if __name__ == '__main__':
+    # batch job: python -m engine.similarity [ratings.csv] [k] [method] [workers]
+    import time
+
+    args = sys.argv[1:]
+    path = args[0] if args else os.path.join('data', 'ratings.csv')
+    k = int(args[1]) if len(args) > 1 else 20
+    method = args[2] if len(args) > 2 else 'adjusted'
+    workers = int(args[3]) if len(args) > 3 else None
+
+    t = time.perf_counter()
+    idx = similar_movies(path, workers=workers, k=k, method=method)
+    print(f'{len(idx)} movies, top {k} {method} neighbors, {time.perf_counter() - t:.2f}s')
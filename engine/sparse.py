@@ -0,0 +1,194 @@
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, repeat
+
+from engine.cache import cached, read_arrays, write_arrays
+from engine.parser import csvreader
+
+class ratingmatrix:
+
+    # sparse user x movie matrix of a ratings frame, stored twice:
+    # CSR (one slice of movies + ratings per user) and CSC (one slice of
+    # users + ratings per movie). row(user) and column(movie) read only
+    # that slice, so a lookup costs the number of ratings it returns,
+    # not a scan of the whole frame. Ids are kept sorted, a lookup finds
+    # its slice with a binary search.
+    ARRAYS = [
+        'row_ids', 'col_ids',
+        'row_ptr', 'row_cols', 'row_vals',
+        'col_ptr', 'col_rows', 'col_vals',
+        'row_means', 'col_means',
+    ]
+
+    def __init__(self, df=None, row='userId', column='movieId', value='rating'):
+        self.row_column = row
+        self.col_column = column
+        self.value_column = value
+        if df is not None:
+            self.build(df)
+
+    def build(self, df):
+        rows = df[self.row_column]
+        cols = df[self.col_column]
+        vals = df[self.value_column]
+
+        self.row_ids = array('q', sorted(set(rows)))
+        self.col_ids = array('q', sorted(set(cols)))
+        rpos = {v: k for k, v in enumerate(self.row_ids)}
+        cpos = {v: k for k, v in enumerate(self.col_ids)}
+        r = [rpos[x] for x in rows]
+        c = [cpos[x] for x in cols]
+
+        n_cols = len(self.col_ids)
+        n_rows = len(self.row_ids)
+        order = sorted(range(len(r)), key=lambda i: r[i] * n_cols + c[i])
+        self.row_ptr = self.pointers(r, n_rows)
+        self.row_cols = array('q', [c[i] for i in order])
+        self.row_vals = array('d', [vals[i] for i in order])
+
+        order = sorted(range(len(r)), key=lambda i: c[i] * n_rows + r[i])
+        self.col_ptr = self.pointers(c, n_cols)
+        self.col_rows = array('q', [r[i] for i in order])
+        self.col_vals = array('d', [vals[i] for i in order])
+
+        self.row_means = self.means(self.row_ptr, self.row_vals)
+        self.col_means = self.means(self.col_ptr, self.col_vals)
+        return self
+
+    def pointers(self, pos, n):
+        # slice k is [ptr[k], ptr[k+1])
+        counts = [0] * (n + 1)
+        for p in pos:
+            counts[p + 1] += 1
+        return array('q', accumulate(counts))
+
+    def means(self, ptr, vals):
+        out = array('d')
+        for k in range(len(ptr) - 1):
+            a, b = ptr[k], ptr[k + 1]
+            out.append(sum(vals[a:b]) / (b - a) if b > a else 0.0)
+        return out
+
+    def __len__(self):
+        return len(self.row_vals)
+
+    def shape(self):
+        return len(self.row_ids), len(self.col_ids)
+
+    def position(self, ids, value):
+        k = bisect_left(ids, value)
+        if k < len(ids) and ids[k] == value:
+            return k
+        return None
+
+    def row(self, row_id):
+        # {column: [...], value: [...]} for one row id, in column id order
+        k = self.position(self.row_ids, row_id)
+        if k is None:
+            return {self.col_column: [], self.value_column: []}
+        a, b = self.row_ptr[k], self.row_ptr[k + 1]
+        ids = self.col_ids
+        return {
+            self.col_column: [ids[j] for j in self.row_cols[a:b]],
+            self.value_column: self.row_vals[a:b].tolist(),
+        }
+
+    def column(self, col_id):
+        # {row: [...], value: [...]} for one column id, in row id order
+        k = self.position(self.col_ids, col_id)
+        if k is None:
+            return {self.row_column: [], self.value_column: []}
+        a, b = self.col_ptr[k], self.col_ptr[k + 1]
+        ids = self.row_ids
+        return {
+            self.row_column: [ids[j] for j in self.col_rows[a:b]],
+            self.value_column: self.col_vals[a:b].tolist(),
+        }
+
+    def get(self, row_id, col_id):
+        k = self.position(self.row_ids, row_id)
+        j = self.position(self.col_ids, col_id)
+        if k is None or j is None:
+            return None
+        a, b = self.row_ptr[k], self.row_ptr[k + 1]
+        p = bisect_left(self.row_cols, j, a, b)
+        if p < b and self.row_cols[p] == j:
+            return self.row_vals[p]
+        return None
+
+    def row_count(self, row_id):
+        k = self.position(self.row_ids, row_id)
+        return 0 if k is None else self.row_ptr[k + 1] - self.row_ptr[k]
+
+    def row_mean(self, row_id):
+        k = self.position(self.row_ids, row_id)
+        return None if k is None else self.row_means[k]
+
+    def column_count(self, col_id):
+        k = self.position(self.col_ids, col_id)
+        return 0 if k is None else self.col_ptr[k + 1] - self.col_ptr[k]
+
+    def column_mean(self, col_id):
+        k = self.position(self.col_ids, col_id)
+        return None if k is None else self.col_means[k]
+
+    def stats(self, ids, ptr, means, name):
+        counts = array('q', [ptr[k + 1] - ptr[k] for k in range(len(ids))])
+        return {
+            name: array('q', ids),
+            self.value_column + '_count': counts,
+            self.value_column + '_avg': array('d', means),
+        }
+
+    def row_stats(self):
+        # one row per row id: id, count and mean, like groupby count + avg
+        return self.stats(self.row_ids, self.row_ptr, self.row_means, self.row_column)
+
+    def column_stats(self):
+        return self.stats(self.col_ids, self.col_ptr, self.col_means, self.col_column)
+
+    def to_frame(self):
+        # back to a {row, column, value} frame, ordered by row then column id
+        rows = array('q')
+        for k, row_id in enumerate(self.row_ids):
+            rows.extend(repeat(row_id, self.row_ptr[k + 1] - self.row_ptr[k]))
+        ids = self.col_ids
+        return {
+            self.row_column: rows,
+            self.col_column: array('q', [ids[j] for j in self.row_cols]),
+            self.value_column: array('d', self.row_vals),
+        }
+
+    def memory_usage(self):
+        return sum(sys.getsizeof(getattr(self, name)) for name in self.ARRAYS)
+
+    def save(self, path, meta=None):
+        meta = dict(meta or {})
+        meta['names'] = [self.row_column, self.col_column, self.value_column]
+        write_arrays(path, {name: getattr(self, name) for name in self.ARRAYS}, meta)
+
+    @staticmethod
+    def load(path):
+        # -> (matrix, meta) from a file written by save()
+        arrays, meta = read_arrays(path)
+        row, column, value = meta['names']
+        m = ratingmatrix(row=row, column=column, value=value)
+        for name in ratingmatrix.ARRAYS:
+            setattr(m, name, arrays[name])
+        return m, meta
+
+
+def ratings_matrix(path, row='userId', column='movieId', value='rating'):
+    # matrix for a ratings csv, read from the binary cache when the cache
+    # was built from this exact file, otherwise parsed, built and cached
+    def build():
+        df = csvreader().read_frame(path)
+        return ratingmatrix(df, row, column, value)
+
+    return cached(
+        path, 'matrix-' + '-'.join([row, column, value]),
+        build,
+        lambda m, p, meta: m.save(p, meta),
+        ratingmatrix.load,
+    )
@@ -0,0 +1,57 @@
+import pickle
+import tempfile
+
+class spillfile:
+
+    # an append-only temp file of pickled record batches; records are
+    # buffered in small batches so only one batch is in memory at a time
+    def __init__(self, batch=4096):
+        self.file = tempfile.TemporaryFile(prefix='cinedash-spill-')
+        self.batch = batch
+        self.buf = []
+        self.count = 0
+
+    def append(self, rec):
+        self.buf.append(rec)
+        self.count = self.count + 1
+        if len(self.buf) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            pickle.dump(self.buf, self.file, pickle.HIGHEST_PROTOCOL)
+            self.buf = []
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.flush()
+        self.file.seek(0)
+        while True:
+            try:
+                batch = pickle.load(self.file)
+            except EOFError:
+                return
+            for rec in batch:
+                yield rec
+
+    def close(self):
+        self.file.close()
+
+
+class partitionset:
+
+    # (key, payload) records hash partitioned into n spill files
+    def __init__(self, n):
+        self.parts = [spillfile() for _ in range(n)]
+
+    def add(self, key, rec):
+        self.parts[hash(key) % len(self.parts)].append(rec)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def close(self):
+        for p in self.parts:
+            p.close()
@@ -0,0 +1,90 @@
+from engine.derived import typed
+from engine.loader import backgroundloader
+from engine.sync import rwlock
+
+class frozenframe(dict):
+
+    # a read-only frame: columns can be read like any dict-of-lists frame,
+    # but not added, replaced or removed. dict(frame) gives a mutable copy.
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('frames in the store are read-only, copy with dict(frame) first')
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __reduce__(self):
+        return (frozenframe, (dict(self),))
+
+
+class framestore:
+
+    # one store per process, shared by every session. Each load builds a
+    # snapshot (a backgroundloader whose results are frozen frames), so all
+    # sessions read the same column objects without copying them.
+    # reload() builds a complete new snapshot next to the live one and swaps
+    # it in with a single assignment; a query keeps the snapshot it started
+    # with, so a refresh never changes data under a running query.
+    # The store's own fields are guarded by a read-write lock: sessions
+    # read them together, reload() and swap() change them together.
+    def __init__(self, make_steps):
+        self.make_steps = make_steps
+        self.lock = rwlock()
+        self.version = 1
+        self.pending = None
+        self.reload_error = None
+        self.live = self.build(None)
+
+    def freeze(self, obj):
+        if not isinstance(obj, dict) or isinstance(obj, frozenframe):
+            return obj
+
+        # list columns of ints / floats become typed arrays (what the numpy
+        # backend vectorizes), other lists read-only tuples
+        d = {}
+        for c, col in obj.items():
+            if isinstance(col, list):
+                col = typed(col)
+            d[c] = tuple(col) if isinstance(col, list) else col
+        return frozenframe(d)
+
+    def build(self, on_done):
+        steps = []
+        for name, label, fn in self.make_steps():
+            steps.append((name, label, lambda ld, fn=fn: self.freeze(fn(ld))))
+        return backgroundloader(steps, on_done=on_done).start()
+
+    def snapshot(self):
+        with self.lock.read():
+            return self.live
+
+    def state(self):
+        # (snapshot, reloading, reload error) as of one moment
+        with self.lock.read():
+            return self.live, self.pending is not None, self.reload_error
+
+    def reloading(self):
+        with self.lock.read():
+            return self.pending is not None
+
+    def reload(self):
+        with self.lock.write():
+            if self.pending is not None or not self.live.finished():
+                return False
+            self.reload_error = None
+            self.pending = self.build(self.swap)
+        return True
+
+    def swap(self, snap):
+        with self.lock.write():
+            if snap.errors:
+                self.reload_error = '; '.join(snap.errors.values())
+            else:
+                self.live = snap
+                self.version += 1
+            self.pending = None
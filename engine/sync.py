@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+
+class rwlock:
+
+    # many readers at a time or one writer. A writer that is waiting keeps
+    # new readers out, so a steady stream of queries cannot starve a reload
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting = 0
+
+    def acquire_read(self):
+        with self.cond:
+            self.cond.wait_for(lambda: not self.writer and not self.waiting)
+            self.readers += 1
+
+    def release_read(self):
+        with self.cond:
+            self.readers -= 1
+            if not self.readers:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        with self.cond:
+            self.waiting += 1
+            self.cond.wait_for(lambda: not self.writer and not self.readers)
+            self.waiting -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.cond:
+            self.writer = False
+            self.cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class once:
+
+    # a value built on first use and shared afterwards; the build runs at
+    # most once even when several sessions ask for it at the same time
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.done = False
+
+    def get(self, build):
+        if self.done:
+            return self.value
+        with self.lock:
+            if not self.done:
+                self.value = build()
+                self.done = True
+        return self.value
@@ -1,5 +1,10 @@
+import io
 import os
 import sys
+import time
+import calendar
+import tempfile
+import uuid
 import streamlit as st
 
 st.set_page_config(
@@ -13,19 +18,52 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from engine.parser import csvreader
+# MovieLens csv files; CINEDASH_DATA_DIR points the app at another copy
+# (e.g. synthetic data from bench/loadtest.py)
+DATA_DIR = os.environ.get("CINEDASH_DATA_DIR") or os.path.join(BASE_DIR, "data")
+
+from engine.parser import csvscan
 from engine.dataframe import dataframe
 from engine.ops import functions
+from engine.expr import pred, all_of, any_of, negate
+from engine.index import sortedindex, hashindex
+from engine.store import framestore
+from engine.sparse import ratings_matrix
+from engine.similarity import similar_movies
+from engine.memory import budget as memory_budget
+from engine.backend import available as available_backends
+from engine.cancel import querycontext
+from engine.cube import cube
+from engine.encoding import compress_frame
+from engine.sampling import STRATUM, uniform_sample, stratified_sample
+from engine.export import write_csv, write_columnar, to_arrow
+
+# vectorized ops when numpy is installed (same results as the python
+# backend, see bench/bench_backends.py); CINEDASH_BACKEND overrides
+BACKEND = os.environ.get("CINEDASH_BACKEND") or (
+    "numpy" if "numpy" in available_backends() else "python"
+)
+
+# histogram edges for ratings: one bin per half star, 0.5 to 5.0
+RATING_BINS = [0.25 + 0.5 * k for k in range(11)]
+
+# query result downloads, served from disk by streamlit's static file
+# serving (server.enableStaticServing, see .streamlit/config.toml) and
+# removed an hour after they were written
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exports")
+EXPORT_URL = "app/static/exports/"
+EXPORT_TTL = 3600
 
 
 def dict_len(df):
     return len(df[list(df.keys())[0]]) if df else 0
 
 
-def to_rows(df, cols=None, limit=None):
+def to_table(df, cols=None, limit=None, offset=0):
     """
-    Convert your dict-of-lists dataframe to a list of row dicts
-    so Streamlit can show it nicely without pandas.
+    One page (head(limit, offset)) of a dict-of-lists dataframe for
+    st.dataframe, handed over column by column: a pyarrow table that
+    wraps the typed column buffers, no per-row dicts.
     """
     if not df or isinstance(df, str):
         return []
@@ -34,16 +72,67 @@ def to_rows(df, cols=None, limit=None):
         cols = list(df.keys())
 
     l = len(df[cols[0]])
-    if limit is not None:
-        l = min(l, limit)
+    page = functions(BACKEND).head(
+        {c: df[c] for c in cols}, l if limit is None else limit, offset
+    )
+    return to_arrow(page, cols)
+
+
+def export_result(ops_obj, df, sort_col, fmt):
+    """
+    Writes a query result chunk by chunk into the app's static folder and
+    returns its URL. The server streams the file from disk, so neither
+    writing nor downloading it holds the full file in memory. Exports
+    older than EXPORT_TTL are removed on the way.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    now = time.time()
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if not name.startswith(".") and now - os.path.getmtime(path) > EXPORT_TTL:
+                os.remove(path)
+        except OSError:
+            pass  # removed by another session meanwhile
+
+    src = df
+    if sort_col:
+        src = ops_obj.order_rows(df, [sort_col], type="dsc")
+    name = uuid.uuid4().hex + (".csv" if fmt == "CSV" else ".cdcol")
+    path = os.path.join(EXPORT_DIR, name)
+    if fmt == "CSV":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            write_csv(src, f)
+    else:
+        with open(path, "wb") as f:
+            write_columnar(src, f)
+    return EXPORT_URL + name
+
+
+def result_download(ops_obj, df, sort_col, fmt):
+    """
+    Deferred download of a query result for st.download_button, used when
+    static file serving is off: nothing is built until the button is
+    clicked, the rows are then encoded chunk by chunk into a temp file.
+    That only bounds the encoder's working memory, streamlit reads the
+    finished file into memory to serve it.
+    """
+    def build():
+        src = df
+        if sort_col:
+            src = ops_obj.order_rows(df, [sort_col], type="dsc")
+        f = tempfile.TemporaryFile(prefix="cinedash-export-")
+        if fmt == "CSV":
+            text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+            write_csv(src, text)
+            text.flush()
+            text.detach()
+        else:
+            write_columnar(src, f)
+        f.seek(0)
+        return f
 
-    out = []
-    for i in range(l):
-        row = {}
-        for c in cols:
-            row[c] = df[c][i]
-        out.append(row)
-    return out
+    return build
 
 
 def get_unique_values(df, col):
@@ -80,6 +169,24 @@ def parse_value(col_name, text):
     return text
 
 
+def parse_condition_value(col_name, op, text):
+    """
+    Value for one Query Builder condition: a list for "in"
+    ("1, 2, 3"), a (low, high) pair for "between" ("1990, 2000"),
+    the raw text for "starts with" / "like".
+    """
+    if op == "in":
+        return [parse_value(col_name, t) for t in text.split(",") if t.strip()]
+    if op == "between":
+        parts = [t for t in text.split(",") if t.strip()]
+        if len(parts) != 2:
+            return None
+        return (parse_value(col_name, parts[0]), parse_value(col_name, parts[1]))
+    if op in ["prefix", "like"]:
+        return text.strip()
+    return parse_value(col_name, text)
+
+
 def engine_safe(df_or_msg, where):
     """
     If engine returned an error string, show it nicely in the UI and
@@ -95,36 +202,1156 @@ def engine_safe(df_or_msg, where):
     return df_or_msg
 
 
-# --- Data loading (logic unchanged) ---
-@st.cache_data(show_spinner=True)
-def load_data():
-    parse = csvreader()
+def rating_histogram(ops_obj, df):
+    """
+    Ratings per half star of a frame with a rating column, in one pass, as
+    bar chart data.
+    """
+    hist = ops_obj.histogram(df, "rating", RATING_BINS, "edges")
+    return {
+        "stars": [str(low + 0.25) for low in hist["bin_low"]],
+        "ratings": hist["count"],
+    }
+
+
+def movie_info(ops_obj, df, df_movies, movie_ids):
+    """
+    Title and year of each movieId of df as derived lookup columns,
+    through the movieId index built at load ("Unknown" / 0 for an id
+    missing from movies.csv).
+    """
+    df = ops_obj.derive(df, "title", "lookup", ["movieId"], (df_movies, movie_ids, "title", "Unknown"))
+    return ops_obj.derive(df, "year", "lookup", ["movieId"], (df_movies, movie_ids, "year", 0))
+
+
+def movie_details(ops_obj, gb_avg, gb_cnt, df_movies, movie_ids):
+    """
+    Per movie averages with their rating count, title and year attached as
+    derived lookup columns by movieId: filled in on first read, one pass
+    over each frame instead of a search per movie.
+    """
+    if not gb_avg:
+        return {c: [] for c in ["movieId", "title", "year", "rating_avg", "rating_count"]}
+    df = ops_obj.derive(gb_avg, "rating_count", "lookup", ["movieId"], (gb_cnt, "movieId", "rating_count", 0))
+    return movie_info(ops_obj, df, df_movies, movie_ids)
+
+
+# --- Data loading (background, one frame store shared by all sessions) ---
+def load_steps():
     dfc = dataframe()
-    ops = functions()
+    ops = functions(BACKEND)
+
+    data_dir = DATA_DIR
+
+    # typed columns straight from the files, using the builtin MovieLens
+    # schemas (movies.csv also derives year from the title)
+    def read_frame(name):
+        return dfc.read_frame(os.path.join(data_dir, name), ",")
+
+    def remote_frame(ld, name):
+        path = os.path.join(data_dir, name)
+        d, errors = ld.remote(dfc.read_frame, path, ",", None, True)
+        dfc.errors[path] = errors
+        return d
+
+    # movies first so the Overview can render straight away; ratings, the
+    # movies-ratings join and tags follow while the user is already browsing.
+    # The heavy steps run in a worker process so they do not compete with
+    # the app threads for the GIL.
+    return [
+        # decade, release_year (years before 1801 are parse leftovers, None)
+        # and rating_bucket (ratings) are derived columns, computed the first
+        # time a query reads them
+        ("movies", "Parsing movies.csv",
+            lambda ld: ops.derive(
+                ops.derive(read_frame("movies.csv"), "decade", "bucket", ["year"], 10),
+                "release_year", "within", ["year"], (1801, None),
+            )),
+        # movie counts per year / decade / genre for the overview chart
+        ("movies_cube", "Rolling up movies per year and genre",
+            lambda ld: cube(ld.get("movies"), ["year", "decade", "genre"], "movieId")),
+        # movieId -> row of movies, for the title / year / genres lookups
+        ("movie_ids", "Indexing movie ids",
+            lambda ld: hashindex(ld.get("movies"), "movieId")),
+        # ratings.csv is sorted by user: userId is kept run length encoded,
+        # so filters and counts on it work per run
+        ("ratings", "Parsing ratings.csv",
+            lambda ld: ops.derive(
+                compress_frame(remote_frame(ld, "ratings.csv"), ["userId"]),
+                "rating_bucket", "bucket", ["rating"], 1,
+            )),
+        # sorted timestamp index for time-window queries on ratings
+        ("ratings_time_index", "Indexing rating timestamps",
+            lambda ld: sortedindex(ld.get("ratings"), "timestamp")),
+        # simple inner join for other tabs (no suffixes)
+        ("movies_ratings", "Joining movies and ratings",
+            lambda ld: ld.remote(
+                ops.join, ld.get("movies"), ld.get("ratings"), ["movieId"], how="inner"
+            )),
+        # rating count / sum / min / max per year, decade, genre and rating
+        # bucket for the rating summary
+        ("ratings_cube", "Rolling up ratings",
+            lambda ld: cube(
+                ld.get("movies_ratings"), ["year", "decade", "genre", "rating_bucket"], "rating"
+            )),
+        ("tags", "Parsing tags.csv",
+            lambda ld: remote_frame(ld, "tags.csv")),
+        # rows the parser skipped or stored empty, per file
+        ("parse_errors", "Checking for bad rows",
+            lambda ld: {os.path.basename(p): e for p, e in dfc.errors.items() if e}),
+        # indexes the Query Builder filters probe (= / in / between / starts
+        # with / like) when it runs on a base table without joins
+        ("query_indexes", "Indexing movie ids, titles and tags",
+            lambda ld: {
+                "Movies": {
+                    "movieId": ld.get("movie_ids"),
+                    "title": sortedindex(ld.get("movies"), "title", lower=True),
+                    "genres": hashindex(ld.get("movies"), "genres"),
+                },
+                "Ratings": {
+                    "movieId": hashindex(ld.get("ratings"), "movieId"),
+                    "userId": hashindex(ld.get("ratings"), "userId"),
+                    "timestamp": ld.get("ratings_time_index"),
+                },
+                "Tags": {
+                    "movieId": hashindex(ld.get("tags"), "movieId"),
+                    "tag": sortedindex(ld.get("tags"), "tag", lower=True),
+                },
+            }),
+        # samples of ratings for the Query Builder's approximate answers:
+        # 1% of the rows (at least 10,000), and up to 5 ratings per movie /
+        # 20 per user so every movie / user is in the sample
+        ("ratings_samples", "Sampling ratings",
+            lambda ld: {
+                "uniform sample": uniform_sample(
+                    ops, ld.get("ratings"), max(10_000, ops.df_len(ld.get("ratings")) // 100)
+                ),
+                "sample per movie": stratified_sample(ops, ld.get("ratings"), "movieId", 5),
+                "sample per user": stratified_sample(ops, ld.get("ratings"), "userId", 20),
+            }),
+        # user x movie matrix for per-user / per-movie lookups, read from
+        # the binary cache when ratings.csv has not changed
+        ("ratings_matrix", "Building the user x movie rating matrix",
+            lambda ld: ld.remote(ratings_matrix, os.path.join(data_dir, "ratings.csv"))),
+        # top-k similar movies per movie; built once and kept in the binary
+        # cache, later loads only update the movies new ratings touch
+        ("similar_movies", "Finding similar movies",
+            lambda ld: ld.remote(similar_movies, os.path.join(data_dir, "ratings.csv"))),
+    ]
+
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    # cache_resource hands every session the same store object, so the frames
+    # are shared by reference instead of being pickled per session and rerun
+    return framestore(load_steps)
+
+
+@st.cache_resource(show_spinner=False)
+def get_scan(name):
+    # memory mapped scan: row counts and previews without parsing the file
+    return csvscan(os.path.join(DATA_DIR, name))
+
+
+def loading_notice(what):
+    st.info(f"⏳ {what} still loading in the background, this tab will fill in as soon as it is ready.")
+
+
+@st.fragment(run_every=0.5)
+def load_progress(store, loader, done, reloading):
+    # polls the background loader on its own: only this fragment reruns on
+    # each tick, the page reruns when a step finished or a reload swapped in
+    # (done, reloading: what the page was rendered with)
+    live, now_reloading, _ = store.state()
+    if live is not loader or now_reloading != reloading or loader.progress()[0] != done or loader.finished():
+        st.rerun()
+    if reloading:
+        st.info("🔄 Reloading data in the background, the dashboard switches over once it is complete.")
+    else:
+        done, label = loader.progress()
+        st.progress(done, text=f"Loading in background: {label}…")
+
+
+# --- TAB 1: OVERVIEW ---
+def overview_tab(ops_obj, df_movies, df_ratings, movies_cube, ratings_time_index):
+    st.markdown(
+        '<p class="section-title">Dataset Snapshot</p>',
+        unsafe_allow_html=True,
+    )
+
+    total_movies = dict_len(df_movies)
+    valid_years = [y for y in df_movies["release_year"] if y is not None]
+    min_year = min(valid_years)
+    max_year = max(valid_years)
+
+    st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Movies", f"{total_movies:,}")
+    if df_ratings is not None:
+        col2.metric("Ratings", f"{dict_len(df_ratings):,}")
+        col3.metric("Unique Users", f"{len(set(df_ratings['userId'])):,}")
+    else:
+        # row count from the line index of ratings.csv, no parsing needed
+        col2.metric("Ratings", f"{len(get_scan('ratings.csv')):,}")
+        col3.metric("Unique Users", "loading…")
+    col4.metric("Year Range", f"{min_year} — {max_year}")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    with st.expander("Raw file preview"):
+        pc1, pc2 = st.columns([1, 3])
+        with pc1:
+            preview_file = st.selectbox(
+                "File", ["movies.csv", "ratings.csv", "tags.csv", "links.csv"], key="preview_file"
+            )
+        scan = get_scan(preview_file)
+        with pc2:
+            preview_cols = st.multiselect(
+                "Columns", scan.columns, default=scan.columns, key=f"preview_cols_{preview_file}"
+            )
+        st.dataframe(to_table(scan.head(50, preview_cols)))
+        st.caption(
+            f"{preview_file}: {len(scan):,} rows. First 50 rows parsed lazily from a memory mapped "
+            "scan, only the selected columns are converted."
+        )
+
+    st.markdown(
+        '<p class="section-title">Movies Released per Year</p>',
+        unsafe_allow_html=True,
+    )
+
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    year_genre = st.selectbox(
+        "Genre", options=["All genres"] + list(df_movies["genres"].labels), key="year_genre"
+    )
+    # a slice of the pre-aggregated cube, no pass over the movies
+    movies_per_year = movies_cube.groupby(
+        ["year"], "count", where=None if year_genre == "All genres" else {"genre": year_genre}
+    )
+    years = []
+    counts = []
+    for y, c in zip(movies_per_year["year"], movies_per_year["movieId_count"]):
+        if isinstance(y, int) and y > 1800:
+            years.append(y)
+            counts.append(c)
+
+    if years and counts:
+        chart_data = {"year": years, "movies": counts}
+        st.line_chart(chart_data, x="year", y="movies", color="#2563eb")
+    else:
+        st.info("No data available to plot after filtering.")
+
+    st.caption(
+        f"Above: movie counts per year read from a cube of {movies_cube.cells():,} pre-aggregated cells "
+        "(year × decade × genre) instead of grouping the movies on every run."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    st.markdown(
+        '<p class="section-title">Ratings over Time</p>',
+        unsafe_allow_html=True,
+    )
+
+    if ratings_time_index is None:
+        loading_notice("Ratings")
+        return
+
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    first_year = time.gmtime(ratings_time_index.min()).tm_year
+    last_year = time.gmtime(ratings_time_index.max()).tm_year
+
+    tc1, tc2 = st.columns([1, 3])
+    with tc1:
+        time_unit = st.selectbox(
+            "Bucket by", options=["year", "month", "week", "day"], index=1
+        )
+    with tc2:
+        year_from, year_to = st.slider(
+            "Rating years",
+            min_value=first_year,
+            max_value=last_year,
+            value=(first_year, last_year),
+        )
+
+    window_df = ops_obj.time_window(
+        df_ratings,
+        ratings_time_index,
+        calendar.timegm((year_from, 1, 1, 0, 0, 0)),
+        calendar.timegm((year_to + 1, 1, 1, 0, 0, 0)),
+    )
+
+    if dict_len(window_df):
+        bucket_col = "timestamp_" + time_unit
+        bucketed = ops_obj.time_bucket(window_df, "timestamp", time_unit)
+        bucket_cnt = ops_obj.groupby(bucketed, [bucket_col], ["rating"], "count")
+        bucket_avg = ops_obj.groupby(bucketed, [bucket_col], ["rating"], "avg")
+
+        points = sorted(
+            zip(
+                bucket_cnt[bucket_col],
+                bucket_cnt["rating_count"],
+                bucket_avg["rating_avg"],
+            )
+        )
+        time_chart = {
+            "period": [p[0] for p in points],
+            "ratings": [p[1] for p in points],
+            "avg rating": [p[2] for p in points],
+        }
+
+        st.line_chart(time_chart, x="period", y="ratings", color="#2563eb")
+        st.line_chart(time_chart, x="period", y="avg rating", color="#4f46e5")
+
+        st.markdown("##### Rating distribution")
+        st.bar_chart(rating_histogram(ops_obj, window_df), x="stars", y="ratings", color="#2563eb")
+    else:
+        st.info("No ratings in the selected years.")
+
+    st.caption(
+        "Above: time_window() over the sorted timestamp index, then "
+        "time_bucket() feeding groupby( bucket, rating, 'count' / 'avg' ), "
+        "and histogram() counting the ratings of every half star in one pass."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+# --- TAB 2: MOVIE EXPLORER ---
+def movie_explorer_tab(ops_obj, df_movies, movies_ratings, movie_ids, similar):
+    st.markdown(
+        '<p class="section-title">Interactive Movie Explorer</p>',
+        unsafe_allow_html=True,
+    )
+
+    years = sorted(set(df_movies["release_year"]) - {None})
+
+    st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
+    left_controls, _ = st.columns([1, 3])
+
+    with left_controls:
+        selected_year = st.selectbox(
+            "Filter by year", options=["All Years"] + years, index=len(years)
+        )
+
+        min_avg_rating = st.slider(
+            "Minimum average rating",
+            min_value=0.0,
+            max_value=5.0,
+            value=3.5,
+            step=0.5,
+        )
+
+        max_rows = st.slider(
+            "Max rows to display",
+            min_value=10,
+            max_value=200,
+            value=50,
+            step=10,
+        )
+
+        selected_genres = st.multiselect(
+            "Genres", options=list(df_movies["genres"].labels)
+        )
+        genre_mode = st.radio(
+            "Match", options=["any of these", "all of these"], horizontal=True
+        )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    gb_avg = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "avg")
+    gb_cnt = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "count")
+
+    combined = movie_details(ops_obj, gb_avg, gb_cnt, df_movies, movie_ids)
+
+    # genres stay bitmask encoded, gathered straight from the movies column
+    # and computed up front, has_any / has_all read the bitmasks
+    combined = ops_obj.derive(combined, "genres", "lookup", ["movieId"], (df_movies, movie_ids, "genres"))
+    combined = ops_obj.resolve(combined, ["genres"])
+
+    # rank of each movie within its release year, one pass per year partition
+    current_df = ops_obj.window(
+        combined, ["year"], ["rating_avg"], "rank", type="dsc", name="year_rank"
+    )
+
+    if selected_year != "All Years":
+        current_df = ops_obj.filter(current_df, ["year"], ["="], [selected_year])
+
+    current_df = ops_obj.filter(
+        current_df, ["rating_avg"], [">="], [min_avg_rating]
+    )
+
+    if selected_genres and current_df:
+        if genre_mode == "all of these":
+            current_df = ops_obj.has_all(current_df, "genres", selected_genres)
+        else:
+            current_df = ops_obj.has_any(current_df, "genres", selected_genres)
+
+    # every genre a matching movie has, counted once per movie
+    genre_breakdown = {}
+    if current_df:
+        genre_breakdown = ops_obj.groupby_exploded(
+            current_df, "genres", ["rating_avg"], "count"
+        )
+
+    current_df = ops_obj.order_rows(
+        current_df, ["rating_avg"], type="dsc", limit=max_rows
+    )
+
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    st.markdown("##### Matching movies")
+    st.write(f"Showing up to **{max_rows}** movies matching the filters:")
+
+    st.dataframe(
+        to_table(
+            current_df,
+            cols=["movieId", "title", "year", "genres", "year_rank", "rating_avg", "rating_count"],
+        )
+    )
+
+    if genre_breakdown:
+        st.markdown("##### Genres of the matching movies")
+        st.bar_chart(
+            {
+                "genre": genre_breakdown["genres"],
+                "movies": genre_breakdown["rating_avg_count"],
+            },
+            x="genre",
+            y="movies",
+            color="#2563eb",
+        )
+
+    st.caption(
+        "This view uses your **join**, **filter**, **genre bitmask filters**, "
+        "**groupby (avg & count, per genre)**, **window (rank within year)**, "
+        "**projection** and **order_rows** functions together."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    st.markdown("##### Movies like this")
+    if similar is None:
+        st.info("⏳ Similar movies are still being computed in the background.")
+    elif current_df:
+        shown = {
+            f"{t} ({y})": mid
+            for mid, t, y in zip(current_df["movieId"], current_df["title"], current_df["year"])
+        }
+        picked = st.selectbox("Movie", options=list(shown))
+        like = similar.lookup(shown[picked], limit=10)
+        like = movie_info(ops_obj, like, df_movies, movie_ids)
+        if like["movieId"]:
+            st.dataframe(to_table(like, cols=["movieId", "title", "year", "similarity"]))
+        else:
+            st.write("Not enough ratings to find similar movies for this one.")
+        st.caption(
+            "Neighbors come from a precomputed item-item index (adjusted cosine over "
+            "co-ratings), so a lookup is a binary search and a slice."
+        )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+# --- TAB 3: RATINGS ---
+def ratings_tab(ops_obj, df_movies, movies_ratings, movie_ids, rating_matrix, ratings_cube):
+    st.markdown(
+        '<p class="section-title">Top Rated Movies</p>',
+        unsafe_allow_html=True,
+    )
+
+    st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
+    min_count = st.slider(
+        "Minimum number of ratings",
+        min_value=5,
+        max_value=500,
+        value=100,
+        step=5,
+    )
+
+    top_n = st.slider(
+        "How many top movies to show",
+        min_value=10,
+        max_value=100,
+        value=25,
+        step=5,
+    )
+
+    per_year = st.slider(
+        "Top movies per release year",
+        min_value=1,
+        max_value=10,
+        value=3,
+        step=1,
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    gb_avg = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "avg")
+    gb_cnt = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "count")
+
+    top_df = movie_details(ops_obj, gb_avg, gb_cnt, df_movies, movie_ids)
+
+    # bounded heaps: one for the overall list, one per year for the table below
+    per_year_df = ops_obj.top_n(
+        top_df, ["year"], "rating_avg", per_year,
+        min_count=min_count, count_column="rating_count",
+    )
+    per_year_df = ops_obj.order_rows(per_year_df, ["year"], type="dsc")
+    top_df = ops_obj.top_n(
+        top_df, [], "rating_avg", top_n,
+        min_count=min_count, count_column="rating_count",
+    )
+
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    st.dataframe(
+        to_table(
+            top_df,
+            cols=["movieId", "title", "year", "rating_avg", "rating_count"],
+        )
+    )
+
+    st.markdown("##### Best movies of each release year")
+    st.dataframe(
+        to_table(
+            per_year_df,
+            cols=["year", "title", "rating_avg", "rating_count"],
+            limit=300,
+        )
+    )
+
+    st.caption(
+        "Above: pure use of your engine — no pandas. "
+        "We aggregate ratings per movie (avg + count), then keep the best movies "
+        "overall and per year with **top_n** (one bounded heap per group)."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    st.markdown(
+        '<p class="section-title">Rating Summary</p>',
+        unsafe_allow_html=True,
+    )
+    if ratings_cube is None:
+        loading_notice("The rating summary")
+    else:
+        rating_summary(ratings_cube, df_movies)
+
+    st.markdown(
+        '<p class="section-title">Users &amp; Movies</p>',
+        unsafe_allow_html=True,
+    )
+    if rating_matrix is None:
+        loading_notice("The rating matrix")
+        return
+
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    user_col, movie_col = st.columns(2)
+
+    with user_col:
+        user_id = st.number_input("User id", min_value=1, value=414, step=1)
+        c1, c2 = st.columns(2)
+        c1.metric("Ratings", rating_matrix.row_count(user_id))
+        mean = rating_matrix.row_mean(user_id)
+        c2.metric("Average given", "—" if mean is None else f"{mean:.2f}")
+
+        user_df = rating_matrix.row(user_id)
+        if user_df["rating"]:
+            st.bar_chart(rating_histogram(ops_obj, user_df), x="stars", y="ratings", color="#2563eb")
+        user_df = movie_info(ops_obj, user_df, df_movies, movie_ids)
+        user_df = ops_obj.order_rows(user_df, ["rating"], type="dsc", limit=50)
+        st.dataframe(to_table(user_df, cols=["movieId", "title", "rating"]))
+
+    with movie_col:
+        movie_id = st.number_input("Movie id", min_value=1, value=356, step=1)
+        rows = movie_ids.lookup(movie_id)
+        st.write(f"**{df_movies['title'][rows[0]] if len(rows) else 'Unknown'}**")
+        c1, c2 = st.columns(2)
+        c1.metric("Raters", rating_matrix.column_count(movie_id))
+        mean = rating_matrix.column_mean(movie_id)
+        c2.metric("Average rating", "—" if mean is None else f"{mean:.2f}")
+
+        raters = rating_matrix.column(movie_id)
+        if raters["rating"]:
+            st.bar_chart(rating_histogram(ops_obj, raters), x="stars", y="ratings", color="#4f46e5")
+        # how generous each rater is overall, next to what they gave this movie
+        raters["user_avg"] = [rating_matrix.row_mean(u) for u in raters["userId"]]
+        st.dataframe(to_table(raters, cols=["userId", "rating", "user_avg"], limit=200))
+
+    st.caption(
+        "Lookups read one slice of the sparse user × movie matrix (CSR by user, CSC by movie) "
+        "instead of filtering every rating."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def rating_summary(ratings_cube, df_movies):
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    sc1, sc2, sc3 = st.columns(3)
+    with sc1:
+        by = st.selectbox(
+            "Break down by", options=["rating bucket", "decade", "year", "genre"], key="summary_by"
+        )
+    with sc2:
+        genre = st.selectbox(
+            "Genre", options=["All genres"] + list(df_movies["genres"].labels), key="summary_genre"
+        )
+    with sc3:
+        decade = st.selectbox(
+            "Release decade",
+            options=["All decades"] + ratings_cube.groupby(["decade"], "count")["decade"],
+            key="summary_decade",
+        )
+
+    where = {}
+    if genre != "All genres":
+        where["genre"] = genre
+    if decade != "All decades":
+        where["decade"] = decade
+    dim = by.replace(" ", "_")
+
+    cnt = ratings_cube.groupby([dim], "count", where=where)
+    avg = ratings_cube.groupby([dim], "avg", where=where)
+    if cnt["rating_count"]:
+        summary = {
+            by: [str(v) for v in cnt[dim]],
+            "ratings": cnt["rating_count"],
+            "avg rating": avg["rating_avg"],
+        }
+        sm1, sm2 = st.columns(2)
+        with sm1:
+            st.bar_chart(summary, x=by, y="ratings", color="#2563eb")
+        with sm2:
+            st.bar_chart(summary, x=by, y="avg rating", color="#4f46e5")
+    else:
+        st.info("No ratings for this selection.")
+
+    st.caption(
+        "Counts and averages are slices / roll-ups of a cube over year × decade × genre × rating bucket "
+        f"({ratings_cube.cells():,} cells for {ratings_cube.rows:,} ratings), so changing the selection "
+        "does not touch the rating rows."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+# --- TAB 4: TAGS ---
+def tags_tab(ops_obj, df_movies, df_ratings, df_tags, movie_ids):
+    st.markdown(
+        '<p class="section-title">Tag Explorer</p>',
+        unsafe_allow_html=True,
+    )
+
+    tag_stats = ops_obj.groupby(df_tags, ["tag"], ["movieId"], "count")
+    tag_pairs = list(zip(tag_stats["tag"], tag_stats["movieId_count"]))
+    tag_pairs.sort(key=lambda x: x[1], reverse=True)
+    popular_tags = [t for t, _ in tag_pairs[:100]]
+
+    st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
+    selected_tag = st.selectbox("Choose a popular tag", options=popular_tags)
+    st.write(f"Showing movies tagged with **{selected_tag}**:")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    filtered_tags = ops_obj.filter(df_tags, ["tag"], ["="], [selected_tag])
+    mt = ops_obj.join(df_movies, filtered_tags, ["movieId"], how="inner")
+    mtr = ops_obj.join(mt, df_ratings, ["movieId"], how="inner")
+    tag_avg = ops_obj.groupby(mtr, ["movieId"], ["rating"], "avg")
+    tag_cnt = ops_obj.groupby(mtr, ["movieId"], ["rating"], "count")
+
+    final_df = movie_details(ops_obj, tag_avg, tag_cnt, df_movies, movie_ids)
+
+    final_df = ops_obj.order_rows(
+        final_df, ["rating_avg"], type="dsc", limit=50
+    )
+
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    st.dataframe(
+        to_table(
+            final_df,
+            cols=["movieId", "title", "year", "rating_avg", "rating_count"],
+        )
+    )
+
+    st.caption(
+        "This tab chains together your **filter**, **join**, and **groupby** "
+        "to let users explore the best movies for each tag."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+# --- TAB 5: QUERY BUILDER ---
+def query_builder_tab(ops_obj, df_movies, df_ratings, df_tags, indexes=None, samples=None):
+    st.markdown(
+        '<p class="section-title">Manual Query Builder</p>',
+        unsafe_allow_html=True,
+    )
+    st.write(
+        "Build your own query by choosing the dataset and which functions "
+        "to apply: **joins**, **filter**, **group by / aggregation**, **projection**, and **sorting**."
+    )
+
+    # Step 0 -------------------------------------------------------------
+    st.markdown(
+        '<div class="step-chip"><span>0</span>Step 0 · Choose tables &amp; joins</div>',
+        unsafe_allow_html=True,
+    )
+
+    BASE_OPTIONS = ["Movies", "Ratings", "Tags"]
+
+    def get_df_and_suffix(name):
+        if name == "Movies":
+            return df_movies, "_movies"
+        if name == "Ratings":
+            if approx_sample is not None:
+                return approx_sample.df, "_ratings"
+            return df_ratings, "_ratings"
+        if name == "Tags":
+            return df_tags, "_tags"
+        raise ValueError("Unknown table")
+
+    base_table = st.selectbox("Base table", BASE_OPTIONS, index=0)
+    remaining_after_base = [t for t in BASE_OPTIONS if t != base_table]
+
+    join1_enable = st.checkbox("Add first join", value=False)
+    join1_table = None
+    join1_type = None
+
+    if join1_enable:
+        join1_table = st.selectbox(
+            "Join 1 – table",
+            remaining_after_base,
+            key="join1_table",
+        )
+        join1_type = st.selectbox(
+            "Join 1 – type",
+            ["inner", "left", "right", "full"],
+            index=0,
+            key="join1_type",
+        )
+
+    remaining_after_join1 = [
+        t for t in remaining_after_base if t != join1_table
+    ]
+
+    join2_enable = False
+    join2_table = None
+    join2_type = None
+    if join1_enable and remaining_after_join1:
+        join2_enable = st.checkbox("Add second join", value=False)
+        if join2_enable:
+            join2_table = remaining_after_join1[0]
+            st.write(f"Join 2 – table: **{join2_table}**")
+            join2_type = st.selectbox(
+                "Join 2 – type",
+                ["inner", "left", "right", "full"],
+                index=0,
+                key="join2_type",
+            )
+
+    # approximate first: the query runs on a precomputed sample of Ratings
+    # and shows estimates with 95% intervals, then the script reruns itself
+    # once for the exact answer (the estimates stay on screen meanwhile)
+    approx_sample = None
+    refining = st.session_state.pop("qb_refining", False)
+    if samples:
+        approx_choice = st.selectbox(
+            "Approximate first (sample of Ratings)",
+            ["off"] + list(samples),
+            key="qb_approx",
+        )
+        uses_ratings = "Ratings" in [base_table, join1_table, join2_table]
+        if approx_choice != "off" and uses_ratings and not refining:
+            approx_sample = samples[approx_choice]
+
+    with st.expander("Query limits"):
+        lim_col1, lim_col2 = st.columns(2)
+        time_limit = lim_col1.number_input(
+            "Time limit in seconds (0 = none)", min_value=0, value=30, step=5, key="qb_time_limit"
+        )
+        row_limit = lim_col2.number_input(
+            "Max rows per step (0 = none)", min_value=0, value=5_000_000, step=500_000, key="qb_row_limit"
+        )
+    progress_slot = st.empty()
+
+    def show_progress(stage, done, total):
+        # every st call is also where Streamlit stops this run when a widget
+        # changed meanwhile, so a superseded query does not run to the end
+        if done is not None and total:
+            progress_slot.progress(min(1.0, done / total), text=f"Running {stage}: {done:,} / {total:,}")
+        else:
+            progress_slot.caption(f"Running {stage}…")
+
+    # one query per rerun: time limit over all steps, row budget per step
+    previous = st.session_state.get("qb_query")
+    if previous is not None:
+        previous.cancel()
+    query = querycontext(timeout=time_limit or None, max_rows=row_limit or None, progress=show_progress)
+    st.session_state.qb_query = query
+
+    ops_local = functions(BACKEND)
+    base_df_obj, base_suffix = get_df_and_suffix(base_table)
+    working_df = base_df_obj
+
+    if join1_enable and join1_table is not None:
+        right_df, right_suffix = get_df_and_suffix(join1_table)
+        with query:
+            working_df = ops_local.join(
+                working_df,
+                right_df,
+                ["movieId"],
+                how=join1_type,
+                left_suffix="",
+                right_suffix=right_suffix,
+            )
+        working_df = engine_safe(working_df, "join")
+        if working_df is None:
+            return
+
+    if join2_enable and join2_table is not None:
+        right_df2, right_suffix2 = get_df_and_suffix(join2_table)
+        with query:
+            working_df = ops_local.join(
+                working_df,
+                right_df2,
+                ["movieId"],
+                how=join2_type,
+                left_suffix="",
+                right_suffix=right_suffix2,
+            )
+        working_df = engine_safe(working_df, "join")
+        if working_df is None:
+            return
+
+    st.caption(
+        "Current dataset = "
+        + base_table
+        + (f" {join1_type} join {join1_table}" if join1_enable and join1_table else "")
+        + (f" {join2_type} join {join2_table}" if join2_enable and join2_table else "")
+    )
+
+    # Step 1 -------------------------------------------------------------
+    st.markdown(
+        '<div class="step-chip"><span>1</span>Step 1 · Filter rows (WHERE)</div>',
+        unsafe_allow_html=True,
+    )
+
+    apply_filter = st.checkbox("Apply filter", value=False)
+
+    columns = []
+    conditions = []
+    values = []
+    seps = []
+    groups = []
+    negated = []
+    grouped = False
+
+    if apply_filter:
+        cols_available = [c for c in working_df.keys() if c != STRATUM]
+        ops_list = ["=", "!=", ">", "<", ">=", "<=", "in", "between", "starts with", "like"]
+        group_names = ["A", "B", "C"]
+
+        # left to right keeps the single and/or chain; groups build
+        # e.g. (A1 and A2) or (B1 and not B2)
+        grouped = st.radio(
+            "Combine conditions",
+            options=["left to right", "in groups"],
+            horizontal=True,
+            key="qb_f_mode",
+        ) == "in groups"
+
+        # how many filter rows to show (stored in session_state)
+        if "qb_num_conditions" not in st.session_state:
+            st.session_state.qb_num_conditions = 1
+
+        # buttons to add / reset filter rows
+        btn_col_add, btn_col_reset = st.columns([1, 1])
+        with btn_col_add:
+            if st.button("➕ Add condition", key="qb_add_cond"):
+                st.session_state.qb_num_conditions += 1
+        with btn_col_reset:
+            if st.button("🧹 Reset conditions", key="qb_reset_cond"):
+                st.session_state.qb_num_conditions = 1
+
+        # render each condition row
+        for i in range(st.session_state.qb_num_conditions):
+            c1, c2, c3, c4 = st.columns([3, 2, 3, 2])
+
+            with c1:
+                col_name = st.selectbox(
+                    f"Column {i + 1}",
+                    options=cols_available,
+                    key=f"qb_f_col_{i}",
+                )
 
-    data_dir = os.path.join(BASE_DIR, "data")
+            with c2:
+                op = st.selectbox(
+                    f"Condition {i + 1}",
+                    options=ops_list,
+                    key=f"qb_f_op_{i}",
+                )
 
-    movie_columns, movie_rows = parse.read_doc(
-        os.path.join(data_dir, "movies.csv"), ","
+            with c3:
+                val_str = st.text_input(
+                    f"Value {i + 1}",
+                    key=f"qb_f_val_{i}",
+                    help="in: 1, 2, 3 · between: low, high (both included) · like: % any text, _ one character",
+                )
+            if op == "starts with":
+                op = "prefix"
+
+            sep = "and"
+            group = group_names[0]
+            negate_cond = False
+            if grouped:
+                with c4:
+                    group = st.selectbox(
+                        "Group",
+                        options=group_names,
+                        key=f"qb_f_grp_{i}",
+                    )
+                    negate_cond = st.checkbox("not", key=f"qb_f_not_{i}")
+            # first condition doesn't need a logical connector before it
+            elif i == 0:
+                with c4:
+                    st.markdown(
+                        "<div style='opacity:0.4; font-size:0.85rem; padding-top:1.1rem;'>First condition</div>",
+                        unsafe_allow_html=True,
+                    )
+            else:
+                with c4:
+                    sep = st.selectbox(
+                        "Combine with",
+                        options=["and", "or"],
+                        key=f"qb_f_sep_{i}",
+                    )
+
+            # only add if user entered a value
+            if val_str.strip() != "":
+                columns.append(col_name)
+                conditions.append(op)
+                values.append(parse_condition_value(col_name, op, val_str))
+                seps.append(sep)
+                groups.append(group)
+                negated.append(negate_cond)
+
+    # indexes belong to the base table's rows, joins renumber them
+    filter_indexes = None
+    if indexes and not (join1_enable and join1_table):
+        filter_indexes = indexes.get(base_table)
+
+    # apply filter if we collected any conditions
+    if columns and grouped:
+        used = [g for g in group_names if g in groups]
+        inner = {}
+        g_cols = st.columns(len(used) + 1)
+        for g, c in zip(used, g_cols):
+            with c:
+                inner[g] = st.selectbox(f"Inside group {g}", options=["and", "or"], key=f"qb_f_in_{g}")
+        with g_cols[-1]:
+            outer = st.selectbox("Between groups", options=["or", "and"], key="qb_f_between")
+
+        node = {"and": all_of, "or": any_of}
+        parts = []
+        for g in used:
+            preds = []
+            for col, cond, val, grp, neg in zip(columns, conditions, values, groups, negated):
+                if grp == g:
+                    leaf = pred(col, cond, val)
+                    preds.append(negate(leaf) if neg else leaf)
+            parts.append(node[inner[g]](*preds))
+        expr = node[outer](*parts)
+        st.caption(f"Filter: {expr}")
+        with query:
+            working_df = ops_local.where(working_df, expr, filter_indexes)
+        working_df = engine_safe(working_df, "filter")
+        if working_df is None:
+            return  # stop query tab rendering here
+    elif columns:
+        with query:
+            working_df = ops_local.filter(working_df, columns, conditions, values, seps, filter_indexes)
+        working_df = engine_safe(working_df, "filter")
+        if working_df is None:
+            return  # stop query tab rendering here
+
+    # Step 2 -------------------------------------------------------------
+    st.markdown(
+        '<div class="step-chip"><span>2</span>Step 2 · Group by &amp; aggregation (optional)</div>',
+        unsafe_allow_html=True,
     )
-    rating_columns, rating_rows = parse.read_doc(
-        os.path.join(data_dir, "ratings.csv"), ","
+
+    apply_group = st.checkbox("Apply aggregation", value=False)
+
+    if apply_group:
+        cols_after_filter = [c for c in working_df.keys() if c != STRATUM]
+        agg_mode = st.radio(
+            "Aggregation mode",
+            options=["Group by column(s)", "Global aggregation over entire dataset"],
+            horizontal=True,
+        )
+
+        if agg_mode == "Group by column(s)":
+            gb_col = st.selectbox(
+                "Group by column", options=cols_after_filter, key="gb_col"
+            )
+            agg_candidates = [c for c in cols_after_filter if c != gb_col]
+            agg_col = st.selectbox(
+                "Aggregation column", options=agg_candidates, key="agg_col"
+            )
+            # hist: counts per bin of the aggregation column for every group
+            agg_type = st.selectbox(
+                "Aggregation type",
+                options=["count", "sum", "avg", "min", "max"] + ([] if approx_sample is not None else ["hist"]),
+                key="agg_type",
+            )
+
+            with query:
+                if approx_sample is not None:
+                    working_df = ops_local.approx_groupby(
+                        working_df, [gb_col], [agg_col], agg_type, approx_sample.strata
+                    )
+                else:
+                    working_df = ops_local.groupby(working_df, [gb_col], [agg_col], agg_type)
+            working_df = engine_safe(working_df, "groupby + aggregation")
+            if working_df is None:
+                return
+        else:
+            cols_after_filter = [c for c in working_df.keys() if c != STRATUM]
+            agg_col = st.selectbox(
+                "Aggregation column (entire dataset)",
+                options=cols_after_filter,
+                key="global_agg_col",
+            )
+            agg_type = st.selectbox(
+                "Aggregation type (entire dataset)",
+                options=["count", "sum", "avg", "min", "max"],
+                key="global_agg_type",
+            )
+
+            # one group holding every row: a derived constant key, no copy
+            # of the frame
+            tmp_df = ops_local.derive(working_df, "_all", "const", arg=1)
+
+            with query:
+                if approx_sample is not None:
+                    tmp_df = ops_local.approx_groupby(
+                        tmp_df, ["_all"], [agg_col], agg_type, approx_sample.strata
+                    )
+                else:
+                    tmp_df = ops_local.groupby(tmp_df, ["_all"], [agg_col], agg_type)
+            tmp_df = engine_safe(tmp_df, "global aggregation")
+            if tmp_df is None:
+                return
+
+            working_df = tmp_df
+
+    # Step 3 -------------------------------------------------------------
+    st.markdown(
+        '<div class="step-chip"><span>3</span>Step 3 · Projection &amp; sorting</div>',
+        unsafe_allow_html=True,
     )
-    tag_columns, tag_rows = parse.read_doc(
-        os.path.join(data_dir, "tags.csv"), ","
+
+    cols_for_show = [c for c in working_df.keys() if c != STRATUM]
+    show_cols = st.multiselect(
+        "Columns to display", options=cols_for_show, default=cols_for_show
+    )
+
+    sort_col = st.selectbox(
+        "Sort by (descending, uses order_rows)",
+        options=["(no sorting)"] + cols_for_show,
     )
 
-    df_movies = dfc.create_frame(movie_columns, movie_rows, extract_year=True)
-    df_ratings = dfc.create_frame(rating_columns, rating_rows)
-    df_tags = dfc.create_frame(tag_columns, tag_rows)
+    max_rows_query = st.slider(
+        "Rows per page (query tab)",
+        min_value=10,
+        max_value=200,
+        value=50,
+        step=10,
+        key="qb_max_rows",
+    )
+
+    # every row of the result, for the download below
+    result_df = working_df
+
+    # server side paging: only the rows of the current page are handed to
+    # the table widget; a sort keeps just the rows up to the end of the page
+    total_rows = dict_len(working_df)
+    pages = max(1, -(-total_rows // max_rows_query))
+    if st.session_state.get("qb_page", 1) > pages:
+        st.session_state.qb_page = pages  # the result got shorter
+    page = st.number_input("Page", min_value=1, max_value=pages, step=1, key="qb_page")
+    offset = (page - 1) * max_rows_query
 
-    # movies per year for overview chart
-    movies_per_year = ops.groupby(df_movies, ["year"], ["movieId"], "count")
+    if sort_col != "(no sorting)":
+        with query:
+            working_df = ops_local.order_rows(
+                working_df, [sort_col], type="dsc", limit=offset + max_rows_query
+            )
+        working_df = engine_safe(working_df, "order_rows")
+        if working_df is None:
+            return
+    progress_slot.empty()
+
+    st.markdown("### Query result")
+    st.markdown('<div class="app-card">', unsafe_allow_html=True)
+    st.dataframe(to_table(working_df, cols=show_cols, limit=max_rows_query, offset=offset))
+    if total_rows:
+        st.caption(
+            f"Rows {offset + 1:,}–{min(offset + max_rows_query, total_rows):,} of {total_rows:,} "
+            f"(page {page} of {pages:,})."
+        )
+    if approx_sample is not None:
+        st.info(
+            f"≈ Approximate answer from the {approx_choice} ({len(approx_sample):,} of "
+            f"{approx_sample.population():,} ratings): count / sum / avg are estimates with 95% "
+            "intervals in the *_low / *_high columns. Refining to the exact answer…"
+        )
 
-    # simple inner join for other tabs (no suffixes)
-    movies_ratings = ops.join(df_movies, df_ratings, ["movieId"], how="inner")
+    usage = ops_local.memory_usage(result_df)
+    budget_text = (
+        f"{memory_budget.limit / 2**20:,.0f} MB budget, larger operator state spills to disk"
+        if memory_budget.limit else "no engine memory budget set"
+    )
+    st.caption(
+        f"Result frame: {total_rows:,} rows · "
+        f"{usage['bytes'][-1] / 2**20:,.2f} MB in memory ({budget_text})."
+    )
+    with st.expander("Memory usage per column"):
+        st.dataframe(to_table(usage))
+
+    dl_col1, dl_col2 = st.columns([2, 1])
+    with dl_col1:
+        dl_format = st.radio(
+            "Download format",
+            ["CSV", "Binary (columnar)"],
+            horizontal=True,
+            key="qb_dl_format",
+        )
+    with dl_col2:
+        csv_format = dl_format == "CSV"
+        file_name = "query_result.csv" if csv_format else "query_result.cdcol"
+        download_sort = sort_col if sort_col != "(no sorting)" else None
+        if st.get_option("server.enableStaticServing"):
+            # written to disk on click, then streamed by the server; the
+            # link lasts until the next rerun
+            if st.button(
+                f"⬇️ Export all {dict_len(result_df):,} rows",
+                disabled=not dict_len(result_df),
+                key="qb_download",
+            ):
+                url = export_result(ops_local, result_df, download_sort, dl_format)
+                st.markdown(f'<a href="{url}" download="{file_name}">Save {file_name}</a>', unsafe_allow_html=True)
+        else:
+            st.download_button(
+                f"⬇️ Download all {dict_len(result_df):,} rows",
+                data=result_download(ops_local, result_df, download_sort, dl_format),
+                file_name=file_name,
+                mime="text/csv" if csv_format else "application/octet-stream",
+                disabled=not dict_len(result_df),
+                key="qb_download",
+            )
 
-    return df_movies, df_ratings, df_tags, movies_per_year, movies_ratings
+    st.caption(
+        "This tab is a **manual query builder**. Depending on your choices, it "
+        "chains together **joins** (inner / left / right / full between Movies, "
+        "Ratings, and Tags), **filter**, **groupby / global aggregation**, "
+        "**projection**, and **order_rows**."
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    if approx_sample is not None:
+        st.session_state.qb_refining = True
+        st.rerun()
 
 
 # --- MAIN ---
@@ -454,10 +1681,28 @@ def main():
     )
 
     # --- Data load ---
-    with st.spinner("Loading data with custom CSV parser and dataframe engine..."):
-        df_movies, df_ratings, df_tags, movies_per_year, movies_ratings = load_data()
-
-    ops_obj = functions()
+    store = get_store()
+    # one snapshot for the whole run: a reload swapping in new frames
+    # meanwhile does not change the data this run is working on
+    loader, reloading, reload_error = store.state()
+    with st.spinner("Loading movies with custom CSV parser and dataframe engine..."):
+        loader.wait("movies_cube")
+
+    for msg in loader.errors.values():
+        st.error(msg)
+    if reload_error:
+        st.error("Reload failed, still showing the previous data: " + reload_error)
+    for name, errors in (loader.get("parse_errors") or {}).items():
+        st.warning(f"{name}: {len(errors):,} bad rows skipped or stored as empty, first one {errors[0]}")
+
+    if not loader.finished() or reloading:
+        load_progress(store, loader, loader.progress()[0], reloading)
+    elif st.button("🔄 Reload data", help="Re-read the CSV files; running queries keep the current data."):
+        # rerun so the progress fragment starts polling the reload
+        store.reload()
+        st.rerun()
+
+    ops_obj = functions(BACKEND)
 
     # --- Tabs ---
     tab_overview, tab_movies, tab_ratings, tab_tags, tab_query = st.tabs(
@@ -470,573 +1715,58 @@ def main():
         ]
     )
 
-    # --- TAB 1: OVERVIEW ---
     with tab_overview:
-        st.markdown(
-            '<p class="section-title">Dataset Snapshot</p>',
-            unsafe_allow_html=True,
+        overview_tab(
+            ops_obj,
+            loader.get("movies"),
+            loader.get("ratings"),
+            loader.get("movies_cube"),
+            loader.get("ratings_time_index"),
         )
 
-        total_movies = dict_len(df_movies)
-        total_ratings = dict_len(df_ratings)
-        unique_users = len(set(df_ratings["userId"]))
-        valid_years = [y for y in df_movies["year"] if isinstance(y, int) and y > 1800]
-        min_year = min(valid_years)
-        max_year = max(valid_years)
-
-        st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
-        col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Movies", f"{total_movies:,}")
-        col2.metric("Ratings", f"{total_ratings:,}")
-        col3.metric("Unique Users", f"{unique_users:,}")
-        col4.metric("Year Range", f"{min_year} — {max_year}")
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        st.markdown(
-            '<p class="section-title">Movies Released per Year</p>',
-            unsafe_allow_html=True,
-        )
-
-        st.markdown('<div class="app-card">', unsafe_allow_html=True)
-        years = []
-        counts = []
-        for y, c in zip(movies_per_year["year"], movies_per_year["movieId_count"]):
-            if isinstance(y, int) and y > 1800:
-                years.append(y)
-                counts.append(c)
-
-        if years and counts:
-            chart_data = {"year": years, "movies": counts}
-            st.line_chart(chart_data, x="year", y="movies", color="#2563eb")
-        else:
-            st.info("No data available to plot after filtering.")
-
-        st.caption(
-            "Above: uses your custom groupby( year, movieId, 'count' ) to build this trend."
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    # --- TAB 2: MOVIE EXPLORER ---
     with tab_movies:
-        st.markdown(
-            '<p class="section-title">Interactive Movie Explorer</p>',
-            unsafe_allow_html=True,
-        )
-
-        years = get_unique_values(df_movies, "year")
-        years = [y for y in years if isinstance(y, int) and y > 1800]
-
-        st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
-        left_controls, _ = st.columns([1, 3])
-
-        with left_controls:
-            selected_year = st.selectbox(
-                "Filter by year", options=["All Years"] + years, index=len(years)
-            )
-
-            min_avg_rating = st.slider(
-                "Minimum average rating",
-                min_value=0.0,
-                max_value=5.0,
-                value=3.5,
-                step=0.5,
+        if loader.ready("movies_ratings"):
+            movie_explorer_tab(
+                ops_obj,
+                loader.get("movies"),
+                loader.get("movies_ratings"),
+                loader.get("movie_ids"),
+                loader.get("similar_movies"),
             )
+        else:
+            loading_notice("Ratings")
 
-            max_rows = st.slider(
-                "Max rows to display",
-                min_value=10,
-                max_value=200,
-                value=50,
-                step=10,
-            )
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        id_to_title = {}
-        id_to_year = {}
-        for i in range(dict_len(df_movies)):
-            mid = df_movies["movieId"][i]
-            id_to_title[mid] = df_movies["title"][i]
-            id_to_year[mid] = df_movies["year"][i]
-
-        gb_avg = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "avg")
-        gb_cnt = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "count")
-
-        combined = {
-            "movieId": [],
-            "title": [],
-            "year": [],
-            "rating_avg": [],
-            "rating_count": [],
-        }
-
-        for i in range(len(gb_avg["movieId"])):
-            mid = gb_avg["movieId"][i]
-            avg_val = gb_avg["rating_avg"][i]
-            idx_cnt = gb_cnt["movieId"].index(mid)
-            cnt_val = gb_cnt["rating_count"][idx_cnt]
-            title = id_to_title.get(mid, "Unknown")
-            year = id_to_year.get(mid, 0)
-            combined["movieId"].append(mid)
-            combined["title"].append(title)
-            combined["year"].append(year)
-            combined["rating_avg"].append(avg_val)
-            combined["rating_count"].append(cnt_val)
-
-        current_df = combined
-
-        if selected_year != "All Years":
-            current_df = ops_obj.filter(current_df, ["year"], ["="], [selected_year])
-
-        current_df = ops_obj.filter(
-            current_df, ["rating_avg"], [">="], [min_avg_rating]
-        )
-
-        current_df = ops_obj.order_rows(
-            current_df, ["rating_avg"], type="dsc", limit=max_rows
-        )
-
-        st.markdown('<div class="app-card">', unsafe_allow_html=True)
-        st.markdown("##### Matching movies")
-        st.write(f"Showing up to **{max_rows}** movies matching the filters:")
-
-        st.dataframe(
-            to_rows(
-                current_df,
-                cols=["movieId", "title", "year", "rating_avg", "rating_count"],
-            )
-        )
-
-        st.caption(
-            "This view uses your **join**, **filter**, **groupby (avg & count)**, "
-            "**projection** and **order_rows** functions together."
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    # --- TAB 3: RATINGS ---
     with tab_ratings:
-        st.markdown(
-            '<p class="section-title">Top Rated Movies</p>',
-            unsafe_allow_html=True,
-        )
-
-        st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
-        min_count = st.slider(
-            "Minimum number of ratings",
-            min_value=5,
-            max_value=500,
-            value=100,
-            step=5,
-        )
-
-        top_n = st.slider(
-            "How many top movies to show",
-            min_value=10,
-            max_value=100,
-            value=25,
-            step=5,
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        gb_avg = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "avg")
-        gb_cnt = ops_obj.groupby(movies_ratings, ["movieId"], ["rating"], "count")
-
-        id_to_title = {}
-        id_to_year = {}
-        for i in range(dict_len(df_movies)):
-            mid = df_movies["movieId"][i]
-            id_to_title[mid] = df_movies["title"][i]
-            id_to_year[mid] = df_movies["year"][i]
-
-        top_df = {
-            "movieId": [],
-            "title": [],
-            "year": [],
-            "rating_avg": [],
-            "rating_count": [],
-        }
-
-        for i in range(len(gb_avg["movieId"])):
-            mid = gb_avg["movieId"][i]
-            avg_val = gb_avg["rating_avg"][i]
-            idx_cnt = gb_cnt["movieId"].index(mid)
-            cnt_val = gb_cnt["rating_count"][idx_cnt]
-            if cnt_val < min_count:
-                continue
-            title = id_to_title.get(mid, "Unknown")
-            year = id_to_year.get(mid, 0)
-            top_df["movieId"].append(mid)
-            top_df["title"].append(title)
-            top_df["year"].append(year)
-            top_df["rating_avg"].append(avg_val)
-            top_df["rating_count"].append(cnt_val)
-
-        top_df = ops_obj.order_rows(top_df, ["rating_avg"], type="dsc", limit=top_n)
-
-        st.markdown('<div class="app-card">', unsafe_allow_html=True)
-        st.dataframe(
-            to_rows(
-                top_df,
-                cols=["movieId", "title", "year", "rating_avg", "rating_count"],
+        if loader.ready("movies_ratings"):
+            ratings_tab(
+                ops_obj,
+                loader.get("movies"),
+                loader.get("movies_ratings"),
+                loader.get("movie_ids"),
+                loader.get("ratings_matrix"),
+                loader.get("ratings_cube") if loader.ready("ratings_cube") else None,
             )
-        )
-
-        st.caption(
-            "Above: pure use of your engine — no pandas. "
-            "We aggregate ratings per movie (avg + count), apply filters, then sort."
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            loading_notice("Ratings")
 
-    # --- TAB 4: TAGS ---
     with tab_tags:
-        st.markdown(
-            '<p class="section-title">Tag Explorer</p>',
-            unsafe_allow_html=True,
-        )
-
-        tag_stats = ops_obj.groupby(df_tags, ["tag"], ["movieId"], "count")
-        tag_pairs = list(zip(tag_stats["tag"], tag_stats["movieId_count"]))
-        tag_pairs.sort(key=lambda x: x[1], reverse=True)
-        popular_tags = [t for t, _ in tag_pairs[:100]]
-
-        st.markdown('<div class="app-card app-card--soft">', unsafe_allow_html=True)
-        selected_tag = st.selectbox("Choose a popular tag", options=popular_tags)
-        st.write(f"Showing movies tagged with **{selected_tag}**:")
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        filtered_tags = ops_obj.filter(df_tags, ["tag"], ["="], [selected_tag])
-        mt = ops_obj.join(df_movies, filtered_tags, ["movieId"], how="inner")
-        mtr = ops_obj.join(mt, df_ratings, ["movieId"], how="inner")
-        tag_avg = ops_obj.groupby(mtr, ["movieId"], ["rating"], "avg")
-        tag_cnt = ops_obj.groupby(mtr, ["movieId"], ["rating"], "count")
-
-        id_to_title = {}
-        id_to_year = {}
-        for i in range(dict_len(df_movies)):
-            mid = df_movies["movieId"][i]
-            id_to_title[mid] = df_movies["title"][i]
-            id_to_year[mid] = df_movies["year"][i]
-
-        final_df = {
-            "movieId": [],
-            "title": [],
-            "year": [],
-            "rating_avg": [],
-            "rating_count": [],
-        }
-
-        for i in range(len(tag_avg["movieId"])):
-            mid = tag_avg["movieId"][i]
-            avg_val = tag_avg["rating_avg"][i]
-            idx_cnt = tag_cnt["movieId"].index(mid)
-            cnt_val = tag_cnt["rating_count"][idx_cnt]
-            title = id_to_title.get(mid, "Unknown")
-            year = id_to_year.get(mid, 0)
-            final_df["movieId"].append(mid)
-            final_df["title"].append(title)
-            final_df["year"].append(year)
-            final_df["rating_avg"].append(avg_val)
-            final_df["rating_count"].append(cnt_val)
-
-        final_df = ops_obj.order_rows(
-            final_df, ["rating_avg"], type="dsc", limit=50
-        )
-
-        st.markdown('<div class="app-card">', unsafe_allow_html=True)
-        st.dataframe(
-            to_rows(
-                final_df,
-                cols=["movieId", "title", "year", "rating_avg", "rating_count"],
-            )
-        )
-
-        st.caption(
-            "This tab chains together your **filter**, **join**, and **groupby** "
-            "to let users explore the best movies for each tag."
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
+        if loader.ready("ratings", "tags"):
+            tags_tab(ops_obj, loader.get("movies"), loader.get("ratings"), loader.get("tags"), loader.get("movie_ids"))
+        else:
+            loading_notice("Tags")
 
-    # --- TAB 5: QUERY BUILDER ---
     with tab_query:
-        st.markdown(
-            '<p class="section-title">Manual Query Builder</p>',
-            unsafe_allow_html=True,
-        )
-        st.write(
-            "Build your own query by choosing the dataset and which functions "
-            "to apply: **joins**, **filter**, **group by / aggregation**, **projection**, and **sorting**."
-        )
-
-        # Step 0 -------------------------------------------------------------
-        st.markdown(
-            '<div class="step-chip"><span>0</span>Step 0 · Choose tables &amp; joins</div>',
-            unsafe_allow_html=True,
-        )
-
-        BASE_OPTIONS = ["Movies", "Ratings", "Tags"]
-
-        def get_df_and_suffix(name):
-            if name == "Movies":
-                return df_movies, "_movies"
-            if name == "Ratings":
-                return df_ratings, "_ratings"
-            if name == "Tags":
-                return df_tags, "_tags"
-            raise ValueError("Unknown table")
-
-        base_table = st.selectbox("Base table", BASE_OPTIONS, index=0)
-        remaining_after_base = [t for t in BASE_OPTIONS if t != base_table]
-
-        join1_enable = st.checkbox("Add first join", value=False)
-        join1_table = None
-        join1_type = None
-
-        if join1_enable:
-            join1_table = st.selectbox(
-                "Join 1 – table",
-                remaining_after_base,
-                key="join1_table",
+        if loader.ready("ratings", "tags"):
+            query_builder_tab(
+                ops_obj,
+                loader.get("movies"),
+                loader.get("ratings"),
+                loader.get("tags"),
+                loader.get("query_indexes") if loader.ready("query_indexes") else None,
+                loader.get("ratings_samples") if loader.ready("ratings_samples") else None,
             )
-            join1_type = st.selectbox(
-                "Join 1 – type",
-                ["inner", "left", "right", "full"],
-                index=0,
-                key="join1_type",
-            )
-
-        remaining_after_join1 = [
-            t for t in remaining_after_base if t != join1_table
-        ]
-
-        join2_enable = False
-        join2_table = None
-        join2_type = None
-        if join1_enable and remaining_after_join1:
-            join2_enable = st.checkbox("Add second join", value=False)
-            if join2_enable:
-                join2_table = remaining_after_join1[0]
-                st.write(f"Join 2 – table: **{join2_table}**")
-                join2_type = st.selectbox(
-                    "Join 2 – type",
-                    ["inner", "left", "right", "full"],
-                    index=0,
-                    key="join2_type",
-                )
-
-        ops_local = functions()
-        base_df_obj, base_suffix = get_df_and_suffix(base_table)
-        working_df = base_df_obj
-
-        if join1_enable and join1_table is not None:
-            right_df, right_suffix = get_df_and_suffix(join1_table)
-            working_df = ops_local.join(
-                working_df,
-                right_df,
-                ["movieId"],
-                how=join1_type,
-                left_suffix="",
-                right_suffix=right_suffix,
-            )
-
-        if join2_enable and join2_table is not None:
-            right_df2, right_suffix2 = get_df_and_suffix(join2_table)
-            working_df = ops_local.join(
-                working_df,
-                right_df2,
-                ["movieId"],
-                how=join2_type,
-                left_suffix="",
-                right_suffix=right_suffix2,
-            )
-
-        st.caption(
-            "Current dataset = "
-            + base_table
-            + (f" {join1_type} join {join1_table}" if join1_enable and join1_table else "")
-            + (f" {join2_type} join {join2_table}" if join2_enable and join2_table else "")
-        )
-
-        # Step 1 -------------------------------------------------------------
-        st.markdown(
-            '<div class="step-chip"><span>1</span>Step 1 · Filter rows (WHERE)</div>',
-            unsafe_allow_html=True,
-        )
-
-        apply_filter = st.checkbox("Apply filter", value=False)
-
-        columns = []
-        conditions = []
-        values = []
-        seps = []
-
-        if apply_filter:
-            cols_available = list(working_df.keys())
-            ops_list = ["=", "!=", ">", "<", ">=", "<="]
-
-            # how many filter rows to show (stored in session_state)
-            if "qb_num_conditions" not in st.session_state:
-                st.session_state.qb_num_conditions = 1
-
-            # buttons to add / reset filter rows
-            btn_col_add, btn_col_reset = st.columns([1, 1])
-            with btn_col_add:
-                if st.button("➕ Add condition", key="qb_add_cond"):
-                    st.session_state.qb_num_conditions += 1
-            with btn_col_reset:
-                if st.button("🧹 Reset conditions", key="qb_reset_cond"):
-                    st.session_state.qb_num_conditions = 1
-
-            # render each condition row
-            for i in range(st.session_state.qb_num_conditions):
-                c1, c2, c3, c4 = st.columns([3, 2, 3, 2])
-
-                with c1:
-                    col_name = st.selectbox(
-                        f"Column {i + 1}",
-                        options=cols_available,
-                        key=f"qb_f_col_{i}",
-                    )
-
-                with c2:
-                    op = st.selectbox(
-                        f"Condition {i + 1}",
-                        options=ops_list,
-                        key=f"qb_f_op_{i}",
-                    )
-
-                with c3:
-                    val_str = st.text_input(
-                        f"Value {i + 1}",
-                        key=f"qb_f_val_{i}",
-                    )
-
-                # first condition doesn't need a logical connector before it
-                if i == 0:
-                    sep = "and"
-                    with c4:
-                        st.markdown(
-                            "<div style='opacity:0.4; font-size:0.85rem; padding-top:1.1rem;'>First condition</div>",
-                            unsafe_allow_html=True,
-                        )
-                else:
-                    with c4:
-                        sep = st.selectbox(
-                            "Combine with",
-                            options=["and", "or"],
-                            key=f"qb_f_sep_{i}",
-                        )
-
-                # only add if user entered a value
-                if val_str.strip() != "":
-                    columns.append(col_name)
-                    conditions.append(op)
-                    values.append(parse_value(col_name, val_str))
-                    seps.append(sep)
-
-        # apply filter if we collected any conditions
-        if columns:
-            working_df = ops_local.filter(working_df, columns, conditions, values, seps)
-            working_df = engine_safe(working_df, "filter")
-            if working_df is None:
-                return  # stop query tab rendering here
-
-        # Step 2 -------------------------------------------------------------
-        st.markdown(
-            '<div class="step-chip"><span>2</span>Step 2 · Group by &amp; aggregation (optional)</div>',
-            unsafe_allow_html=True,
-        )
-
-        apply_group = st.checkbox("Apply aggregation", value=False)
-
-        if apply_group:
-            cols_after_filter = list(working_df.keys())
-            agg_mode = st.radio(
-                "Aggregation mode",
-                options=["Group by column(s)", "Global aggregation over entire dataset"],
-                horizontal=True,
-            )
-
-            if agg_mode == "Group by column(s)":
-                gb_col = st.selectbox(
-                    "Group by column", options=cols_after_filter, key="gb_col"
-                )
-                agg_candidates = [c for c in cols_after_filter if c != gb_col]
-                agg_col = st.selectbox(
-                    "Aggregation column", options=agg_candidates, key="agg_col"
-                )
-                agg_type = st.selectbox(
-                    "Aggregation type",
-                    options=["count", "sum", "avg", "min", "max"],
-                    key="agg_type",
-                )
-
-                working_df = ops_local.groupby(working_df, [gb_col], [agg_col], agg_type)
-                working_df = engine_safe(working_df, "groupby + aggregation")
-                if working_df is None:
-                    return
-            else:
-                cols_after_filter = list(working_df.keys())
-                agg_col = st.selectbox(
-                    "Aggregation column (entire dataset)",
-                    options=cols_after_filter,
-                    key="global_agg_col",
-                )
-                agg_type = st.selectbox(
-                    "Aggregation type (entire dataset)",
-                    options=["count", "sum", "avg", "min", "max"],
-                    key="global_agg_type",
-                )
-
-                tmp_df = {k: v[:] for k, v in working_df.items()}
-                tmp_df["_all"] = [1] * dict_len(working_df)
-
-                tmp_df = ops_local.groupby(tmp_df, ["_all"], [agg_col], agg_type)
-                tmp_df = engine_safe(tmp_df, "global aggregation")
-                if tmp_df is None:
-                    return
-
-                working_df = tmp_df
-
-        # Step 3 -------------------------------------------------------------
-        st.markdown(
-            '<div class="step-chip"><span>3</span>Step 3 · Projection &amp; sorting</div>',
-            unsafe_allow_html=True,
-        )
-
-        cols_for_show = list(working_df.keys())
-        show_cols = st.multiselect(
-            "Columns to display", options=cols_for_show, default=cols_for_show
-        )
-
-        sort_col = st.selectbox(
-            "Sort by (descending, uses order_rows)",
-            options=["(no sorting)"] + cols_for_show,
-        )
-
-        max_rows_query = st.slider(
-            "Max rows to display (query tab)",
-            min_value=10,
-            max_value=200,
-            value=50,
-            step=10,
-            key="qb_max_rows",
-        )
-
-        if sort_col != "(no sorting)":
-            working_df = ops_local.order_rows(
-                working_df, [sort_col], type="dsc", limit=max_rows_query
-            )
-
-        st.markdown("### Query result")
-        st.markdown('<div class="app-card">', unsafe_allow_html=True)
-        st.dataframe(to_rows(working_df, cols=show_cols, limit=max_rows_query))
-
-        st.caption(
-            "This tab is a **manual query builder**. Depending on your choices, it "
-            "chains together **joins** (inner / left / right / full between Movies, "
-            "Ratings, and Tags), **filter**, **groupby / global aggregation**, "
-            "**projection**, and **order_rows**."
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            loading_notice("Ratings and tags")
 
 
 if __name__ == "__main__":